@@ -1,8 +1,5 @@
 import os
-import threading
 import asyncio
-import queue
-import time
 from typing import cast
 from app_util import AppUtil
 from constants import Constants
@@ -15,12 +12,17 @@ from config import Config
 from prefs import Prefs
 from shared import Shared
 from text_segmenter import TextSegmenter
+from segment_size_controller import SegmentSizeController
 from text_massager import TextMassager
 from app_types import *
 from ui import Ui
 from util import Util
 from constants_long import ConstantsLong
 from audio_streamer import AudioStreamer
+from engine import EngineClient
+from metered_queue import MeteredQueue
+from ui_message_queue import UiMessageQueue
+from save_wav_util import SaveWavUtil
 
 class App:
     """
@@ -32,9 +34,8 @@ class App:
 
         AppUtil.init_logging()
 
-        self.stop_audio_event = threading.Event()
-        self.ui_queue = queue.Queue[UiMessage]()
-        self.tts_queue = queue.Queue[TtsItem]()
+        self.ui_queue = UiMessageQueue()
+        self.tts_queue = MeteredQueue[TtsItem]("tts", Constants.TTS_QUEUE_SIZE)
         
         error_message, warning_message = Config().init()
         if error_message:
@@ -44,12 +45,15 @@ class App:
         has_chat_completions_config = bool(Config().chat_completions_config)
         Prefs().init(self.ui_queue, has_chat_completions_config)
 
-        self.audio_streamer = AudioStreamer(
-            stop_event=self.stop_audio_event, 
-            tts_queue=self.tts_queue,
-            ui_queue=self.ui_queue,
-            completions_config=Config().orpheus_completions_config
-        ) 
+        self.audio_streamer: AudioStreamer | EngineClient
+        if Config().audio_engine == "process":
+            self.audio_streamer = EngineClient(tts_queue=self.tts_queue, ui_queue=self.ui_queue)
+        else:
+            self.audio_streamer = AudioStreamer(
+                tts_queue=self.tts_queue,
+                ui_queue=self.ui_queue,
+                completions_config=Config().orpheus_completions_config
+            )
 
         with open(Constants.SYSTEM_PROMPT_FILE_PATH, 'r') as f:
             system_prompt = f.read() # don't catch exception
@@ -59,12 +63,16 @@ class App:
         self.llm_streamer_manager = CompletionsManager(
             config=cast(CompletionsConfig, Config().chat_completions_config), 
             system_prompt=system_prompt, 
+            history_config=Config().chat_history_config,
             tts_queue=self.tts_queue,
             ui_queue=self.ui_queue
         )
 
         self.ui = Ui(self.on_enter)
 
+        # The text segment currently highlighted in sync with the audio playback
+        self.synced_text_item: SyncedTextItem | None = None
+
         self.update_title()
 
         self.print_stroke_flag: bool = False # because needs to be declared first
@@ -72,12 +80,13 @@ class App:
         self.print_stroke_flag: bool = True
 
         if warning_message:
-            warning_message = "[warning]" + warning_message
-            AppUtil.send_ui_message(self.ui_queue, LogUiMessage(warning_message))
+            for line in warning_message.split("\n"):
+                AppUtil.send_ui_message(self.ui_queue, LogUiMessage("[warning]" + line))
 
         def go():
-            AppUtil.import_decoder_with_feedback(self.ui_queue)
+            self.audio_streamer.init_decoder()
             AppUtil.ping_tts_server_with_feedback(Config().orpheus_completions_config, self.ui_queue) 
+            SaveWavUtil.remove_stale_partial_files()
         Util.run_in_thread(go, 0.5) # allows app to show UI before doing heavy load
 
     async def run(self):
@@ -93,6 +102,7 @@ class App:
             )
         finally:
             await self.stop_all()
+            await self.llm_streamer_manager.close()
 
     async def process_user_input(self, user_input: str) -> None:
 
@@ -194,6 +204,14 @@ class App:
                     except Exception as e:
                         feedback = f"Problem with output directory {Config().audio_save_dir}: {e}"
 
+            case "stats":
+                # Printed to the log panel, so playback doesn't need to stop
+                # Off the event loop, because in process mode this waits on a reply from the engine process
+                lines = await asyncio.to_thread(self.audio_streamer.get_stats_lines)
+                lines += self.ui.render_scheduler.get_stats_lines()
+                lines += SegmentSizeController().get_stats_lines()
+                self.print_to_log("[light]Stats:\n" + "\n".join(lines))
+
             case value if value in ["redraw", "r"]:
                 self.ui.application.renderer.clear()
                 self.ui.application.invalidate()
@@ -250,15 +268,22 @@ class App:
         self.print_full_message_to_content(user_input)
 
         await self.stop_all()
-        time.sleep(0.1) # TODO revisit need for this
+        tts_generation = self.tts_queue.generation
 
-        segments = TextSegmenter.segment_full_message(user_input) 
-        AppUtil.add_to_tts_queue(
-            tts_queue=self.tts_queue,
-            text_segments=segments, should_massage=False, voice_code=Prefs().voice_code, 
-            has_message_start=True
+        segments = TextSegmenter.segment_full_message(
+            user_input, Config().text_segmenter, Config().segmentation_config
         )
-        AppUtil.add_to_tts_queue_end_item(tts_queue=self.tts_queue)
+
+        def add_to_tts_queue():
+            AppUtil.add_to_tts_queue(
+                tts_queue=self.tts_queue,
+                text_segments=segments, should_massage=False, voice_code=Prefs().voice_code, 
+                has_message_start=True, generation=tts_generation
+            )
+            AppUtil.add_to_tts_queue_end_item(tts_queue=self.tts_queue, generation=tts_generation)
+
+        # The tts queue is bounded, so this can block for as long as generation is behind
+        await asyncio.to_thread(add_to_tts_queue)
 
     # ---
 
@@ -272,7 +297,7 @@ class App:
             self.print_full_message_to_content(f"[dark][STROKE]")
 
         self.ui.content_control.model.add_block(message)
-        self.ui.application.invalidate()
+        self.ui.render_scheduler.mark_dirty("content")
 
     def print_placeholder(self, text: str) -> None:
         placeholder_text = f"[dark+i]{text}"
@@ -281,13 +306,14 @@ class App:
 
     def print_to_log(self, message: str) -> None:
         self.ui.log_control.model.add_block(message)
-        self.ui.application.invalidate()
+        self.ui.render_scheduler.mark_dirty("log")
 
     def update_title(self) -> None:
         s = f"{Constants.APP_NAME} {Constants.VERSION} "
         s += "(chat mode)" if Prefs().ix_mode == "chat" else "(direct input mode)"
         s += f" (voice: {Prefs().voice_code})"
         self.ui.title_buffer.text = s
+        self.ui.render_scheduler.mark_dirty("title")
 
     def print_menu(self) -> None:
         s = ConstantsLong.MENU_TEXT
@@ -311,7 +337,7 @@ class App:
 
         WIDTH = 50 - 1
 
-        text, duration, elapsed, ttfb, is_finished = gen_status
+        text, duration, elapsed, ttfb, is_finished, _ = gen_status
 
         if not text: # Signifies idle
             output = ""
@@ -343,41 +369,62 @@ class App:
             value = MainControlParser.transform(output, 999, "dark")
             value = value[0]
             self.ui.gen_status_text = value
-
-        self.ui.application.invalidate() # TODO: expensive? avoidable?
-
+            self.ui.render_scheduler.mark_dirty("gen_status")
 
     async def stop_all(self) -> None:
         """
         Stops most all the various machinery gracefully.
         """
-        # Stop event will be cleared by the worker thread once acknowledged
-        # TODO  may cause problems while in transitory "is-stopping-audio" state
-        #       may need more logic (or just sleeping for half a second)
-        self.stop_audio_event.set()
-        
         self.llm_streamer_manager.abort()
-        self.audio_streamer.clear_queues()
+        self.audio_streamer.cancel()
         AppUtil.clear_queue(self.ui_queue)
-        Shared.synced_text_queue.clear()
+        # Cancelled generation doesn't report back, so clear its status here
+        self.print_gen_status(GenStatus.make_empty())
+        self.synced_text_item = None
         self.ui.content_control.model.clear_highlight()
+        self.ui.render_scheduler.mark_dirty("content")
 
     async def ui_message_queue_loop(self):
         """
-        Polls the ui message queue and updates the UI accordingly
+        Applies the ui messages to the UI: all pending messages get drained (coalesced) at once.
+        Redraws are left to the render scheduler.
+
+        Gets woken by producers putting messages, and otherwise ticks 
+        at the frame interval for the synced text highlight.
         """
+        loop = asyncio.get_running_loop()
+        wake_event = asyncio.Event()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(wake_event.set)
+
+        self.ui_queue.set_waker(wake)
+        
         while True:
             try:
-                ui_message = self.ui_queue.get(block=False) 
-
-                loop = asyncio.get_running_loop() 
-                loop.call_soon_threadsafe(self.print_ui_message, ui_message)
+                await asyncio.wait_for(wake_event.wait(), UI_FRAME_INTERVAL)
+            except TimeoutError:
+                pass
+            wake_event.clear()
 
-                self.ui_queue.task_done()
+            for ui_message in self.ui_queue.get_all():
+                self.print_ui_message(ui_message)
+            self.update_synced_text()
 
-            except queue.Empty:
-                # This is the one queue handler which should be the fastest loop
-                await asyncio.sleep(1/30)
+    def update_synced_text(self) -> None:
+        """
+        Highlights the text segment whose audio is currently being heard, if it has changed.
+        Clears the highlight once playback reaches the end of the message.
+        """
+        item = self.audio_streamer.get_synced_text_item()
+        if item is not None and item is not self.synced_text_item:
+            self.synced_text_item = item
+            if item.is_message_end:
+                # Full audio message has finished
+                self.ui.content_control.model.clear_highlight()
+            else:
+                self.ui.content_control.model.set_highlight(item.display_text)
+            self.ui.render_scheduler.mark_dirty("content")
 
     def print_ui_message(self, ui_message: UiMessage) -> None:
         """ 
@@ -392,28 +439,30 @@ class App:
                 self.ui.content_control.model.replace_last_block(ui_message.text)
             else:
                 self.ui.content_control.model.append_to_last_block(ui_message.text)
-        elif isinstance(ui_message, SyncedAudioUiMessage):
-            self.ui.content_control.model.set_highlight(ui_message.item.display_text)
+            self.ui.render_scheduler.mark_dirty("content")
         elif isinstance(ui_message, LogUiMessage):
             self.print_to_log(ui_message.text)
         elif isinstance(ui_message, GenStatusUiMessage):
+            if ui_message.item.is_finished:
+                SegmentSizeController().add_generation(
+                    ui_message.item.duration_seconds, ui_message.item.generation_seconds
+                )
             self.print_gen_status(ui_message.item)
         elif isinstance(ui_message, AudioBufferUiMessage):
+            is_underrun = ui_message.got_depleted and ui_message.is_message_pending
+            SegmentSizeController().add_buffer_status(ui_message.seconds, is_underrun)
             self.ui.update_audio_buffer_status(ui_message.seconds)
-            if ui_message.got_depleted:
-                if self.tts_queue.qsize() == 0:
-                    # Full audio message has finished
-                    self.ui.content_control.model.clear_highlight()
-                else:
-                    # Consider some UI feedback if buffer is depleted but more audio
-                    # for the current message is still pending. May need more robust
-                    # test than just getting here.
-                    pass
+            if is_underrun:
+                # Consider some UI feedback if buffer is depleted but more audio
+                # for the current message is still pending.
+                # (The end of a message is handled by `update_synced_text()`)
+                pass
         
     async def on_enter(self) -> None:
         async def go():
             user_input = self.ui.text_area.text
             self.ui.text_area.text = ""
+            self.ui.content_control.model.scroll_to_end()
             await self.process_user_input(user_input)
 
         loop = asyncio.get_running_loop() 
@@ -421,6 +470,9 @@ class App:
          
 # ---
 
+# Ticks at least this often, for the synced text highlight
+UI_FRAME_INTERVAL = 1 / 30
+
 if __name__ == "__main__":
     app = App()
     asyncio.run(app.run())
@@ -1,8 +1,7 @@
 from __future__ import annotations
 from typing import NamedTuple
-import numpy as np
-
 from util import Util
+from audio_file_writer import AudioFileWriter
 
 
 # Alias for a pt style-and-text tuple
@@ -28,10 +27,6 @@ class StreamedTextUiMessage(UiMessage):
     def __init__(self, text: str):
         self.text = text
 
-class SyncedAudioUiMessage(UiMessage):
-    def __init__(self, item: SyncedTextItem):
-        self.item = item
-
 class LogUiMessage(UiMessage):
     def __init__(self, text: str):
         self.text = text
@@ -41,11 +36,13 @@ class GenStatusUiMessage(UiMessage):
         self.item = item
 
 class AudioBufferUiMessage(UiMessage):
-    def __init__(self, seconds: float, got_depleted: bool):
+    def __init__(self, seconds: float, got_depleted: bool, is_message_pending: bool):
         self.seconds = seconds
         # Flag which is True the first time buffer reaches 0 
         # after having previously been greater than 0
         self.got_depleted = got_depleted
+        # True while more audio for the current message is still to come out of the pipeline
+        self.is_message_pending = is_message_pending
 
 # ---
 
@@ -93,8 +90,11 @@ class SyncedTextItem(NamedTuple):
     """ 
     A segment of text displayed in sync wth the audio playback 
     """
-    target_tick: int
+    # Absolute position in the audio buffer's sample stream at which the segment's audio starts
+    sample_position: int
     display_text: str
+    # Marks the end of a message's audio instead (with no display text)
+    is_message_end: bool = False
 
 
 class GenStatus(NamedTuple):
@@ -106,6 +106,8 @@ class GenStatus(NamedTuple):
     elapsed_seconds: float
     ttfb: float # so-called time-to-first-byte
     is_finished: bool
+    # Time spent actually generating, which leaves out waiting on a full audio buffer (backpressure)
+    generation_seconds: float = 0
 
     @staticmethod
     def make_empty() -> GenStatus:
@@ -113,7 +115,7 @@ class GenStatus(NamedTuple):
 
 class MessageAudio:
     """
-    Accumulates the audio data for an entire message.
+    Tracks the audio data for an entire message.
     """
     def __init__(self, text: str, voice_code: str, keeps_data: bool):
         
@@ -124,11 +126,12 @@ class MessageAudio:
         # The voice code used to generate the audio
         self.voice_code = voice_code
         
-        # When True, accumulates the audio data as it is generated
-        # in order to be saved to disk on message complete.
+        # When True, writes the audio data to disk as it is generated,
+        # to be saved under its final file name on message complete.
         self.keeps_data = keeps_data
 
-        self.blocks: list[np.ndarray] = []
+        # Set when keeps_data is True (see `SaveWavUtil.open_writer()`)
+        self.writer: AudioFileWriter | None = None
 
         # The length of the audio data, calculated independently of the data array itself.
         # Used for determining audio duration when keeps_data is False.
@@ -8,6 +8,7 @@ import requests
 from app_types import *
 from constants import Constants
 from l import L
+from metered_queue import MeteredQueue
 from completions_config import CompletionsConfig
 from orpheus_constants import OrpheusConstants
 from orpheus_gen_util import OrpheusGenUtil
@@ -63,13 +64,22 @@ class AppUtil:
         
     @staticmethod
     def add_to_tts_queue(
-            tts_queue: queue.Queue[TtsItem],
+            tts_queue: MeteredQueue[TtsItem],
             text_segments: list[str], voice_code: str, should_massage: bool, 
-            has_message_start: bool
+            has_message_start: bool,
+            generation: int | None = None,
+            display_segments: list[str] | None = None
     ) -> None:
-        
+        """
+        Blocks while the tts queue is full.
+        Pass the tts queue's generation from when the message started to have stale items dropped.
+        Pass `display_segments` when the displayed text of the segments differs from what gets spoken.
+        """
+
         for i, text_segment in enumerate(text_segments):
 
+            display_text = display_segments[i] if display_segments else text_segment
+
             voice = voice_code
             if voice_code == "random":
                 i = random.randrange(0, len(OrpheusConstants.STOCK_VOICES))
@@ -83,14 +93,14 @@ class AppUtil:
                 tts_text = text_segment
 
             item = TtsContentItem(
-                text = tts_text, raw_text=text_segment, voice=voice, is_message_start=is_message_start
+                text = tts_text, raw_text=display_text, voice=voice, is_message_start=is_message_start
             )
             # L.d(f"sending tts_item: [{text_segment}]")
-            tts_queue.put(item)
+            tts_queue.put(item, generation=generation)
 
     @staticmethod
-    def add_to_tts_queue_end_item(tts_queue: queue.Queue[TtsItem]) -> None: 
-        tts_queue.put(TtsEndItem())
+    def add_to_tts_queue_end_item(tts_queue: MeteredQueue[TtsItem], generation: int | None = None) -> None: 
+        tts_queue.put(TtsEndItem(), generation=generation)
 
     @staticmethod
     def make_empty_line() -> Line:
@@ -0,0 +1,209 @@
+from __future__ import annotations
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from l import L
+
+class AudioFileWriter:
+    """
+    Writes 16-bit audio to a file incrementally, so that the audio never needs to be held
+    in memory in its entirety.
+
+    Writing and encoding happen on a small shared worker pool rather than on the caller's thread.
+    Each writer drains its pending blocks in batches, one pool task at a time.
+    `write()` blocks only if too many blocks are pending.
+
+    Use `AudioFileWriter.make()` to create an instance by format name (see `FORMATS`).
+    """
+
+    # Format name to file extension
+    FORMATS = {
+        "wav": ".wav",
+        "flac": ".flac",
+        "opus": ".opus"
+    }
+
+    def __init__(self, file_path: str, samplerate: int, channels: int=1):
+        self.file_path = file_path
+        self.samplerate = samplerate
+        self.channels = channels
+
+        # Number of samples written so far
+        self.num_samples = 0
+        # Set on first error, after which data is ignored
+        self.error = ""
+
+        self._pending = deque[np.ndarray]()
+        self._pending_slots = threading.Semaphore(MAX_PENDING_BLOCKS)
+        self._lock = threading.Lock()
+        self._is_scheduled = False
+        self._is_closed = False
+        self._done_event = threading.Event()
+
+        try:
+            self._open()
+        except Exception as e:
+            self.error = f"Couldn't open file for writing: {e}"
+            self._is_closed = True
+            self._done_event.set()
+
+    @staticmethod
+    def make(format: str, file_path: str, samplerate: int, channels: int=1) -> AudioFileWriter:
+        match format:
+            case "flac":
+                return SoundfileWriter(file_path, samplerate, channels, sf_format="FLAC", sf_subtype="PCM_16")
+            case "opus":
+                return SoundfileWriter(file_path, samplerate, channels, sf_format="OGG", sf_subtype="OPUS")
+            case _:
+                return WavFileWriter(file_path, samplerate, channels)
+
+    def write(self, block: np.ndarray) -> None:
+        """ Queues a block of int16 samples to be appended to the file. """
+        if self._is_closed or self.error:
+            return
+        self._pending_slots.acquire()
+        with self._lock:
+            self._pending.append(block)
+            self._schedule()
+
+    def close(self) -> float | str:
+        """
+        Writes any pending data and closes the file. Blocks until done.
+        Returns duration in seconds on success, error message string on fail
+        """
+        with self._lock:
+            if not self._is_closed:
+                self._is_closed = True
+                self._schedule()
+        self._done_event.wait()
+        if self.error:
+            return self.error
+        return self.duration
+
+    @property
+    def duration(self) -> float:
+        """ Duration in seconds of the audio written so far """
+        return self.num_samples / (self.channels * self.samplerate)
+
+    def _schedule(self) -> None:
+        # Must hold lock
+        if not self._is_scheduled:
+            self._is_scheduled = True
+            _executor.submit(self._drain)
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                blocks = list(self._pending)
+                self._pending.clear()
+                if not blocks and not self._is_closed:
+                    self._is_scheduled = False
+                    return
+
+            if blocks:
+                self._write_blocks(blocks)
+                continue
+
+            # Closed, and nothing left to write
+            try:
+                self._finalize()
+            except Exception as e:
+                self.error = self.error or f"Error finalizing audio file: {e}"
+                L.e(self.error)
+            self._done_event.set()
+            return
+
+    def _write_blocks(self, blocks: list[np.ndarray]) -> None:
+        try:
+            if not self.error:
+                data = np.concatenate(blocks).astype(np.int16, copy=False)
+                self._write(data)
+                self.num_samples += data.size
+        except Exception as e:
+            self.error = f"Error writing audio file: {e}"
+            L.e(self.error)
+        finally:
+            for _ in blocks:
+                self._pending_slots.release()
+
+    def _open(self) -> None:
+        raise NotImplementedError()
+
+    def _write(self, data: np.ndarray) -> None:
+        raise NotImplementedError()
+
+    def _finalize(self) -> None:
+        raise NotImplementedError()
+
+class WavFileWriter(AudioFileWriter):
+    """
+    Writes 16-bit PCM WAV.
+    The RIFF header is written up front with placeholder sizes,
+    and gets patched with the actual sizes on close.
+    """
+
+    def _open(self) -> None:
+        self._file = open(self.file_path, "wb")
+        self._file.write(WavFileWriter.make_header(0, self.samplerate, self.channels))
+
+    def _write(self, data: np.ndarray) -> None:
+        self._file.write(data.tobytes())
+
+    def _finalize(self) -> None:
+        try:
+            if not self.error:
+                self._file.seek(0)
+                self._file.write(WavFileWriter.make_header(self.num_samples * BYTES_PER_SAMPLE, self.samplerate, self.channels))
+        finally:
+            self._file.close()
+
+    @staticmethod
+    def make_header(num_data_bytes: int, samplerate: int, channels: int) -> bytes:
+        """ 16-bit PCM WAV header, of `WAV_HEADER_BYTES` bytes """
+        block_align = channels * BYTES_PER_SAMPLE
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + num_data_bytes, b"WAVE",
+            b"fmt ", 16, 1, channels, samplerate, samplerate * block_align, block_align, BYTES_PER_SAMPLE * 8,
+            b"data", num_data_bytes
+        )
+
+class SoundfileWriter(AudioFileWriter):
+    """
+    Writes compressed formats (FLAC, Ogg Opus) using soundfile/libsndfile.
+    libsndfile does the encoding without holding the GIL.
+    """
+
+    def __init__(self, file_path: str, samplerate: int, channels: int, sf_format: str, sf_subtype: str):
+        self.sf_format = sf_format
+        self.sf_subtype = sf_subtype
+        super().__init__(file_path, samplerate, channels)
+
+    def _open(self) -> None:
+        import soundfile as sf
+        self._file = sf.SoundFile(
+            self.file_path, mode="w", samplerate=self.samplerate, channels=self.channels,
+            format=self.sf_format, subtype=self.sf_subtype
+        )
+
+    def _write(self, data: np.ndarray) -> None:
+        self._file.write(data)
+
+    def _finalize(self) -> None:
+        self._file.close()
+
+# ---
+
+BYTES_PER_SAMPLE = 2
+WAV_HEADER_BYTES = 44
+
+# Blocks waiting to be written before `write()` blocks (~10 seconds worth of 1024-sample blocks)
+MAX_PENDING_BLOCKS = 256
+
+# Size of the worker pool shared by all writers
+MAX_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="audio-file-writer")
@@ -0,0 +1,159 @@
+from __future__ import annotations
+import numpy as np
+
+from app_types import SyncedTextItem
+from metrics import QueueMetrics
+
+class AudioRing:
+    """
+    Single-producer, single-consumer ring of fixed-size int16 audio blocks.
+
+    Lives on a caller-provided buffer (eg, shared memory, so that another process can
+    observe the read and write positions), or else on its own memory.
+
+    Reading takes no locks and doesn't allocate, so it's fit for the realtime audio callback.
+    Counters only ever increase, and each is written by one side only:
+    the producer writes `write_count`, the consumer `read_count`.
+    `clear()` may be called from a third thread. It doesn't touch the consumer's counter,
+    but sets a flush point which the consumer skips ahead to on its next read.
+    """
+
+    def __init__(self, name: str, num_blocks: int, blocksize: int, buffer=None):
+        self.num_blocks = num_blocks
+        self.blocksize = blocksize
+        if buffer is None:
+            buffer = bytearray(AudioRing.get_size_bytes(num_blocks, blocksize))
+        self._header = np.ndarray((NUM_HEADER_FIELDS,), dtype=np.int64, buffer=buffer, offset=0)
+        self._data = np.ndarray((num_blocks, blocksize), dtype=np.int16, buffer=buffer, offset=HEADER_BYTES)
+        self.metrics = QueueMetrics(name, num_blocks)
+
+    @staticmethod
+    def get_size_bytes(num_blocks: int, blocksize: int) -> int:
+        return HEADER_BYTES + num_blocks * blocksize * 2
+
+    @property
+    def write_count(self) -> int:
+        """ Total number of blocks written """
+        return int(self._header[WRITE_COUNT])
+
+    @property
+    def output_latency(self) -> float:
+        """ Latency in seconds of the consumer's output, beyond the ring, as last reported by the consumer's side """
+        return int(self._header[LATENCY_US]) / 1_000_000
+
+    @output_latency.setter
+    def output_latency(self, seconds: float) -> None:
+        self._header[LATENCY_US] = int(seconds * 1_000_000)
+
+    @property
+    def read_count(self) -> int:
+        """ Total number of blocks consumed (played or flushed) """
+        return max(int(self._header[READ_COUNT]), int(self._header[FLUSH_COUNT]))
+
+    def qsize(self) -> int:
+        return max(self.write_count - self.read_count, 0)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        return self.qsize() >= self.num_blocks
+
+    def write(self, block: np.ndarray) -> bool:
+        """ Producer only. Returns False if full. Blocks shorter than the blocksize get zero-padded. """
+        write_count = self.write_count
+        if write_count - self.read_count >= self.num_blocks:
+            return False
+        slot = self._data[write_count % self.num_blocks]
+        size = min(block.size, self.blocksize)
+        slot[:size] = block[:size]
+        slot[size:] = 0
+        # Publish only once the data is in place
+        self._header[WRITE_COUNT] = write_count + 1
+        self.metrics.add_put(self.qsize())
+        return True
+
+    def read_into(self, out: np.ndarray) -> bool:
+        """ Consumer only. Copies the next block into `out`. Returns False if empty. """
+        read_count = self.read_count
+        if read_count >= self.write_count:
+            return False
+        out[:] = self._data[read_count % self.num_blocks]
+        self._header[READ_COUNT] = read_count + 1
+        return True
+
+    def clear(self) -> None:
+        """ Drops all unread blocks """
+        write_count = self.write_count
+        self.metrics.add_dropped(max(write_count - self.read_count, 0))
+        self._header[FLUSH_COUNT] = write_count
+
+    def __str__(self) -> str:
+        return self.metrics.to_string(self.qsize())
+
+class SyncEventRing:
+    """
+    Single-producer, single-consumer ring of `SyncedTextItem`s,
+    for passing playback timeline entries from the engine process to the UI process.
+
+    Each entry is tagged with the producer's cancel generation, so that the consumer
+    can ignore entries from before a cancel. Display text longer than the slot gets truncated.
+    """
+
+    def __init__(self, num_slots: int, buffer=None):
+        self.num_slots = num_slots
+        if buffer is None:
+            buffer = bytearray(SyncEventRing.get_size_bytes(num_slots))
+        self._header = np.ndarray((NUM_HEADER_FIELDS,), dtype=np.int64, buffer=buffer, offset=0)
+        # Per slot: generation, sample position, text length, is message end
+        self._fields = np.ndarray((num_slots, NUM_SLOT_FIELDS), dtype=np.int64, buffer=buffer, offset=HEADER_BYTES)
+        self._texts = np.ndarray(
+            (num_slots, SYNC_TEXT_BYTES), dtype=np.uint8, buffer=buffer,
+            offset=HEADER_BYTES + num_slots * NUM_SLOT_FIELDS * 8
+        )
+        self.num_dropped = 0
+
+    @staticmethod
+    def get_size_bytes(num_slots: int) -> int:
+        return HEADER_BYTES + num_slots * (NUM_SLOT_FIELDS * 8 + SYNC_TEXT_BYTES)
+
+    def write(self, generation: int, item: SyncedTextItem) -> bool:
+        """ Producer only. Returns False (and drops the item) if full. """
+        write_count = int(self._header[WRITE_COUNT])
+        if write_count - int(self._header[READ_COUNT]) >= self.num_slots:
+            self.num_dropped += 1
+            return False
+        slot = write_count % self.num_slots
+        text_bytes = item.display_text.encode("utf-8")[:SYNC_TEXT_BYTES]
+        self._texts[slot, :len(text_bytes)] = np.frombuffer(text_bytes, dtype=np.uint8)
+        self._fields[slot] = (generation, item.sample_position, len(text_bytes), item.is_message_end)
+        self._header[WRITE_COUNT] = write_count + 1
+        return True
+
+    def read_all(self) -> list[tuple[int, SyncedTextItem]]:
+        """ Consumer only. Returns the unread (generation, item) tuples. """
+        result = []
+        read_count = int(self._header[READ_COUNT])
+        write_count = int(self._header[WRITE_COUNT])
+        while read_count < write_count:
+            slot = read_count % self.num_slots
+            generation, sample_position, text_length, is_message_end = (int(value) for value in self._fields[slot])
+            text = self._texts[slot, :text_length].tobytes().decode("utf-8", errors="ignore")
+            result.append((generation, SyncedTextItem(sample_position, text, bool(is_message_end))))
+            read_count += 1
+        self._header[READ_COUNT] = read_count
+        return result
+
+# ---
+
+# Header of int64 fields
+WRITE_COUNT = 0
+READ_COUNT = 1
+FLUSH_COUNT = 2
+LATENCY_US = 3
+NUM_HEADER_FIELDS = 4
+HEADER_BYTES = NUM_HEADER_FIELDS * 8
+
+NUM_SLOT_FIELDS = 4
+
+SYNC_TEXT_BYTES = 1024
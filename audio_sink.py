@@ -0,0 +1,246 @@
+from __future__ import annotations
+import io
+import os
+import threading
+import time
+from typing import Any, Callable, NamedTuple
+import numpy as np
+
+from audio_file_writer import WAV_HEADER_BYTES, WavFileWriter
+from l import L
+
+# sounddevice-style callback: (outdata, num_frames, time, status)
+SinkCallback = Callable[[np.ndarray, int, Any, Any], None]
+
+class AudioSinkStatus(NamedTuple):
+    """ Stand-in for sounddevice's CallbackFlags, for the non-device sinks """
+    output_underflow: bool = False
+
+class AudioSink:
+    """
+    An audio output which pulls fixed-size blocks of audio
+    by invoking a sounddevice-style callback.
+
+    Use `AudioSink.make()` to create an instance by type name:
+
+    - "device": The sound device, via sounddevice/PortAudio (default)
+    - "null": No output, but consumes audio at real-time rate, simulating playback
+    - "free": No output, consumes audio as fast as it becomes available
+    - "file": Like "free", but writes the consumed audio to a WAV file
+    """
+
+    TYPES = ["device", "null", "free", "file"]
+
+    def __init__(
+            self,
+            callback: SinkCallback,
+            has_data: Callable[[], bool],
+            samplerate: int,
+            blocksize: int,
+            channels: int,
+            dtype: str
+    ):
+        self.callback = callback
+        self.has_data = has_data
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.dtype = dtype
+        self._closed = True
+
+    @staticmethod
+    def make(
+            sink_type: str,
+            callback: SinkCallback,
+            has_data: Callable[[], bool],
+            samplerate: int,
+            blocksize: int,
+            channels: int,
+            dtype: str,
+            file_path: str = ""
+    ) -> AudioSink:
+        """
+        :param has_data:
+            Returns True if there is pending audio data. Lets the non-realtime sinks idle.
+        """
+        args = (callback, has_data, samplerate, blocksize, channels, dtype)
+        match sink_type:
+            case "null":
+                return ClockedNullSink(*args)
+            case "free":
+                return FreeRunningSink(*args)
+            case "file":
+                return FileSink(*args, file_path=file_path)
+            case _:
+                return DeviceSink(*args)
+
+    def start(self) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def latency(self) -> float:
+        """ Output latency in seconds, beyond the buffered audio """
+        return 0.0
+
+    def __str__(self) -> str:
+        return self.__class__.__name__
+
+class DeviceSink(AudioSink):
+    """ Plays to the default sound device """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.stream = None
+
+    def start(self) -> None:
+        # Imported here so that the other sinks work on machines without PortAudio
+        import sounddevice as sd
+        self.stream = sd.OutputStream(
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            channels=self.channels,
+            dtype=self.dtype,
+            callback=self.callback,
+            latency="low",
+            finished_callback=lambda: None
+        )
+        self.stream.start()
+        self._closed = False
+
+    def close(self) -> None:
+        self._closed = True
+        if self.stream:
+            stream = self.stream
+            self.stream = None
+            if not stream.stopped:
+                stream.stop()
+            stream.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed or not self.stream or self.stream.closed
+
+    @property
+    def latency(self) -> float:
+        return float(self.stream.latency) if self.stream else 0.0 # type: ignore
+
+class _ThreadedSink(AudioSink):
+    """ Base class for sinks which invoke the callback from their own thread """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.outdata = np.zeros((self.blocksize, self.channels), dtype=self.dtype)
+        self.block_duration = self.blocksize / self.samplerate
+        self.thread: threading.Thread | None = None
+        self.status = AudioSinkStatus()
+
+    def start(self) -> None:
+        self._closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self._closed = True
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        self.thread = None
+
+    def _run(self) -> None:
+        raise NotImplementedError()
+
+    def _pull(self) -> None:
+        self.callback(self.outdata, self.blocksize, None, self.status)
+
+class ClockedNullSink(_ThreadedSink):
+    """ Discards the audio, but pulls it at the real-time rate like a sound device would """
+
+    def _run(self) -> None:
+        # Schedules against absolute deadlines so that timing errors don't accumulate
+        next_time = time.perf_counter()
+        while not self._closed:
+            self._pull()
+            next_time += self.block_duration
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.block_duration:
+                # Fell behind (eg, process was suspended); don't try to catch up
+                next_time = time.perf_counter()
+
+class FreeRunningSink(_ThreadedSink):
+    """ Discards the audio, pulling it as fast as it becomes available """
+
+    def _run(self) -> None:
+        is_idle = True
+        while not self._closed:
+            if self.has_data():
+                is_idle = False
+                self._pull()
+                self._on_block(self.outdata)
+            else:
+                if not is_idle:
+                    # Pulls once more when the buffer runs empty, so the callback sees it
+                    # (like a sound device's callback would), eg for the stop-to-silence measurement
+                    is_idle = True
+                    self._pull()
+                    # (Unless audio arrived in the meantime, the callback filled in silence)
+                    if self.outdata.any():
+                        self._on_block(self.outdata)
+                time.sleep(IDLE_SLEEP_SECONDS)
+
+    def _on_block(self, block: np.ndarray) -> None:
+        pass
+
+class FileSink(FreeRunningSink):
+    """ 
+    Writes the audio to a 16-bit WAV file, as fast as it becomes available.
+
+    The file gets overwritten by the first sink of the process, and appended to by any later ones
+    (a sink reset replaces the sink instance). The header's sizes get updated on close.
+    """
+
+    # Files started by this process
+    _started_paths: set[str] = set()
+
+    def __init__(self, *args, file_path: str):
+        super().__init__(*args)
+        self.file_path = file_path
+        self.file: io.BufferedRandom | None = None
+
+    def start(self) -> None:
+        if self.file_path in FileSink._started_paths and os.path.exists(self.file_path):
+            self.file = open(self.file_path, "r+b")
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(self.file_path, "w+b")
+            self.file.write(WavFileWriter.make_header(0, self.samplerate, self.channels))
+            FileSink._started_paths.add(self.file_path)
+        L.i(f"File sink: {self.file_path}")
+        super().start()
+
+    def close(self) -> None:
+        super().close()
+        if self.file:
+            file = self.file
+            self.file = None
+            try:
+                num_data_bytes = file.seek(0, os.SEEK_END) - WAV_HEADER_BYTES
+                file.seek(0)
+                file.write(WavFileWriter.make_header(num_data_bytes, self.samplerate, self.channels))
+            finally:
+                file.close()
+
+    def _on_block(self, block: np.ndarray) -> None:
+        if self.file:
+            self.file.write(block.tobytes())
+
+# ---
+
+IDLE_SLEEP_SECONDS = 0.002
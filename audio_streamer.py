@@ -1,326 +1,492 @@
-from typing import Generator, cast
-import sounddevice as sd
+from typing import Callable, cast
 import numpy as np
 import queue
+import threading
 import time
-from threading import Thread
 from app_types import *
+from audio_sink import AudioSink
 from l import L
+from audio_ring import AudioRing, SyncEventRing
+from metered_queue import MeteredQueue
+from metrics import LatencyMetrics
 from completions_config import CompletionsConfig
 from orpheus_constants import OrpheusConstants
-from orpheus_gen import OrpheusGen
-import queue
-import threading
+from orpheus_gen import GenJob, OrpheusGen
 from app_util import AppUtil
+from config import Config
 from prefs import Prefs
 from save_wav_util import SaveWavUtil
-from shared import Shared
+from playback_timeline import PlaybackTimeline
+from silence_trimmer import SilenceTrimmer
 
 class AudioStreamer:
     """
-    Manages streaming to the audio device, 
-    Uses OrpheusGen to generate the audio.
-    Uses own thread.
+    Manages streaming to the audio device (or other `AudioSink`, per config),
+    Uses OrpheusGen's pipeline to generate the audio.
+    Uses own thread to feed the pipeline, which calls back with the generated audio.
 
     """
 
     def __init__(
             self, 
-            stop_event: threading.Event, 
-            tts_queue: queue.Queue[TtsItem],
+            tts_queue: MeteredQueue[TtsItem],
             ui_queue: queue.Queue[UiMessage],
-            completions_config: CompletionsConfig
+            completions_config: CompletionsConfig,
+            audio_ring: AudioRing | None = None,
+            sync_ring: SyncEventRing | None = None,
+            should_save_audio: Callable[[], bool] | None = None
     ):
-        self.stop_event = stop_event
+        """
+        :param audio_ring:
+            The audio buffer. Made here if not provided (the engine process provides one in shared memory).
+        :param sync_ring:
+            If provided, playback timeline entries also get written to it (for the UI process).
+        :param should_save_audio:
+            Whether to save the audio of a new message to disk. Defaults to the `Prefs` value.
+        """
         self.ui_queue = ui_queue
         self.tts_queue = tts_queue
         self.orpheus_completions_config = completions_config
-        self.stream: sd.OutputStream | None = None 
+        self.sync_ring = sync_ring
+        self.should_save_audio = should_save_audio or (lambda: Prefs().save_audio_to_disk)
+        self.sink: AudioSink | None = None 
+
+        # Incremented on every cancel (or set by the engine client), and used to tag sync ring entries
+        self.generation = 0
         
+        # State of the message and segment being fed to the audio buffer (sink thread only)
+        self.message_audio: MessageAudio | None = None
+        self.trimmer: SilenceTrimmer | None = None
+        self.internal_buffer = np.array([], dtype=DTYPE_STR)
+        self.is_first_block = True
+
         self.orpheus_gen = OrpheusGen(
-            stop_event=self.stop_event, 
             ui_queue=self.ui_queue, 
-            get_audio_queue_size=self.get_audio_queue_size,
             request_config=self.orpheus_completions_config, 
+            on_job_start=self.on_gen_job_start,
+            on_audio=self.on_gen_audio,
+            on_job_end=self.on_gen_job_end,
+            on_cancel=self.on_gen_cancel
         )
 
-        # Audio buffer data queue, which gets fed to the sound device
-        self.audio_buffer_queue = queue.Queue[np.ndarray](maxsize=MAX_AUDIO_QUEUE_SIZE)
+        # Audio buffer, which gets fed to the sound device.
+        # When full, the pipeline's sink stage waits, which in turn throttles the upstream stages
+        self.audio_ring = audio_ring or AudioRing("audio buffer", AudioStreamer.get_num_buffer_blocks(), BLOCKSIZE)
+
+        # Text segments by their position in the audio buffer's sample stream
+        self.timeline = PlaybackTimeline()
 
-        # Queue to signal stream reset requests from the callback thread
-        self.reset_request_queue = queue.Queue(maxsize=1)
+        # Guards writes to the audio buffer against it getting cleared concurrently
+        self.buffer_lock = threading.RLock()
 
-        self.last_buffer_message_time: float = 0
-        self.last_buffer_message_value: float = 0
-        self.last_queue_size: int = 0
+        # Counters updated by the audio callback, read by the status sampler thread
+        self.num_underflows: int = 0
+        self.num_empty_callbacks: int = 0
+        self.num_size_mismatches: int = 0
+        self.num_callback_errors: int = 0
 
-        # Stream is initialized lazily now
-        # self.init_sd_stream() # Removed from here
+        # Stop-to-silence measurement: `cancel()` sets the pending flag,
+        # and the audio callback records the time of the first silent block after it
+        self.is_silence_pending = False
+        self.cancel_time: float = 0
+        self.silence_time: float = 0
+        self.stop_latency_metrics = LatencyMetrics("stop to silence")
 
         # Immediately start the worker thread
-        thread = Thread(target=self.tts_queue_loop, daemon=True)
+        thread = threading.Thread(target=self.tts_queue_loop, daemon=True)
         thread.start()
 
-    def init_sd_stream(self) -> None:
+        thread = threading.Thread(target=self.status_sampler_loop, daemon=True)
+        thread.start()
+
+    def init_sink(self) -> None:
+        sink = AudioSink.make(
+            sink_type=Config().audio_sink_type,
+            callback=self.sounddevice_callback,
+            has_data=lambda: not self.audio_ring.empty(),
+            samplerate=OrpheusConstants.SAMPLERATE,
+            blocksize=BLOCKSIZE,
+            channels=CHANNELS,
+            dtype=DTYPE_STR,
+            file_path=Config().audio_sink_file_path
+        )
         try:
-            self.stream = sd.OutputStream(
-                samplerate=OrpheusConstants.SAMPLERATE,
-                blocksize=BLOCKSIZE,
-                channels=CHANNELS,
-                dtype=DTYPE_STR,
-                callback=self.sounddevice_callback,
-                latency="low",
-                finished_callback=lambda: None
-            )
-            self.stream.start()
-            L.d("Audio stream started.")
+            sink.start()
+            self.sink = sink
+            L.d(f"Audio sink started: {sink}")
 
-        except (sd.PortAudioError, Exception) as e:
-            self.stream = None 
-            s = f"Error initializing sounddevice stream: {e}. Audio output will be disabled."
+        except Exception as e:
+            self.sink = None 
+            s = f"Error initializing audio output ({sink}): {e}. Audio output will be disabled."
             L.e(s)
             AppUtil.send_ui_message(self.ui_queue, LogUiMessage(f"[error]{s}"))
 
-    def reset_sd_stream(self):
-        """Closes the current stream, clears buffer, and initializes a new one."""
-        L.i("Resetting audio stream...")
-        self.close_sd_stream() # Close existing stream first
-        AppUtil.clear_queue(self.audio_buffer_queue) # Clear potentially stale buffer data
-        self.init_sd_stream() # Initialize a new stream
-        L.i("Audio stream reset complete.")
-
-    def close_sd_stream(self):
-        """Stops and closes the audio stream."""
-        if self.stream:
+    def reset_sink(self):
+        """Closes the current sink, clears buffer, and initializes a new one."""
+        L.i("Resetting audio sink...")
+        self.close_sink() # Close existing sink first
+        self.clear_audio_buffer() # Clear potentially stale buffer data
+        self.init_sink() # Initialize a new sink
+        L.i("Audio sink reset complete.")
+
+    def close_sink(self):
+        """Stops and closes the audio sink."""
+        if self.sink:
             try:
-                if not self.stream.stopped:
-                    self.stream.stop()
-                self.stream.close()
-                L.i("Audio stream stopped and closed.")
+                self.sink.close()
+                L.i("Audio sink stopped and closed.")
             except Exception as e:
-                L.e(f"Error closing audio stream: {e}")
-            self.stream = None
+                L.e(f"Error closing audio sink: {e}")
+            self.sink = None
 
-    def clear_queues(self) -> None:
+    def cancel(self, generation: int | None = None, request_time: float = 0) -> None:
         """
-        Effectively stops the currently playing audio and clears pending tasks and buffers.
-        Should be called after the stop_event has been set, and before it has been reset.
+        Stops the currently playing audio at once, and drops pending tasks and buffers.
+        Does not block on the generation pipeline.
+
+        :param generation:
+            New value for `generation` (else gets incremented)
+        :param request_time:
+            Wall clock time at which the stop was requested, if earlier than now 
+            (eg, in another process). Counts towards the stop-to-silence measurement.
         """
-        AppUtil.clear_queue(self.tts_queue)
-        AppUtil.clear_queue(self.audio_buffer_queue)
+        if not self.audio_ring.empty():
+            delay = max(time.time() - request_time, 0) if request_time else 0
+            self.cancel_time = time.perf_counter() - delay
+            self.is_silence_pending = True
+        self.orpheus_gen.cancel()
+        self.tts_queue.clear()
+        with self.buffer_lock:
+            self.generation = generation if generation is not None else self.generation + 1
+            self.clear_audio_buffer()
+
+    def clear_audio_buffer(self) -> None:
+        with self.buffer_lock:
+            # Discarded audio counts as consumed, so the write position and the play position 
+            # line up again, as far as the timeline is concerned
+            self.audio_ring.clear()
+            self.timeline.clear()
+
+    @property
+    def written_samples(self) -> int:
+        """ Absolute sample count of the audio buffer's input """
+        return self.audio_ring.write_count * BLOCKSIZE
+
+    @property
+    def played_samples(self) -> int:
+        """ Absolute sample count of the audio buffer's output (including discarded audio) """
+        return self.audio_ring.read_count * BLOCKSIZE
+
+    def on_gen_job_start(self, job: GenJob) -> None:
+        """ Pipeline callback (sink thread) """
+        if not isinstance(job.item, TtsContentItem):
+            return
+        tts_content_item = job.item
+
+        # Init or update message_audio object
+        if tts_content_item.is_message_start:
+            if self.message_audio:
+                L.w("MessageDataitem already exists, check logic")
+                SaveWavUtil.discard_writer(self.message_audio)
+            self.message_audio = MessageAudio(
+                text=tts_content_item.raw_text, 
+                voice_code=tts_content_item.voice,
+                keeps_data=self.should_save_audio()
+            )
+            if self.message_audio.keeps_data:
+                SaveWavUtil.open_writer(self.message_audio)
+        elif self.message_audio:
+            self.message_audio.text += tts_content_item.raw_text
+
+        # Handle empty text (because of stripped characters, etc)
+        if not tts_content_item.text:
+            # Just schedule the display text
+            L.d(f"Skipping empty tts text item. Originally: {tts_content_item.raw_text}")
+            with self.buffer_lock:
+                if not self.orpheus_gen.is_stale(job):
+                    self.add_synced_text(tts_content_item.raw_text)
+            return
 
-    def queue_feeder(
-            self, 
-            audio_gen: Generator, 
-            stop_event: threading.Event,
-            message_audio: MessageAudio | None
-        ) -> None:
+        # Init sink on first real message
+        if not self.sink:
+            L.d("First TTS item received, initializing audio sink")
+            self.init_sink()
+
+        self.trimmer = SilenceTrimmer(Config().silence_trim_config)
+        self.internal_buffer = np.array([], dtype=DTYPE_STR)
+        self.is_first_block = True
+
+    def on_gen_audio(self, job: GenJob, audio_chunk: np.ndarray) -> None:
+        """ Pipeline callback (sink thread) """
+        if not self.trimmer or audio_chunk.size == 0:
+            return
+        self.feed_audio(job, self.trimmer.process(audio_chunk))
+
+    def on_gen_job_end(self, job: GenJob) -> None:
+        """ Pipeline callback (sink thread) """
+        if isinstance(job.item, TtsEndItem):
+            # Lets the UI tell when playback has reached the end of the message
+            with self.buffer_lock:
+                if not self.orpheus_gen.is_stale(job):
+                    self.add_synced_text("", is_message_end=True)
+            self.on_message_end()
+            return
+
+        if self.trimmer:
+            # Trailing audio held back by the trimmer
+            self.feed_audio(job, self.trimmer.flush())
+            if self.trimmer.num_samples_in:
+                trimmed = (self.trimmer.num_samples_in - self.trimmer.num_samples_out) / OrpheusConstants.SAMPLERATE
+                L.d(f"trimmed {trimmed:.2f}s of silence")
+            self.trimmer = None
+
+    def on_gen_cancel(self) -> None:
+        """ Pipeline callback (sink thread) """
+        self.trimmer = None
+        self.internal_buffer = np.array([], dtype=DTYPE_STR)
+        if self.message_audio and self.message_audio.writer:
+            if self.message_audio.total_size:
+                L.i("Saving audio file on stop")
+                SaveWavUtil.save_with_ui_feedback(self.message_audio, True, self.ui_queue)
+            else:
+                SaveWavUtil.discard_writer(self.message_audio)
+        self.message_audio = None
+
+    def on_message_end(self) -> None:
+        if not self.message_audio:
+            return
+        duration = self.message_audio.total_size / OrpheusConstants.SAMPLERATE
+        if self.message_audio.writer and self.message_audio.total_size:
+            SaveWavUtil.save_with_ui_feedback(self.message_audio, False, self.ui_queue)
+        else:
+            SaveWavUtil.discard_writer(self.message_audio)
+            s = f"Generation complete (audio length: {duration:.1f}s)"
+            AppUtil.send_ui_message(self.ui_queue, LogUiMessage(s))
+        self.message_audio = None
+
+    def feed_audio(self, job: GenJob, audio_chunk: np.ndarray) -> None:
         """
-        Feeds the audio queue with fixed-size blocks from the audio generator.
-        Checks stop_event to allow interruption.
+        Feeds the audio queue with fixed-size blocks of the segment's audio.
+        Adds the segment's display text to the playback timeline along with its first block.
         """
-        internal_buffer = np.array([], dtype=DTYPE_STR)
-        try:
-            for audio_chunk in audio_gen:
-                
-                # First check stop event 
-                if stop_event.is_set():
-                    break
-
-                if not isinstance(audio_chunk, np.ndarray) or audio_chunk.size == 0:
-                    L.w(f"invalid audio chunk {audio_chunk}")
-                    continue
+        if audio_chunk.size == 0:
+            return
+        self.internal_buffer = np.concatenate((self.internal_buffer, audio_chunk))
+        message_audio = self.message_audio
 
-                if audio_chunk.dtype != DTYPE_STR:
-                    try:
-                        audio_chunk = audio_chunk.astype(DTYPE_STR)
-                    except Exception as e:
-                        L.w(f"couldn't convert audio chunk, skipping: {e}")
-                        continue
+        while len(self.internal_buffer) >= BLOCKSIZE:
+            if self.orpheus_gen.is_stale(job):
+                break
 
-                internal_buffer = np.concatenate((internal_buffer, audio_chunk))
+            block_to_queue = self.internal_buffer[:BLOCKSIZE]
+            self.internal_buffer = self.internal_buffer[BLOCKSIZE:]
 
-                while len(internal_buffer) >= BLOCKSIZE:
-                    # Check stop event before queueing each block
-                    if stop_event and stop_event.is_set():
-                        break # Exit the block queueing loop
+            try:
 
-                    block_to_queue = internal_buffer[:BLOCKSIZE]
-                    internal_buffer = internal_buffer[BLOCKSIZE:]
+                if message_audio:
+                    message_audio.total_size += block_to_queue.size
+                    if message_audio.writer:
+                        message_audio.writer.write(block_to_queue)
 
-                    try:
+                display_text = None
+                if self.is_first_block:
+                    self.is_first_block = False
+                    display_text = cast(TtsContentItem, job.item).raw_text
 
-                        if message_audio:
-                            message_audio.total_size += block_to_queue.size
-                            if message_audio.keeps_data:
-                                message_audio.blocks.append(block_to_queue)
+                if not self.put_block(job, block_to_queue, display_text):
+                    break
 
-                        self.audio_buffer_queue.put(block_to_queue, block=True, timeout=0.1)
+            except Exception as e:
+                L.e(f"Couldn't add to audio queue: {e}")
+                break
 
-                    except queue.Full:
-                        L.w(f"Audio queue full")
-                    except Exception as e:
-                        L.e(f"Couldn't add to audio queue: {e}")
-                        break
+    def put_block(self, job: GenJob, block: np.ndarray, display_text: str | None) -> bool:
+        """
+        Adds a block to the audio buffer, along with its timeline entry if any.
+        
+        While the buffer is full, waits until the sink makes room or the job gets cancelled.
+        This is the pipeline's backpressure: the sink stage stops taking audio, 
+        and the upstream stages fill up and stop reading the response stream.
+        The block only gets dropped if there's no sink to play it.
 
-        except StopIteration:
-            # Normal behavior
-            pass
+        Returns False if the job got cancelled.
+        """
+        wait_start_time = 0.0
+        while True:
+            with self.buffer_lock:
+                if self.orpheus_gen.is_stale(job):
+                    return False
+                # (This is the only producer, so the buffer can't become full in the meantime)
+                if not self.audio_ring.full():
+                    if display_text is not None:
+                        self.add_synced_text(display_text)
+                    self.audio_ring.write(block)
+                    break
+            if not self.sink or self.sink.closed:
+                self.audio_ring.metrics.add_dropped()
+                return True
+            if not wait_start_time:
+                wait_start_time = time.perf_counter()
+            # The buffer frees up at one block per callback. Cancellation wakes this right away.
+            if job.cancel_token.wait(BUFFER_FULL_POLL_INTERVAL):
+                return False
+
+        if wait_start_time:
+            self.audio_ring.metrics.add_wait(time.perf_counter() - wait_start_time)
+        return True
+
+    def add_synced_text(self, display_text: str, is_message_end: bool = False) -> None:
+        """ Adds a playback timeline entry at the current write position. Must hold `buffer_lock`. """
+        item = SyncedTextItem(self.written_samples, display_text, is_message_end)
+        self.timeline.add(item)
+        if self.sync_ring:
+            self.sync_ring.write(self.generation, item)
 
     def sounddevice_callback(self, outdata, num_frames, time_, status):
         """
-        Callback function for sounddevice stream.
+        Callback function for the audio sink (sounddevice stream, etc).
         Gets invoked (SAMPLERATE / BLOCKSIZE) times a second 
+        (or faster, for the "free" and "file" sinks)
+
+        Runs on the realtime audio thread, so only copies audio data and updates counters. 
+        Anything else (logging, UI messages, etc) is done by `status_sampler_loop()`.
         """
 
-        # If stream hasn't been initialized or was closed, do nothing.
-        if not self.stream or self.stream.closed:
+        # If sink hasn't been initialized or was closed, do nothing.
+        if not self.sink or self.sink.closed:
             outdata.fill(0)
             return
 
-        Shared.sd_tick_num += 1
-        self.last_queue_size = self.audio_buffer_queue.qsize()
-
         if status.output_underflow:
-            L.w("Audio output underflow detected. Attempting to reset stream.")
-            AppUtil.send_ui_message(self.ui_queue, LogUiMessage("[warning]Audio buffer underflow, requesting stream reset."))
-            # Signal the main loop to reset the stream, don't do it directly in the callback
-            try:
-                self.reset_request_queue.put_nowait(True)
-            except queue.Full:
-                L.w("Reset request already pending")
+            self.num_underflows += 1
             outdata.fill(0) # Fill current buffer with silence
             return
 
-        try:
-            data = self.audio_buffer_queue.get_nowait()
-            data_len = len(data)
-            if data_len == num_frames:
-                # Normal behavior
-                outdata[:, 0] = data
-            elif data_len < num_frames:
-                L.w(f"Audio chunk smaller ({data_len}) than expected ({num_frames}), will pad")
-                outdata[:data_len, 0] = data
-                outdata[data_len:, 0].fill(0) 
-            else: # data_len > frames
-                L.w(f"Audio chunk larger ({data_len}) than expected ({num_frames}), will truncate")
-                outdata[:, 0] = data[:num_frames] 
-        except queue.Empty:
-            # Fill buffer with silence
+        if num_frames != BLOCKSIZE:
+            self.num_size_mismatches += 1
             outdata.fill(0)
-        except Exception as e:
-            L.w("Error: {e}")
+            return
+
+        try:
+            if not self.audio_ring.read_into(outdata[:, 0]):
+                # Fill buffer with silence
+                self.num_empty_callbacks += 1
+                outdata.fill(0)
+                if self.is_silence_pending:
+                    self.is_silence_pending = False
+                    self.silence_time = time.perf_counter()
+        except Exception:
+            self.num_callback_errors += 1
             outdata.fill(0)
 
-        # Update UI with audio buffer size
-        buffer_seconds = self.audio_buffer_queue.qsize() * (BLOCKSIZE/OrpheusConstants.SAMPLERATE)
-        should_show = (time.time() - self.last_buffer_message_time > 0.10) and (buffer_seconds != self.last_buffer_message_value)                
-        got_depleted = self.audio_buffer_queue.qsize() == 0 and self.last_queue_size > 0
-        if should_show or got_depleted:
-            AppUtil.send_ui_message(self.ui_queue, AudioBufferUiMessage(buffer_seconds, got_depleted))
-            self.last_buffer_message_time = time.time()
-            self.last_buffer_message_value = buffer_seconds
-
-        # Send synced text item if necessary
-        if Shared.synced_text_queue:
-            item = Shared.synced_text_queue[0]
-            if Shared.sd_tick_num >= item.target_tick:       
-                del Shared.synced_text_queue[0] 
-                AppUtil.send_ui_message(self.ui_queue, SyncedAudioUiMessage(item))
+    def status_sampler_loop(self):
+        """
+        Samples the counters updated by the audio callback in an indefinite loop,
+        and turns them into UI messages, log entries, and sink reset requests.
+        Runs on its own thread, and sleeps most of the time.
+        """
+        last_message_time: float = 0
+        last_message_value: float = -1
+        last_queue_size = 0
+        last_underflows = 0
+        last_size_mismatches = 0
+        last_callback_errors = 0
+        last_silence_time: float = 0
+
+        while True:
+            time.sleep(SAMPLER_INTERVAL)
+
+            # For whoever reads the play position off the ring (incl. the UI process)
+            self.audio_ring.output_latency = self.sink.latency if self.sink else 0
+
+            # Update UI with audio buffer size
+            queue_size = self.audio_ring.qsize()
+            buffer_seconds = queue_size * (BLOCKSIZE/OrpheusConstants.SAMPLERATE)
+            now = time.time()
+            should_show = (now - last_message_time > 0.10) and (buffer_seconds != last_message_value)
+            got_depleted = queue_size == 0 and last_queue_size > 0
+            last_queue_size = queue_size
+            if should_show or got_depleted:
+                # (The message's audio object lives until its end item has come out of the pipeline)
+                is_message_pending = self.message_audio is not None
+                ui_message = AudioBufferUiMessage(buffer_seconds, got_depleted, is_message_pending)
+                AppUtil.send_ui_message(self.ui_queue, ui_message)
+                last_message_time = now
+                last_message_value = buffer_seconds
+
+            if self.num_underflows != last_underflows:
+                last_underflows = self.num_underflows
+                L.w("Audio output underflow detected. Attempting to reset sink.")
+                AppUtil.send_ui_message(self.ui_queue, LogUiMessage("[warning]Audio buffer underflow, resetting audio output."))
+                self.reset_sink()
+
+            if self.num_size_mismatches != last_size_mismatches:
+                L.w(f"Audio chunk size differed from block size ({self.num_size_mismatches - last_size_mismatches}x)")
+                last_size_mismatches = self.num_size_mismatches
+
+            if self.num_callback_errors != last_callback_errors:
+                L.w(f"Error in audio callback ({self.num_callback_errors - last_callback_errors}x)")
+                last_callback_errors = self.num_callback_errors
+
+            if self.silence_time != last_silence_time:
+                last_silence_time = self.silence_time
+                # What's still in the sink's own buffer is heard after the callback goes silent
+                latency = self.silence_time - self.cancel_time + (self.sink.latency if self.sink else 0)
+                self.stop_latency_metrics.add(latency)
+                L.i(f"Stop to silence: {latency * 1000:.0f}ms")
 
     def tts_queue_loop(self):
         """
-        Processes tts queue in an indefinite loop
-        Checks stop_event to allow interruption
+        Feeds the tts queue's items to the generation pipeline in an indefinite loop.
+        Message bookkeeping happens in the pipeline callbacks, in order with the generated audio.
+        Cancellation is handled by `cancel()`, so there's nothing here to poll.
         """
-        message_audio: MessageAudio | None = None
-
         while True:
+            tts_item = self.tts_queue.get()
+            self.orpheus_gen.submit(tts_item)
+            self.tts_queue.task_done()
 
-            # Handle stop
-            if self.stop_event and self.stop_event.is_set():
-                self.stop_event.clear() 
-                if message_audio and message_audio.keeps_data and message_audio.blocks:
-                    L.i("Saving audio file on stop")
-                    SaveWavUtil.save_with_ui_feedback(message_audio, True, self.ui_queue)
-                    message_audio = None
-                time.sleep(0.1) 
-                continue
-
-            # Check for reset request before waiting for TTS items
-            try:
-                reset_needed = self.reset_request_queue.get_nowait()
-                if reset_needed:
-                    L.i("Processing stream reset request")
-                    self.reset_sd_stream()
-                    continue
-            except queue.Empty:
-                pass 
+    def get_audio_queue_size(self) -> int:
+        return self.audio_ring.qsize()
 
-            # ---
+    def get_playback_position(self) -> int:
+        """ 
+        Absolute sample position of the audio currently being heard,
+        accounting for the output latency of the sink.
+        """
+        return AudioStreamer.get_ring_playback_position(self.audio_ring)
+
+    def get_stats_lines(self) -> list[str]:
+        lines = [str(self.tts_queue)]
+        lines.extend(self.orpheus_gen.get_stats_lines())
+        lines.append(str(self.audio_ring))
+        lines.append(str(self.stop_latency_metrics))
+        lines.append(
+            f"audio callback: {self.num_empty_callbacks} empty, {self.num_underflows} underflows, "
+            f"{self.num_size_mismatches} size mismatches, {self.num_callback_errors} errors"
+        )
+        return lines
 
-            # Wait for a tts item, and loop on a fast interval
-            try:
-                tts_item = self.tts_queue.get(block=True, timeout=0.05)
-                # L.d(f"TtsItem: {tts_item}")
-            except queue.Empty:
-                continue
+    def get_synced_text_item(self) -> SyncedTextItem | None:
+        """ The text segment whose audio is currently being heard """
+        return self.timeline.item_at(self.get_playback_position())
 
-            # Handle end-marker
-            if isinstance(tts_item, TtsEndItem):
-                if message_audio:
-                    duration = message_audio.total_size / OrpheusConstants.SAMPLERATE
-                    if message_audio.keeps_data and message_audio.blocks:
-                        SaveWavUtil.save_with_ui_feedback(message_audio, False, self.ui_queue)
-                    else:
-                        s = f"Generation complete (audio length: {duration:.1f}s)"
-                        AppUtil.send_ui_message(self.ui_queue, LogUiMessage(s))
-                    message_audio = None
-                
-                self.tts_queue.task_done()
-                continue
-
-            # We have a "content item"
-            tts_content_item = cast(TtsContentItem, tts_item)
-
-            # Init or update message_audio object
-            if tts_content_item.is_message_start:
-                if message_audio:
-                    L.w("MessageDataitem already exists, check logic")
-                message_audio = MessageAudio(
-                    text=tts_content_item.raw_text, 
-                    voice_code=tts_content_item.voice,
-                    keeps_data=Prefs().save_audio_to_disk
-                )
-            elif message_audio:
-                message_audio.text += tts_content_item.raw_text
-
-            # Handle empty text (because of stripped characters, etc)
-            if not tts_content_item.text:
-                # Just schedule the display text, and continue loop
-                L.d(f"Skipping empty tts text item. Originally: {tts_content_item.raw_text}")
-                synced_text_item = SyncedTextItem(Shared.sd_tick_num, tts_content_item.raw_text)
-                Shared.synced_text_queue.append(synced_text_item)
-                self.tts_queue.task_done()
-                continue
-
-            # Init stream on first real message
-            if not self.stream:
-                L.d("First TTS item received, initializing audio stream")
-                self.init_sd_stream()
-
-            # Finally, actually do the generation work
-            audio_gen = self.orpheus_gen.audio_chunk_generator(tts_content_item = tts_content_item)
-            self.queue_feeder(audio_gen, self.stop_event, message_audio)
-            self.tts_queue.task_done()
+    def init_decoder(self) -> None:
+        AppUtil.import_decoder_with_feedback(self.ui_queue)
 
-    def get_audio_queue_size(self) -> int:
-        return self.audio_buffer_queue.qsize()
+    @staticmethod
+    def get_ring_playback_position(audio_ring: AudioRing) -> int:
+        latency_samples = int(audio_ring.output_latency * OrpheusConstants.SAMPLERATE)
+        return max(audio_ring.read_count * audio_ring.blocksize - latency_samples, 0)
+
+    @staticmethod
+    def get_num_buffer_blocks() -> int:
+        return int(Config().audio_buffer_seconds * OrpheusConstants.SAMPLERATE / BLOCKSIZE)
 
 # ---
 
 CHANNELS = 1         # Mono
 DTYPE_STR = 'int16'      # 16-bit signed ints
 BLOCKSIZE = 1024     # Frames per callback
-BUFFER_DURATION = 60 # Seconds of buffer capacity
-MAX_AUDIO_QUEUE_SIZE = int(BUFFER_DURATION * OrpheusConstants.SAMPLERATE / BLOCKSIZE)
+SAMPLER_INTERVAL = 0.05 # Seconds between status samples
+BUFFER_FULL_POLL_INTERVAL = BLOCKSIZE / OrpheusConstants.SAMPLERATE / 2 # Seconds
@@ -0,0 +1,56 @@
+import threading
+from typing import Callable
+
+class CancelToken:
+    """
+    Signals cancellation of a unit of work to everything working on it, across threads.
+
+    Unlike a polled flag, callbacks registered with `on_cancel()` run the moment `cancel()` is called
+    (on the cancelling thread), which lets in-progress work be interrupted right away
+    (eg, by closing its socket). `wait()` lets a thread sleep until cancelled, or time out.
+
+    A token can't be reset. Work that follows a cancellation gets a new token.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Registers a callback to be invoked on cancel, or immediately if already cancelled.
+        Returns a function which unregisters the callback.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """ Blocks until cancelled or timed out. Returns True if cancelled. """
+        return self._event.wait(timeout)
+
+    def _remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+from typing import NamedTuple
+
+from completions_config import CompletionsConfig
+from completions_simple_requester import CompletionsSimpleRequester
+
+class ChatHistoryConfig(NamedTuple):
+    """
+    Token budget for the chat history, loaded from the "chat_history" object in config.json.
+    """
+
+    # Max (estimated) tokens of a request's messages: system prompt, summary, turns and the new user prompt
+    max_prompt_tokens: int = 4000
+
+    # When over budget, old turns get folded into a running summary of the conversation if True,
+    # or else just dropped
+    summarize: bool = True
+
+    # Number of most recent turns which are always kept verbatim (as long as they fit)
+    keep_recent_turns: int = 2
+
+    @staticmethod
+    def from_dict(d: dict) -> ChatHistoryConfig:
+        """
+        Makes instance from json dict, falling back to defaults for missing values.
+        Can raise ValueError
+        """
+        if not isinstance(d, dict):
+            raise ValueError(f"Bad datatype. Expected dict (hash object), got {type(d)}")
+        default = ChatHistoryConfig()
+        try:
+            return ChatHistoryConfig(
+                max_prompt_tokens=max(int(d.get("max_prompt_tokens", default.max_prompt_tokens)), 1),
+                summarize=bool(d.get("summarize", default.summarize)),
+                keep_recent_turns=max(int(d.get("keep_recent_turns", default.keep_recent_turns)), 0)
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Bad value in \"chat_history\": {e}")
+
+class ChatHistory:
+    """
+    Chat history with a token budget.
+
+    The system prompt is pinned. Turns (user prompt plus assistant response) are kept until
+    the history goes over budget, at which point `compact()` folds the oldest ones into a summary
+    of the conversation so far (or drops them, if summarizing is off or fails).
+    Requests get as many of the most recent turns as fit the budget in any case.
+
+    Tokens are estimated from character counts, which is close enough for budgeting
+    and doesn't require the model's tokenizer.
+    """
+
+    def __init__(self, system_prompt: str, config: ChatHistoryConfig):
+        self.system_prompt = system_prompt
+        self.config = config
+
+        self.turns: list[tuple[str, str]] = []
+        self.summary = ""
+
+    def clear(self) -> None:
+        self.turns = []
+        self.summary = ""
+
+    def add_turn(self, user_prompt: str, assistant_response: str) -> None:
+        self.turns.append((user_prompt, assistant_response))
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+    @staticmethod
+    def estimate_turn_tokens(turn: tuple[str, str]) -> int:
+        return ChatHistory.estimate_tokens(turn[0]) + ChatHistory.estimate_tokens(turn[1])
+
+    def get_messages(self, user_prompt: str) -> tuple[list[tuple[str, str]], str]:
+        """
+        Returns the (role, content) messages to send before the user prompt:
+        the system message (see `get_system_content()`), and the most recent turns that fit the budget.
+        Also returns a line of stats about the request's prompt size.
+        """
+        messages: list[tuple[str, str]] = []
+        system_content = self.get_system_content()
+        if system_content:
+            messages.append(("system", system_content))
+        num_tokens = sum(ChatHistory.estimate_tokens(content) for _, content in messages)
+        num_tokens += ChatHistory.estimate_tokens(user_prompt)
+
+        # Walks back from the most recent turn
+        num_turns = 0
+        for turn in reversed(self.turns):
+            turn_tokens = ChatHistory.estimate_turn_tokens(turn)
+            if num_tokens + turn_tokens > self.config.max_prompt_tokens:
+                break
+            num_tokens += turn_tokens
+            num_turns += 1
+        turns = self.turns[len(self.turns) - num_turns:]
+        for user_content, assistant_content in turns:
+            messages.append(("user", user_content))
+            messages.append(("assistant", assistant_content))
+
+        stats = f"Prompt: ~{num_tokens} tokens of {self.config.max_prompt_tokens} ({num_turns} turns"
+        if num_turns < len(self.turns):
+            stats += f", {len(self.turns) - num_turns} older ones left out"
+        if self.summary:
+            stats += f", summary ~{ChatHistory.estimate_tokens(self.summary)}"
+        stats += ")"
+        return messages, stats
+
+    def get_system_content(self) -> str:
+        """ 
+        The system prompt, followed by the summary if any.
+        (A single system message, as some chat templates only allow one, at the start)
+        """
+        parts = [self.system_prompt] if self.system_prompt else []
+        if self.summary:
+            parts.append(SUMMARY_MESSAGE_PREFIX + self.summary)
+        return "\n\n".join(parts)
+
+    def get_num_tokens(self) -> int:
+        """ Estimated tokens of the full history (without a new user prompt) """
+        system_content = self.get_system_content()
+        num_tokens = ChatHistory.estimate_tokens(system_content) if system_content else 0
+        return num_tokens + sum(ChatHistory.estimate_turn_tokens(turn) for turn in self.turns)
+
+    async def compact(self, completions_config: CompletionsConfig) -> str:
+        """
+        If the history is over budget, folds the oldest turns into the summary, or drops them.
+        Compacts down to a fraction of the budget, so that it doesn't need to happen on every turn.
+        Returns a line of feedback, or empty string if nothing was done.
+        """
+        if self.get_num_tokens() <= self.config.max_prompt_tokens:
+            return ""
+
+        target_tokens = int(self.config.max_prompt_tokens * COMPACT_TARGET_RATIO)
+        num_tokens = self.get_num_tokens()
+        num_old_turns = 0
+        max_old_turns = max(len(self.turns) - self.config.keep_recent_turns, 0)
+        while num_old_turns < max_old_turns and num_tokens > target_tokens:
+            num_tokens -= ChatHistory.estimate_turn_tokens(self.turns[num_old_turns])
+            num_old_turns += 1
+        if not num_old_turns:
+            return ""
+
+        old_turns = self.turns[:num_old_turns]
+        before_tokens = self.get_num_tokens()
+
+        error_message = ""
+        summary = ""
+        if self.config.summarize:
+            summary, error_message = await ChatHistory._make_summary(self.summary, old_turns, completions_config)
+
+        # (Nothing gets changed until the summary is in, in case of cancellation)
+        if self.turns[:num_old_turns] != old_turns:
+            # Got cleared in the meantime
+            return ""
+        self.turns = self.turns[num_old_turns:]
+        if summary:
+            self.summary = summary
+            s = f"Chat history: summarized {num_old_turns} old turns"
+        else:
+            s = f"Chat history: dropped {num_old_turns} old turns"
+            if error_message:
+                s += f" (summary failed: {error_message})"
+        s += f" (~{before_tokens} -> ~{self.get_num_tokens()} tokens)"
+        return s
+
+    @staticmethod
+    async def _make_summary(
+            summary: str, turns: list[tuple[str, str]], completions_config: CompletionsConfig
+    ) -> tuple[str, str]:
+        """ Returns tuple of (updated summary, error message), mutually exclusive """
+        transcript = ""
+        if summary:
+            transcript += f"Summary of the conversation before this:\n{summary}\n\n"
+        for user_content, assistant_content in turns:
+            transcript += f"User: {user_content}\n\nAssistant: {assistant_content}\n\n"
+
+        requester = CompletionsSimpleRequester()
+        requester.set_system_prompt(SUMMARIZER_SYSTEM_PROMPT)
+        content, error_message = await requester.do_request(transcript, completions_config, dont_add_to_history=True)
+        return content.strip(), error_message
+
+# ---
+
+CHARS_PER_TOKEN = 4
+# Role and formatting tokens per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Compacting gets the history down to this fraction of the budget
+COMPACT_TARGET_RATIO = 0.6
+
+SUMMARY_MESSAGE_PREFIX = "Summary of the earlier part of the conversation:\n"
+
+SUMMARIZER_SYSTEM_PROMPT = (
+    "Summarize the following conversation between a user and an assistant in one short paragraph "
+    "of at most 150 words. Keep names, facts, decisions and open questions that later replies may refer to. "
+    "Reply with the summary only."
+)
@@ -1,22 +1,29 @@
+import asyncio
 import queue
-import threading
+import aiohttp
 from app_types import *
 from app_util import AppUtil
+from chat_history import ChatHistory, ChatHistoryConfig
 from l import L # type: ignore
 from completions_config import CompletionsConfig
-from completions_streamer import CompletionsStreamer
+from completions_streamer import CompletionsStreamer, CONNECT_TIMEOUT, READ_TIMEOUT
+from metered_queue import MeteredQueue
 
 class CompletionsManager:
     """
-    Wraps a `CompletionsStreamer`, which it runs in its own thread.
-    Maintains chat history.
+    Wraps a `CompletionsStreamer`, which it runs as a task on the app's event loop,
+    using a shared HTTP session so that the connection to the server is kept alive between requests.
+    Maintains chat history (see `ChatHistory`).
+
+    Must be used from the event loop's thread.
     """
 
     def __init__(
         self,
-        config: CompletionsConfig, 
+        config: CompletionsConfig,
         system_prompt: str,
-        tts_queue: queue.Queue[TtsItem],
+        history_config: ChatHistoryConfig,
+        tts_queue: MeteredQueue[TtsItem],
         ui_queue: queue.Queue[UiMessage],
     ):
         self.config = config
@@ -24,59 +31,93 @@ class CompletionsManager:
         self.tts_queue = tts_queue
         self.ui_queue = ui_queue
 
-        self.system_prompt = system_prompt
-
-        self.history: list[tuple[str, str]] = []
-        self.init_history()
+        self.history = ChatHistory(system_prompt, history_config)
 
-        self.streamer: CompletionsStreamer = None  # type: ignore
-        self._is_active = False
+        self._session: aiohttp.ClientSession | None = None
+        self._task: asyncio.Task | None = None
+        self._compact_task: asyncio.Task | None = None
 
     def init_history(self) -> None:
-        self.history: list[tuple[str, str]] = []
-        if self.system_prompt:
-            self.history.append(("system", self.system_prompt))
+        self.history.clear()
 
     def is_active(self) -> bool:
-        return self._is_active
+        return self._task is not None and not self._task.done()
 
     def make_request(
-        self, 
-        user_prompt: str, 
+        self,
+        user_prompt: str,
         voice: str,
         dont_add_to_history: bool = False
     ) -> None:
 
-        if self.streamer:
-            self.streamer.abort()
-
-        # Make new llm streamer instance and use it to make request inside a new thread
-        # Thread is fire-and-forget
-        def go():
-            self.streamer = CompletionsStreamer(
-                tts_queue=self.tts_queue,
-                config=self.config, 
-                voice=voice,
-                ui_queue=self.ui_queue
-            )
-            self._is_active = True
-            content, error_message = self.streamer.make_request(user_prompt, self.history)
-            self._is_active = False
+        self.abort()
+
+        # Captured here rather than in the task, so that a stop in the meantime makes its items stale
+        tts_generation = self.tts_queue.generation
+
+        streamer = CompletionsStreamer(
+            tts_queue=self.tts_queue,
+            tts_generation=tts_generation,
+            config=self.config,
+            voice=voice,
+            ui_queue=self.ui_queue
+        )
+
+        messages, stats = self.history.get_messages(user_prompt)
+        AppUtil.send_ui_message(self.ui_queue, LogUiMessage(stats))
+
+        async def go():
+            content, error_message = await streamer.make_request(self._get_session(), user_prompt, messages)
 
             if content:
                 # L.d(f"Full response received:\n{content}")
-                pass 
-            if content and not dont_add_to_history:
-                self.history.append(("user", user_prompt))
-                self.history.append(("assistant", content))
-
+                pass
             if error_message:
                 AppUtil.send_ui_message(self.ui_queue, LogUiMessage(f"[error]{error_message}"))
 
-        self.thread = threading.Thread(target=go, daemon=True)
-        self.thread.start()
+            if content and not dont_add_to_history:
+                self.history.add_turn(user_prompt, content)
+                self._compact_history()
+
+        self._task = asyncio.create_task(go())
 
     def abort(self):
-        """ Aborts streaming the response """
-        if self.streamer:
-            self.streamer.abort()
+        """ Aborts streaming the response, closing its connection """
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _compact_history(self) -> None:
+        """ 
+        Compacts the history in its own task, which isn't affected by aborts.
+        Requests made in the meantime just leave out the older turns that don't fit.
+        """
+        if self._compact_task and not self._compact_task.done():
+            return
+
+        async def go():
+            feedback = await self.history.compact(self.config)
+            if feedback:
+                AppUtil.send_ui_message(self.ui_queue, LogUiMessage(feedback))
+
+        self._compact_task = asyncio.create_task(go())
+
+    async def close(self) -> None:
+        self.abort()
+        if self._compact_task:
+            self._compact_task.cancel()
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if not self._session or self._session.closed:
+            timeout = aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+            connector = aiohttp.TCPConnector(keepalive_timeout=KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+        return self._session
+
+# ---
+
+# Seconds an idle connection to the server is kept open for the next request
+KEEPALIVE_TIMEOUT = 120
@@ -1,11 +1,15 @@
+import asyncio
 import json
 import queue
 import time
-import requests
+import aiohttp
 from l import L
 from completions_config import CompletionsConfig
+from config import Config
 from app_types import *
 from app_util import AppUtil
+from metered_queue import MeteredQueue
+from speech_filter import SpeechFilter
 from text_massager import TextMassager
 from text_segmenter import TextSegmenter
 
@@ -14,7 +18,8 @@ class CompletionsStreamer:
     Makes OpenAI "completions" API call with streaming=True,
     and hands of text info to UI message queue and AudioStreamer as they come in.
     
-    Is synchronous (blocks)
+    Runs as a task on the app's event loop. Gets aborted by cancelling the task,
+    which closes the response's connection right away, even if the server has stalled.
     """
 
     def __init__(
@@ -22,19 +27,18 @@ class CompletionsStreamer:
             config: CompletionsConfig, 
             voice: str,
             ui_queue: queue.Queue[UiMessage],
-            tts_queue: queue.Queue[TtsItem]
+            tts_queue: MeteredQueue[TtsItem],
+            tts_generation: int
     ):
         self.config = config
         self.voice: str = voice
         self.ui_queue = ui_queue
         self.tts_queue = tts_queue
+        self.tts_generation = tts_generation
 
-        self.is_abort = False
-
-    def abort(self):
-        self.is_abort = True
-
-    def make_request(self, user_prompt: str, history: list[tuple[str, str]]) -> tuple[str, str]:
+    async def make_request(
+            self, session: aiohttp.ClientSession, user_prompt: str, history: list[tuple[str, str]]
+    ) -> tuple[str, str]:
 
         request_messages = [{"role": role, "content": content} for role, content in history]
         request_messages.append({"role": "user", "content": user_prompt})
@@ -50,30 +54,27 @@ class CompletionsStreamer:
             headers["Authorization"] = f"Bearer {self.config.api_key}"
 
         start_time = time.time()
-        text_segmenter = TextSegmenter()
+        text_segmenter = TextSegmenter(engine=Config().text_segmenter, config=Config().segmentation_config)
+        speech_filter = SpeechFilter(Config().speech_filter_config)
 
         is_first_segment = True
         is_success = False
         full_response_content = ""
 
+        response: aiohttp.ClientResponse | None = None
         try:
 
-            response = requests.post(self.config.url, headers=headers, json=json_data, stream=True, timeout=180) 
+            response = await session.post(self.config.url, headers=headers, json=json_data)
 
             # Check for HTTP errors (4xx or 5xx)
             response.raise_for_status()
-            
-            if self.is_abort:
-                return "", ""
 
             # L.d("stream started")
 
-            for line in response.iter_lines():
-
-                if self.is_abort:
-                    break
+            async for line in response.content:
 
                 # Filter out keep-alive new lines
+                line = line.rstrip(b"\r\n")
                 if not line:
                     continue
 
@@ -121,14 +122,15 @@ class CompletionsStreamer:
                     # Print to UI
                     AppUtil.send_ui_message(self.ui_queue, StreamedTextUiMessage(segment))
 
+                    # Keep code blocks and the like from being spoken
+                    speakable_text = speech_filter.add_text(segment)
+                    if not speakable_text:
+                        continue
+
                     # Check if we have enough text to generate audio sentences or phrases
-                    segments = text_segmenter.add_text(segment)
+                    segments = text_segmenter.add_text(speakable_text)
                     if segments:
-                        AppUtil.add_to_tts_queue(
-                            tts_queue=self.tts_queue,
-                            text_segments=segments, should_massage=True, voice_code=self.voice, 
-                            has_message_start=is_first_segment
-                        )
+                        await self._add_to_tts_queue(segments, speech_filter, has_message_start=is_first_segment)
                         if is_first_segment:
                             is_first_segment = False
 
@@ -136,33 +138,83 @@ class CompletionsStreamer:
                     # Will continue to next chunk anyway
                     L.w(f"Error parsing json: {data_content} {e}") 
 
+            if is_success:
+                # Reads to the end of the body, so the connection can be reused
+                await response.content.read()
+
+        except asyncio.CancelledError:
+            # Aborted. Drops the connection rather than waiting on the server.
+            if response is not None:
+                response.close()
+            raise
         except Exception as e:
             s = f"Error: {e}"
             L.e(s)
             return "", s
-
-        if self.is_abort:
-            return "", ""
+        finally:
+            if response is not None:
+                response.release()
 
         if is_success:
-            # Add tts item
+            # Add tts items
+            speakable_text = speech_filter.flush()
+            segments = text_segmenter.add_text(speakable_text) if speakable_text else []
+            if segments:
+                await self._add_to_tts_queue(segments, speech_filter, has_message_start=is_first_segment)
+                is_first_segment = False
             remainder = text_segmenter.get_remaining_text()
             if remainder:
+                display_text = speech_filter.to_display_text(remainder)
                 remainder = TextMassager.massage_assistant_text_segment_for_tts(remainder)
-                AppUtil.add_to_tts_queue(
-                    tts_queue=self.tts_queue,
-                    text_segments=[remainder], should_massage=True, voice_code=self.voice, 
-                    has_message_start=False
+                await self._add_to_tts_queue(
+                    [remainder], speech_filter, has_message_start=False, display_segments=[display_text]
                 )
             # Add special message-end item
-            AppUtil.add_to_tts_queue_end_item(self.tts_queue)
+            if self.tts_queue.full():
+                await asyncio.to_thread(AppUtil.add_to_tts_queue_end_item, self.tts_queue, self.tts_generation)
+            else:
+                AppUtil.add_to_tts_queue_end_item(self.tts_queue, self.tts_generation)
 
             # Log completion time for this specific stream.
             elapsed = time.time() - start_time
             elapsed = AppUtil.elapsed_string(elapsed)
-            AppUtil.send_ui_message(self.ui_queue, LogUiMessage(f"Chat response text stream complete ({elapsed})"))
+            s = f"Chat response text stream complete ({elapsed})"
+            if speech_filter.counts:
+                s += f"\nNot spoken: {speech_filter.get_summary()}"
+            AppUtil.send_ui_message(self.ui_queue, LogUiMessage(s))
 
             return full_response_content, ""
 
         L.w("Stream completed without 'DONE' token")
         return "", ""
+
+    async def _add_to_tts_queue(
+            self,
+            segments: list[str],
+            speech_filter: SpeechFilter,
+            has_message_start: bool,
+            display_segments: list[str] | None = None
+    ) -> None:
+        """
+        Only blocks (off the event loop) when the tts queue is full, which holds up reading the stream.
+        Display text is the text the segments came from before speech filtering, for syncing the highlight.
+        """
+        if display_segments is None:
+            display_segments = [speech_filter.to_display_text(segment) for segment in segments]
+        def add_to_tts_queue():
+            AppUtil.add_to_tts_queue(
+                tts_queue=self.tts_queue,
+                text_segments=segments, should_massage=True, voice_code=self.voice, 
+                has_message_start=has_message_start, generation=self.tts_generation,
+                display_segments=display_segments
+            )
+        if self.tts_queue.qsize() + len(segments) <= self.tts_queue.maxsize:
+            add_to_tts_queue()
+        else:
+            await asyncio.to_thread(add_to_tts_queue)
+
+# ---
+
+CONNECT_TIMEOUT = 10
+# Max time between streamed chunks (which includes the wait for the first one)
+READ_TIMEOUT = 180
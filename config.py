@@ -5,7 +5,13 @@ from pathlib import Path
 from completions_config import CompletionsConfig
 from constants import Constants
 from app_util import AppUtil
+from audio_file_writer import AudioFileWriter
+from audio_sink import AudioSink
 from l import L # type: ignore
+from silence_trimmer import SilenceTrimConfig
+from speech_filter import SpeechFilterConfig
+from chat_history import ChatHistoryConfig
+from text_segmenter import SegmentationConfig, TextSegmenter
 
 class Config:
     """ 
@@ -20,6 +26,10 @@ class Config:
 
     orpheus_completions_config: CompletionsConfig
     chat_completions_config: CompletionsConfig | None
+    silence_trim_config: SilenceTrimConfig
+    segmentation_config: SegmentationConfig
+    speech_filter_config: SpeechFilterConfig
+    chat_history_config: ChatHistoryConfig
 
     def __new__(cls):
         if cls._instance is None: 
@@ -57,15 +67,76 @@ class Config:
         if error_message:
             error_message = error_prefix + error_message
             return error_message, ""
+        warnings = [warning] if warning else []
 
         self._audio_save_dir = json_dict.get("audio_save_dir", "")
         if not self._audio_save_dir:
             self._audio_save_dir = Config._get_audio_save_fallback_dir()
         if self._audio_save_dir and not os.path.exists(self._audio_save_dir):
-            warning += f"Config file - no such directory: {self._audio_save_dir}. Will use: {Config._get_audio_save_fallback_dir()}"
+            warnings.append(f"Config file - no such directory: {self._audio_save_dir}. Will use: {Config._get_audio_save_fallback_dir()}")
             self._audio_save_dir = Config._get_audio_save_fallback_dir()
 
-        return "", warning
+        self._audio_save_format = json_dict.get("audio_save_format", "wav")
+        if self._audio_save_format not in AudioFileWriter.FORMATS:
+            warnings.append(f"Config file - bad audio save format: {self._audio_save_format}. Will use: wav")
+            self._audio_save_format = "wav"
+
+        try:
+            self.silence_trim_config = SilenceTrimConfig.from_dict(json_dict.get("silence_trim", {}))
+        except ValueError as e:
+            warnings.append(f"Config file - {e}. Will use default values.")
+            self.silence_trim_config = SilenceTrimConfig()
+
+        audio_sink_dict = json_dict.get("audio_sink", {})
+        if not isinstance(audio_sink_dict, dict):
+            audio_sink_dict = {}
+        self._audio_sink_type = audio_sink_dict.get("type", "device")
+        if self._audio_sink_type not in AudioSink.TYPES:
+            warnings.append(f"Config file - bad audio sink type: {self._audio_sink_type}. Will use: device")
+            self._audio_sink_type = "device"
+        self._audio_sink_file_path = audio_sink_dict.get("file_path", "")
+        if not self._audio_sink_file_path:
+            self._audio_sink_file_path = os.path.join(self._audio_save_dir, "audio_sink_output.wav")
+
+        self._audio_buffer_seconds = json_dict.get("audio_buffer_seconds", DEFAULT_AUDIO_BUFFER_SECONDS)
+        if not isinstance(self._audio_buffer_seconds, (int, float)) or not (1 <= self._audio_buffer_seconds <= 120):
+            warnings.append(f"Config file - bad audio buffer seconds: {self._audio_buffer_seconds}. Will use: {DEFAULT_AUDIO_BUFFER_SECONDS}")
+            self._audio_buffer_seconds = DEFAULT_AUDIO_BUFFER_SECONDS
+
+        self._audio_engine = json_dict.get("audio_engine", "process")
+        if self._audio_engine not in AUDIO_ENGINES:
+            warnings.append(f"Config file - bad audio engine: {self._audio_engine}. Will use: process")
+            self._audio_engine = "process"
+
+        self._ui_max_fps = json_dict.get("ui_max_fps", DEFAULT_UI_MAX_FPS)
+        if not isinstance(self._ui_max_fps, (int, float)) or not (1 <= self._ui_max_fps <= 240):
+            warnings.append(f"Config file - bad ui max fps: {self._ui_max_fps}. Will use: {DEFAULT_UI_MAX_FPS}")
+            self._ui_max_fps = DEFAULT_UI_MAX_FPS
+
+        self._text_segmenter = json_dict.get("text_segmenter", "pysbd")
+        if self._text_segmenter not in TextSegmenter.ENGINES:
+            warnings.append(f"Config file - bad text segmenter: {self._text_segmenter}. Will use: pysbd")
+            self._text_segmenter = "pysbd"
+
+        try:
+            self.segmentation_config = SegmentationConfig.from_dict(json_dict.get("segmentation", {}))
+        except ValueError as e:
+            warnings.append(f"Config file - {e}. Will use default values.")
+            self.segmentation_config = SegmentationConfig()
+
+        try:
+            self.speech_filter_config = SpeechFilterConfig.from_dict(json_dict.get("speech_filter", {}))
+        except ValueError as e:
+            warnings.append(f"Config file - {e}. Will use default values.")
+            self.speech_filter_config = SpeechFilterConfig()
+
+        try:
+            self.chat_history_config = ChatHistoryConfig.from_dict(json_dict.get("chat_history", {}))
+        except ValueError as e:
+            warnings.append(f"Config file - {e}. Will use default values.")
+            self.chat_history_config = ChatHistoryConfig()
+
+        return "", "\n".join(warnings)
 
     def get_completions_configs(self, json_data) -> tuple[str, str]:
 
@@ -92,10 +163,51 @@ class Config:
 
         return "", ""
 
+    @property
+    def audio_buffer_seconds(self) -> float:
+        """ 
+        Capacity of the audio buffer. 
+        Generation gets throttled once this much audio is waiting to be played.
+        """
+        return self._audio_buffer_seconds
+
+    @property
+    def audio_engine(self) -> str:
+        """
+        "process" runs audio generation and playback in a separate process (see `EngineClient`),
+        "thread" runs it in the app's own process.
+        """
+        return self._audio_engine
+
+    @property
+    def ui_max_fps(self) -> float:
+        """ Upper limit on UI redraws per second """
+        return self._ui_max_fps
+
+    @property
+    def text_segmenter(self) -> str:
+        """ Sentence segmentation engine, one of TextSegmenter.ENGINES """
+        return self._text_segmenter
+
     @property
     def audio_save_dir(self) -> str:
         return self._audio_save_dir
 
+    @property
+    def audio_save_format(self) -> str:
+        """ One of AudioFileWriter.FORMATS """
+        return self._audio_save_format
+
+    @property
+    def audio_sink_type(self) -> str:
+        """ One of AudioSink.TYPES """
+        return self._audio_sink_type
+
+    @property
+    def audio_sink_file_path(self) -> str:
+        """ Output path for the "file" audio sink """
+        return self._audio_sink_file_path
+
     @staticmethod
     def _get_file_path() -> str:
         if AppUtil.is_dev():
@@ -112,3 +224,11 @@ class Config:
             return path
         else:
             return os.path.abspath(".")
+
+# ---
+
+DEFAULT_AUDIO_BUFFER_SECONDS = 15
+
+AUDIO_ENGINES = ["process", "thread"]
+
+DEFAULT_UI_MAX_FPS = 30
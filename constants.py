@@ -12,5 +12,8 @@ class Constants:
     # Adapted from: https://www.reddit.com/r/LocalLLaMA/comments/1jfmbg8
     SYSTEM_PROMPT_FILE_PATH = "system_prompt.txt"
 
+    # Text segments waiting for audio generation, before producers get blocked
+    TTS_QUEUE_SIZE = 32
+
     ORPHEUS_VOICE_CODES = OrpheusConstants.STOCK_VOICES.copy()
     ORPHEUS_VOICE_CODES.append("random")
@@ -0,0 +1,429 @@
+from __future__ import annotations
+import atexit
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from typing import cast
+
+from app_types import *
+from app_util import AppUtil
+from audio_ring import AudioRing, SyncEventRing
+from audio_streamer import AudioStreamer, BLOCKSIZE
+from completions_config import CompletionsConfig
+from config import Config
+from constants import Constants
+from l import L
+from metered_queue import MeteredQueue
+from playback_timeline import PlaybackTimeline
+from prefs import Prefs
+
+class EngineProtocol:
+    """
+    Compact binary encoding of the messages between the UI process and the engine process.
+    Each message is the payload of one `Connection.send_bytes()`:
+    a 1-byte message type followed by the type's fields. Strings are length-prefixed UTF-8.
+    """
+
+    # UI -> engine, control channel
+    CANCEL = 1
+    STATS_REQUEST = 2
+    INIT_DECODER = 3
+
+    # UI -> engine, items channel
+    CONTENT_ITEM = 10
+    END_ITEM = 11
+
+    # Engine -> UI, control channel
+    LOG = 20
+    FULL_TEXT = 21
+    STREAMED_TEXT = 22
+    GEN_STATUS = 23
+    AUDIO_BUFFER = 24
+    STATS_REPLY = 25
+
+    @staticmethod
+    def get_type(data: bytes) -> int:
+        return data[0]
+
+    @staticmethod
+    def encode_cancel(generation: int, request_time: float) -> bytes:
+        return struct.pack("<BId", EngineProtocol.CANCEL, generation, request_time)
+
+    @staticmethod
+    def decode_cancel(data: bytes) -> tuple[int, float]:
+        _, generation, request_time = struct.unpack_from("<BId", data)
+        return generation, request_time
+
+    @staticmethod
+    def encode_simple(message_type: int) -> bytes:
+        return struct.pack("<B", message_type)
+
+    @staticmethod
+    def encode_text(message_type: int, text: str) -> bytes:
+        return struct.pack("<B", message_type) + EngineProtocol._pack_str(text)
+
+    @staticmethod
+    def decode_text(data: bytes) -> str:
+        text, _ = EngineProtocol._unpack_str(data, 1)
+        return text
+
+    @staticmethod
+    def encode_tts_item(item: TtsItem, generation: int, save_audio: bool) -> bytes:
+        if isinstance(item, TtsContentItem):
+            flags = (1 if item.is_message_start else 0) | (2 if save_audio else 0)
+            return (
+                struct.pack("<BIB", EngineProtocol.CONTENT_ITEM, generation, flags)
+                + EngineProtocol._pack_str(item.text)
+                + EngineProtocol._pack_str(item.raw_text)
+                + EngineProtocol._pack_str(item.voice)
+            )
+        return struct.pack("<BI", EngineProtocol.END_ITEM, generation)
+
+    @staticmethod
+    def decode_tts_item(data: bytes) -> tuple[TtsItem, int, bool]:
+        """ Returns item, generation, and whether to save the audio """
+        if EngineProtocol.get_type(data) == EngineProtocol.END_ITEM:
+            _, generation = struct.unpack_from("<BI", data)
+            return TtsEndItem(), generation, False
+        _, generation, flags = struct.unpack_from("<BIB", data)
+        offset = struct.calcsize("<BIB")
+        text, offset = EngineProtocol._unpack_str(data, offset)
+        raw_text, offset = EngineProtocol._unpack_str(data, offset)
+        voice, offset = EngineProtocol._unpack_str(data, offset)
+        item = TtsContentItem(text=text, raw_text=raw_text, voice=voice, is_message_start=bool(flags & 1))
+        return item, generation, bool(flags & 2)
+
+    @staticmethod
+    def encode_ui_message(ui_message: UiMessage) -> bytes | None:
+        """ Returns None for message types which don't cross the process boundary """
+        if isinstance(ui_message, LogUiMessage):
+            return EngineProtocol.encode_text(EngineProtocol.LOG, ui_message.text)
+        if isinstance(ui_message, FullTextUiMessage):
+            return EngineProtocol.encode_text(EngineProtocol.FULL_TEXT, ui_message.text)
+        if isinstance(ui_message, StreamedTextUiMessage):
+            return EngineProtocol.encode_text(EngineProtocol.STREAMED_TEXT, ui_message.text)
+        if isinstance(ui_message, GenStatusUiMessage):
+            status = ui_message.item
+            return (
+                struct.pack("<Bdddbd", EngineProtocol.GEN_STATUS,
+                    status.duration_seconds, status.elapsed_seconds, status.ttfb, status.is_finished,
+                    status.generation_seconds)
+                + EngineProtocol._pack_str(status.text)
+            )
+        if isinstance(ui_message, AudioBufferUiMessage):
+            return struct.pack(
+                "<Bdbb", EngineProtocol.AUDIO_BUFFER,
+                ui_message.seconds, ui_message.got_depleted, ui_message.is_message_pending
+            )
+        return None
+
+    @staticmethod
+    def decode_ui_message(data: bytes) -> UiMessage | None:
+        match EngineProtocol.get_type(data):
+            case EngineProtocol.LOG:
+                return LogUiMessage(EngineProtocol.decode_text(data))
+            case EngineProtocol.FULL_TEXT:
+                return FullTextUiMessage(EngineProtocol.decode_text(data))
+            case EngineProtocol.STREAMED_TEXT:
+                return StreamedTextUiMessage(EngineProtocol.decode_text(data))
+            case EngineProtocol.GEN_STATUS:
+                _, duration, elapsed, ttfb, is_finished, generation_seconds = struct.unpack_from("<Bdddbd", data)
+                text, _ = EngineProtocol._unpack_str(data, struct.calcsize("<Bdddbd"))
+                return GenStatusUiMessage(
+                    GenStatus(text, duration, elapsed, ttfb, bool(is_finished), generation_seconds)
+                )
+            case EngineProtocol.AUDIO_BUFFER:
+                _, seconds, got_depleted, is_message_pending = struct.unpack_from("<Bdbb", data)
+                return AudioBufferUiMessage(seconds, bool(got_depleted), bool(is_message_pending))
+            case _:
+                return None
+
+    @staticmethod
+    def _pack_str(s: str) -> bytes:
+        b = s.encode("utf-8")
+        return struct.pack("<I", len(b)) + b
+
+    @staticmethod
+    def _unpack_str(data: bytes, offset: int) -> tuple[str, int]:
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        return data[offset:offset + length].decode("utf-8"), offset + length
+
+class EngineClient:
+    """
+    Runs `AudioStreamer` (and with it, `OrpheusGen` and the audio sink) in a dedicated engine process,
+    so that audio playback doesn't compete with the UI for the GIL.
+    Stands in for `AudioStreamer` in the UI process.
+
+    - TtsItems from the tts queue get forwarded to the engine over the items channel
+    - Cancel and other requests go over the control channel, which also brings back the engine's UI messages
+    - The audio buffer (PCM ring) and the playback timeline entries (sync event ring) are in shared memory,
+      so the playback position and synced text get read without any messaging
+    """
+
+    def __init__(self, tts_queue: MeteredQueue[TtsItem], ui_queue: queue.Queue[UiMessage]):
+        self.tts_queue = tts_queue
+        self.ui_queue = ui_queue
+
+        # The tts queue's generation as of the last cancel. Sync events from earlier generations get ignored.
+        self.generation = 0
+        self.timeline = PlaybackTimeline()
+
+        num_audio_blocks = AudioStreamer.get_num_buffer_blocks()
+        size = AudioRing.get_size_bytes(num_audio_blocks, BLOCKSIZE) + SyncEventRing.get_size_bytes(SYNC_RING_SLOTS)
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+        self.audio_ring, self.sync_ring = EngineClient.make_rings(self.shared_memory, num_audio_blocks)
+
+        context = multiprocessing.get_context("spawn")
+        self.control_conn, engine_control_conn = context.Pipe(duplex=True)
+        engine_items_conn, self.items_conn = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=Engine.run_process,
+            args=(engine_control_conn, engine_items_conn, self.shared_memory.name, num_audio_blocks),
+            name="tts-toy-engine",
+            daemon=True
+        )
+        self.process.start()
+        atexit.register(self.close)
+
+        self.stats_lines: list[str] = []
+        self.stats_event = threading.Event()
+
+        thread = threading.Thread(target=self.forward_tts_items_loop, daemon=True)
+        thread.start()
+        thread = threading.Thread(target=self.receive_loop, daemon=True)
+        thread.start()
+
+    @staticmethod
+    def make_rings(shm: shared_memory.SharedMemory, num_audio_blocks: int) -> tuple[AudioRing, SyncEventRing]:
+        audio_ring_size = AudioRing.get_size_bytes(num_audio_blocks, BLOCKSIZE)
+        buffer = shm.buf
+        assert buffer is not None
+        audio_ring = AudioRing("audio buffer", num_audio_blocks, BLOCKSIZE, buffer[:audio_ring_size])
+        sync_ring = SyncEventRing(SYNC_RING_SLOTS, buffer[audio_ring_size:])
+        return audio_ring, sync_ring
+
+    def cancel(self) -> None:
+        self.tts_queue.clear()
+        self.generation = self.tts_queue.generation
+        self.timeline.clear()
+        self.send_control(EngineProtocol.encode_cancel(self.generation, time.time()))
+
+    def init_decoder(self) -> None:
+        self.send_control(EngineProtocol.encode_simple(EngineProtocol.INIT_DECODER))
+
+    def get_stats_lines(self) -> list[str]:
+        """ Blocks until the engine replies (briefly) """
+        self.stats_event.clear()
+        self.send_control(EngineProtocol.encode_simple(EngineProtocol.STATS_REQUEST))
+        lines = [f"engine process: pid {self.process.pid}, alive: {self.process.is_alive()}"]
+        if self.stats_event.wait(STATS_TIMEOUT):
+            lines.extend(self.stats_lines)
+        else:
+            lines.append("(no reply from engine)")
+        if self.sync_ring.num_dropped:
+            lines.append(f"sync events dropped: {self.sync_ring.num_dropped}")
+        return lines
+
+    def get_audio_queue_size(self) -> int:
+        return self.audio_ring.qsize()
+
+    def get_synced_text_item(self) -> SyncedTextItem | None:
+        """ The text segment whose audio is currently being heard """
+        for generation, item in self.sync_ring.read_all():
+            if generation == self.generation:
+                self.timeline.add(item)
+        return self.timeline.item_at(AudioStreamer.get_ring_playback_position(self.audio_ring))
+
+    def send_control(self, data: bytes) -> None:
+        try:
+            self.control_conn.send_bytes(data)
+        except OSError as e:
+            # Engine is gone, which `receive_loop()` reports
+            L.w(f"Couldn't send to engine: {e}")
+
+    def forward_tts_items_loop(self) -> None:
+        """
+        Sends the tts queue's items to the engine.
+        Blocks while the engine's own tts queue is full, which propagates the backpressure.
+
+        Items are tagged with the generation they were queued in, not the current one,
+        so that an item which was taken off the queue right before a cancel still counts as stale.
+        """
+        while True:
+            tts_item, generation = self.tts_queue.get_with_generation()
+            data = EngineProtocol.encode_tts_item(tts_item, generation, Prefs().save_audio_to_disk)
+            try:
+                self.items_conn.send_bytes(data)
+            except Exception as e:
+                L.e(f"Couldn't send item to engine: {e}")
+                return
+            self.tts_queue.task_done()
+
+    def receive_loop(self) -> None:
+        """ Receives the engine's UI messages and stats replies """
+        while True:
+            try:
+                data = self.control_conn.recv_bytes()
+            except (EOFError, OSError):
+                AppUtil.send_ui_message(self.ui_queue, LogUiMessage("[error]Audio engine process has exited"))
+                return
+            if EngineProtocol.get_type(data) == EngineProtocol.STATS_REPLY:
+                self.stats_lines = EngineProtocol.decode_text(data).split("\n")
+                self.stats_event.set()
+                continue
+            ui_message = EngineProtocol.decode_ui_message(data)
+            if ui_message:
+                AppUtil.send_ui_message(self.ui_queue, ui_message)
+
+    def close(self) -> None:
+        try:
+            self.shared_memory.close()
+        except BufferError:
+            # The rings' views are still around. Fine, because the process is ending.
+            pass
+        try:
+            self.shared_memory.unlink()
+        except FileNotFoundError:
+            pass
+
+class Engine:
+    """
+    The engine process's side of `EngineClient`.
+    Hosts the `AudioStreamer`, feeding it from the items channel and serving the control channel.
+    """
+
+    def __init__(
+            self,
+            control_conn: Connection,
+            items_conn: Connection,
+            shared_memory_name: str,
+            num_audio_blocks: int
+    ):
+        self.control_conn = control_conn
+        self.items_conn = items_conn
+        self.send_lock = threading.Lock()
+
+        # Same as the UI's cancel generation, once the cancel has been applied here
+        self.generation = 0
+        self.cancel_lock = threading.Lock()
+        # Mirrors the UI process's pref, as sent along with each item
+        self.save_audio = False
+
+        self.shared_memory = Engine.attach_shared_memory(shared_memory_name)
+        audio_ring, sync_ring = EngineClient.make_rings(self.shared_memory, num_audio_blocks)
+
+        self.ui_queue = queue.Queue[UiMessage]()
+        self.tts_queue = MeteredQueue[TtsItem]("tts (engine)", Constants.TTS_QUEUE_SIZE)
+        self.audio_streamer = AudioStreamer(
+            tts_queue=self.tts_queue,
+            ui_queue=self.ui_queue,
+            completions_config=cast(CompletionsConfig, Config().orpheus_completions_config),
+            audio_ring=audio_ring,
+            sync_ring=sync_ring,
+            should_save_audio=lambda: self.save_audio
+        )
+
+    @staticmethod
+    def run_process(
+            control_conn: Connection,
+            items_conn: Connection,
+            shared_memory_name: str,
+            num_audio_blocks: int
+    ) -> None:
+        """ Entrypoint of the engine process """
+        AppUtil.init_logging()
+        L.i("Engine process started")
+        error_message, _ = Config().init()
+        if error_message:
+            L.e(error_message)
+            return
+        engine = Engine(control_conn, items_conn, shared_memory_name, num_audio_blocks)
+        engine.run()
+
+    @staticmethod
+    def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+        try:
+            # (Python 3.13+) The UI process owns the segment; keeps the resource tracker out of it
+            return shared_memory.SharedMemory(name=name, track=False) # type: ignore
+        except TypeError:
+            return shared_memory.SharedMemory(name=name)
+
+    def run(self) -> None:
+        thread = threading.Thread(target=self.forward_ui_messages_loop, daemon=True)
+        thread.start()
+        thread = threading.Thread(target=self.receive_items_loop, daemon=True)
+        thread.start()
+        self.control_loop()
+
+    def control_loop(self) -> None:
+        while True:
+            try:
+                data = self.control_conn.recv_bytes()
+            except (EOFError, OSError):
+                # UI process is gone
+                L.i("Engine process exiting")
+                return
+
+            match EngineProtocol.get_type(data):
+                case EngineProtocol.CANCEL:
+                    generation, request_time = EngineProtocol.decode_cancel(data)
+                    self.apply_cancel(generation, request_time)
+                case EngineProtocol.STATS_REQUEST:
+                    text = "\n".join(self.audio_streamer.get_stats_lines())
+                    self.send(EngineProtocol.encode_text(EngineProtocol.STATS_REPLY, text))
+                case EngineProtocol.INIT_DECODER:
+                    self.audio_streamer.init_decoder()
+
+    def apply_cancel(self, generation: int, request_time: float) -> None:
+        """
+        Called by whichever channel learns about the new generation first
+        (an item of the new generation may arrive before the cancel message itself)
+        """
+        with self.cancel_lock:
+            if generation <= self.generation:
+                return
+            self.generation = generation
+            self.audio_streamer.cancel(generation=generation, request_time=request_time)
+
+    def receive_items_loop(self) -> None:
+        while True:
+            try:
+                data = self.items_conn.recv_bytes()
+            except (EOFError, OSError):
+                return
+            tts_item, generation, save_audio = EngineProtocol.decode_tts_item(data)
+            if generation > self.generation:
+                self.apply_cancel(generation, 0)
+            if generation < self.generation:
+                self.tts_queue.metrics.add_dropped()
+                continue
+            if isinstance(tts_item, TtsContentItem) and tts_item.is_message_start:
+                self.save_audio = save_audio
+            # Blocks while full, which stops reading the items channel, which blocks the UI process's sender
+            self.tts_queue.put(tts_item, generation=self.tts_queue.generation)
+
+    def forward_ui_messages_loop(self) -> None:
+        while True:
+            ui_message = self.ui_queue.get()
+            data = EngineProtocol.encode_ui_message(ui_message)
+            if data:
+                self.send(data)
+
+    def send(self, data: bytes) -> None:
+        with self.send_lock:
+            try:
+                self.control_conn.send_bytes(data)
+            except (EOFError, OSError):
+                pass
+
+# ---
+
+SYNC_RING_SLOTS = 256
+
+# Seconds to wait for the engine's reply to a stats request
+STATS_TIMEOUT = 1.0
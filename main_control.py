@@ -1,7 +1,10 @@
 from __future__ import annotations
+import re
+from bisect import bisect_right
 
 from prompt_toolkit.layout.controls import UIContent
 from prompt_toolkit.layout.controls import UIControl
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
 from app_types import *
 from app_util import AppUtil
 from l import L
@@ -14,6 +17,8 @@ class MainControl(UIControl):
     Client should manage control's content using its LinesModel. Eg:
         my_main_control.model.add_block("Hello")
         my_main_control.model.erase(), etc
+
+    Scrolls back through the history with the mouse wheel (or see `LinesModel.page_up()` etc).
     """
 
     def __init__(self, color_code: str, bottom_aligned: bool):
@@ -26,65 +31,93 @@ class MainControl(UIControl):
         self.line_offset: int = 0
 
     def create_content(self, width: int, height: int, preview_search: bool = False) -> UIContent:
-        
+
         self.width = width
         self.height = height
 
         self.model._set_width_height(self.width, self.height)
 
+        # Exactly `height` lines
+        lines = self.model.get_lines()
+
         def get_line(i: int) -> Line:
-            
-            lines = self.model.get_lines()
-            top = (self.height - len(lines)) * -1
-            index = top + i
-            index = min(index, len(lines))
-            
-            # keep for debugging :/
-            # return [("", f"max i {height - 1} i {i} maxline {len(lines)-1} index {index}")]
-
-            is_in_range = 0 <= index < len(lines)
-            if is_in_range:
-                return lines[index]
+            if 0 <= i < len(lines):
+                return lines[i]
             else:
                 return AppUtil.make_empty_line()
 
         return UIContent(
             get_line=get_line, # type: ignore
-            line_count=len(self.model.get_lines()),
+            line_count=len(lines),
             show_cursor=False,
         )
 
+    def mouse_handler(self, mouse_event: MouseEvent):
+        match mouse_event.event_type:
+            case MouseEventType.SCROLL_UP:
+                self.model.scroll(MOUSE_SCROLL_LINES)
+            case MouseEventType.SCROLL_DOWN:
+                self.model.scroll(-MOUSE_SCROLL_LINES)
+            case _:
+                return NotImplemented
+        return None
+
 class LinesModel:
     """
     Serves as the model for MainControl.
-    
-    Text is added using `add_block()`, which takes in plain text, 
+
+    Text is added using `add_block()`, which takes in plain text,
     with app-specific formatting codes.
 
-    TODO: do add-block etc optimizations again
+    History is unbounded, but only the lines in the viewport get materialized:
+    blocks get wrapped lazily, walking back from the bottom of the viewport,
+    so the cost of a redraw depends on the viewport size rather than the history size.
+    Wrapped lines are cached per block, so on a change only the changed block
+    (typically the last one, while streaming) gets re-wrapped.
+
+    The highlight is a style overlay on the last block's wrapped lines, 
+    addressed by its span in the block's whitespace-normalized visible text,
+    so that moving it only restyles the lines it touches.
+
+    The viewport follows the end of the content, unless scrolled back.
     """
 
-    def __init__(self, color_code: str, bottom_aligned: bool):        
-        
+    def __init__(self, color_code: str, bottom_aligned: bool):
+
         self.color_code = color_code
         self.bottom_aligned = bottom_aligned
-        self.width = 60    
+        self.width = 60
         self.height = 20
-        
+
         # A block is a string which can include line breaks.
         # A full 'audio message' (eg, a full chatbot response) or a full log message gets added as a single block.
         # Sequence of blocks get displayed with an empty line between them.
         self._blocks: list[str] = []
 
-        # List of lines, derived from the list of blocks, 
-        # where a "line" is a list of StyleTexts that get printed on a single line.
+        # Wrapped lines of each block (parallel to `_blocks`), including the trailing empty line,
+        # along with the (block text as displayed, width) they were made for. None if not yet wrapped.
+        self._wrapped: list[tuple[tuple[str, int], list[Line]] | None] = []
+
+        # Bottom of the viewport when scrolled back, as (block index, number of the block's lines above it).
+        # None when following the end of the content.
+        self._scroll_anchor: tuple[int, int] | None = None
+
+        # The lines in the viewport, where a "line" is a list of StyleTexts that get printed on a single line.
         self._lines: list[Line] = []
 
-        # Uses pretty involved, state-machine-like logic here...
-        self._highlight = ""        
+        # Highlighted substring of the last block
+        self._highlight = ""
+        # Where in the last block's normalized text to search for the next highlight
         self._highlight_cursor = -1
+        # True while the highlight has yet to be located (eg, its text may not have streamed in yet)
         self._highlight_flag = False
-        
+        # Located highlight, as a span of the last block's normalized text
+        self._highlight_span: tuple[int, int] | None = None
+        # Normalized text of the last block's lines, and where each line starts in it
+        self._text_index: tuple[list[Line], str, list[int]] | None = None
+        # Last block's lines with the highlight overlaid, for the given (lines, span)
+        self._overlay: tuple[list[Line], tuple[int, int], list[Line]] | None = None
+
         self._is_dirty: bool = False
 
     def _set_width_height(self, w: int, h: int) -> None:
@@ -96,21 +129,20 @@ class LinesModel:
 
     def clear(self) -> None:
         self._blocks.clear()
+        self._wrapped.clear()
         self._lines.clear()
-        self._highlight = ""
-        self._highlight_cursor = -1
+        self._scroll_anchor = None
+        self.clear_highlight()
 
     def add_block(self, block: str) -> None:
-        if len(self._blocks) >= MAX_BLOCKS:
-            del self._blocks[0]
-        self._blocks.append(block)        
-        self._highlight_cursor = -1
+        self._blocks.append(block)
+        self._wrapped.append(None)
+        self._reset_highlight_position()
         self._is_dirty = True
 
     def append_to_last_block(self, text_to_append: str) -> None:
         """Appends text to the last block and marks the model dirty."""
         if not self._blocks:
-            self._highlight_cursor = -1 # test
             self.add_block(text_to_append)
             self._is_dirty = True
             return
@@ -120,7 +152,7 @@ class LinesModel:
 
     def replace_last_block(self, new_block_text: str) -> None:
         """Replaces the last block and marks the model dirty."""
-        self._highlight_cursor = -1
+        self._reset_highlight_position()
         if not self._blocks:
             self.add_block(new_block_text)
             self._is_dirty = True
@@ -132,12 +164,16 @@ class LinesModel:
     def erase_last_block(self) -> None:
         if self._blocks:
             self._blocks.pop()
-        self._highlight_cursor = -1
+            self._wrapped.pop()
+        self._reset_highlight_position()
         self._is_dirty = True
 
     def set_highlight(self, substring: str) -> None:
-        """ Highlights a substring in the last block if exists """
-        self._highlight = substring
+        """ 
+        Highlights a substring in the last block if exists. 
+        Gets searched for after the previous highlight, so repeated text advances.
+        """
+        self._highlight = LinesModel._normalize(substring)
         self._highlight_flag = True
         if self._highlight_cursor > -1:
             self._highlight_cursor += 1 # tricky
@@ -145,31 +181,186 @@ class LinesModel:
 
     def clear_highlight(self) -> None:
         self._highlight = ""
+        self._highlight_flag = False
         self._highlight_cursor = -1
+        self._highlight_span = None
         self._is_dirty = True
 
-    def _block_to_lines(self, block: str, is_last: bool) -> list[Line]:
+    def _reset_highlight_position(self) -> None:
+        """ The last block is a different one, so the highlight needs to be located anew """
+        self._highlight_cursor = -1
+        self._highlight_span = None
+        self._highlight_flag = bool(self._highlight)
+
+    # ---
+
+    @property
+    def is_scrolled_back(self) -> bool:
+        return self._scroll_anchor is not None
+
+    def scroll(self, num_lines: int) -> None:
+        """ Scrolls back into the history by `num_lines`, or towards the end if negative """
+        if not self._blocks or num_lines == 0:
+            return
+
+        if self._scroll_anchor:
+            index, num_above = self._scroll_anchor
+        else:
+            index = len(self._blocks) - 1
+            num_above = len(self._get_block_lines(index))
+
+        if num_lines > 0:
+            while num_lines > num_above and index > 0:
+                num_lines -= num_above
+                index -= 1
+                num_above = len(self._get_block_lines(index))
+            num_above = max(num_above - num_lines, 0)
+        else:
+            num_lines = -num_lines
+            while True:
+                num_below = len(self._get_block_lines(index)) - num_above
+                if num_lines <= num_below:
+                    num_above += num_lines
+                    break
+                num_lines -= num_below
+                if index == len(self._blocks) - 1:
+                    num_above = len(self._get_block_lines(index))
+                    break
+                index += 1
+                num_above = 0
+
+        is_at_end = index == len(self._blocks) - 1 and num_above >= len(self._get_block_lines(index))
+        self._scroll_anchor = None if is_at_end else (index, num_above)
+        self._is_dirty = True
+
+    def page_up(self) -> None:
+        self.scroll(max(self.height - 2, 1))
+
+    def page_down(self) -> None:
+        self.scroll(-max(self.height - 2, 1))
 
-        processed_block = block
+    def scroll_to_end(self) -> None:
+        self._scroll_anchor = None
+        self._is_dirty = True
+
+    # ---
 
-        if self._highlight and is_last:
-            formatted = f"[highlight]{self._highlight}[light]"
-            processed_block, index = Util.replace_first_from_index(block, self._highlight, formatted, self._highlight_cursor)
-            if index > -1 and self._highlight_flag:
+    def _get_block_lines(self, index: int) -> list[Line]:
+        """ Returns the block's wrapped lines, re-wrapping only if the block or the width has changed """
+
+        block = self._blocks[index]
+        key = (block, self.width)
+        entry = self._wrapped[index]
+        if entry and entry[0] == key:
+            return entry[1]
+
+        lines = self._block_to_lines(block)
+        if index > 0:
+            # Previous block ends with an empty line already
+            while lines and AppUtil.is_empty_line(lines[0]):
+                del lines[0]
+        self._wrapped[index] = (key, lines)
+        return lines
+
+    def _get_display_lines(self, index: int) -> list[Line]:
+        """ Like `_get_block_lines()`, but with the highlight overlaid on the last block """
+        lines = self._get_block_lines(index)
+        if index != len(self._blocks) - 1 or not self._highlight:
+            return lines
+
+        if self._highlight_flag:
+            # Locate the highlight
+            _, text, _ = self._get_text_index(lines)
+            start = text.find(self._highlight, max(self._highlight_cursor, 0))
+            if start > -1:
                 self._highlight_flag = False
-                self._highlight_cursor = index
+                self._highlight_cursor = start
+                self._highlight_span = (start, start + len(self._highlight))
+            else:
+                # Better no highlight than a stale one
+                self._highlight_span = None
+        if not self._highlight_span:
+            return lines
+
+        if self._overlay and self._overlay[0] is lines and self._overlay[1] == self._highlight_span:
+            return self._overlay[2]
+
+        # Restyle only the lines which the span touches
+        _, text, line_starts = self._get_text_index(lines)
+        start, end = self._highlight_span
+        result = list(lines)
+        line_index = max(bisect_right(line_starts, start) - 1, 0)
+        while line_index < len(lines) and line_starts[line_index] < end:
+            line_start = line_starts[line_index]
+            result[line_index] = LinesModel._overlay_line(lines[line_index], start - line_start, end - line_start)
+            line_index += 1
+        self._overlay = (lines, self._highlight_span, result)
+        return result
+
+    def _get_text_index(self, lines: list[Line]) -> tuple[list[Line], str, list[int]]:
+        """
+        Returns the normalized text of the lines (with lines joined by a space), 
+        and the offset of each line in it. Cached for the last block's lines.
+        """
+        if self._text_index and self._text_index[0] is lines:
+            return self._text_index
+
+        texts = []
+        line_starts = []
+        offset = 0
+        for line in lines:
+            line_starts.append(offset)
+            line_text = LinesModel._normalize("".join(text for _, text in line))
+            if line_text:
+                texts.append(line_text)
+                offset += len(line_text) + 1
+        self._text_index = (lines, " ".join(texts), line_starts)
+        return self._text_index
+
+    @staticmethod
+    def _normalize(s: str) -> str:
+        return WHITESPACE_PATTERN.sub(" ", s).strip()
+
+    @staticmethod
+    def _overlay_line(line: Line, start: int, end: int) -> Line:
+        """ 
+        Returns the line with the highlight style applied to the span,
+        where `start` and `end` are offsets into the line's normalized text
+        """
+        result: Line = []
+        position = 0 # in the normalized text
+        is_after_space = True # leading whitespace is stripped in the normalized text
+        for style, text in line:
+            for char in text:
+                if char.isspace():
+                    if is_after_space:
+                        char_position = position - 1
+                    else:
+                        char_position = position
+                        position += 1
+                    is_after_space = True
+                else:
+                    char_position = position
+                    position += 1
+                    is_after_space = False
+                char_style = HIGHLIGHT_STYLE if start <= char_position < end and char_position >= 0 else style
+                if result and result[-1][0] == char_style:
+                    result[-1] = (char_style, result[-1][1] + char)
+                else:
+                    result.append((char_style, char))
+        return result or line
+
+    def _block_to_lines(self, block: str) -> list[Line]:
 
         # "paragraph" = line of text without line breaks
-        # Process the potentially modified block text
-        paragraphs = processed_block.splitlines()
+        paragraphs = block.splitlines()
         if not paragraphs: # Handle empty blocks or blocks with only newlines
              paragraphs = [""]
 
         result = []
         for paragraph in paragraphs:
-            # If the original block was empty but got highlight tags, paragraph might be empty
-            if not paragraph and not processed_block:
-                 items = AppUtil.make_empty_line()
+            if not paragraph and not block:
+                 items = [AppUtil.make_empty_line()]
             else:
                  items = MainControlParser.transform(paragraph, self.width, self.color_code)
             result.extend(items)
@@ -177,20 +368,10 @@ class LinesModel:
         # Add empty line after block
         result.append(AppUtil.make_empty_line())
 
-        return result
-
-    def _regenerate(self) -> None:
-        self._lines.clear()
-        
-        for i, block in enumerate(self._blocks):
-            is_last = (i == len(self._blocks) - 1)
-            lines = self._block_to_lines(block, is_last)
-            self._lines.extend(lines)
-
         # Prevent more than one consecutive blank line
         new_lines = []
         count = 0
-        for line in self._lines:
+        for line in result:
             if AppUtil.is_empty_line(line):
                 count += 1
                 if count >= 2:
@@ -198,20 +379,67 @@ class LinesModel:
             else:
                 count = 0
             new_lines.append(line)
-        self._lines = new_lines
+
+        return new_lines
+
+    def _regenerate(self) -> None:
+        """ Materializes the lines of the viewport """
+
+        if self._blocks:
+            # The highlight gets located here, whether or not the last block is in view
+            self._get_display_lines(len(self._blocks) - 1)
+
+        if self._scroll_anchor and self._scroll_anchor[0] >= len(self._blocks):
+            self._scroll_anchor = None
+
+        if self._scroll_anchor:
+            index, num_above = self._scroll_anchor
+        else:
+            index, num_above = len(self._blocks) - 1, -1
+
+        # Walk back from the bottom of the viewport
+        chunks: list[list[Line]] = []
+        num_lines = 0
+        while index >= 0 and num_lines < self.height:
+            lines = self._get_display_lines(index)
+            if num_above > -1:
+                lines = lines[:num_above]
+                num_above = -1
+            chunks.append(lines)
+            num_lines += len(lines)
+            index -= 1
+        chunks.reverse()
+
+        if num_lines < self.height and self._scroll_anchor:
+            # Scrolled back beyond the top; show the top instead
+            chunks = []
+            num_lines = 0
+            for index in range(len(self._blocks)):
+                lines = self._get_display_lines(index)
+                num_taken = min(len(lines), self.height - num_lines)
+                chunks.append(lines[:num_taken])
+                num_lines += num_taken
+                if num_lines >= self.height:
+                    self._scroll_anchor = (index, num_taken)
+                    break
+            else:
+                # All content fits
+                self._scroll_anchor = None
+
+        self._lines = [line for chunk in chunks for line in chunk][-self.height:] if self.height else []
 
         # Add blank lines if content does not fill viewport
         num_lines_to_add = self.height - len(self._lines)
-        if num_lines_to_add > 0:            
-            for i in range(num_lines_to_add):
-                if self.bottom_aligned:
-                    self._lines.insert(0, AppUtil.make_empty_line())        
-                else:
-                    self._lines.append(AppUtil.make_empty_line())        
-        
+        if num_lines_to_add > 0:
+            padding = [AppUtil.make_empty_line() for _ in range(num_lines_to_add)]
+            if self.bottom_aligned:
+                self._lines = padding + self._lines
+            else:
+                self._lines = self._lines + padding
+
     def get_lines(self) -> list[Line]:
         """
-        Returns the final lines output.
+        Returns the lines of the viewport (exactly `height` lines).
         Does a recalculation only if dirty flag set.
         """
         if self._is_dirty:
@@ -243,4 +471,10 @@ class LinesModel:
         s += ("-" * 80)
         L.d(s)
 
-MAX_BLOCKS = 100
+# ---
+
+MOUSE_SCROLL_LINES = 3
+
+HIGHLIGHT_STYLE = MainControlParser.make_pt_style("highlight")
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
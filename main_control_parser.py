@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 from app_types import StyleText, Line
 from app_util import AppUtil
 from color import Color
@@ -16,17 +17,20 @@ class MainControlParser:
         When text wraps, it retains the last specified style.
 
         To prevent word wrap, just enter a large value for `line_width` :/
+
+        Results are memoized, as the same paragraphs get transformed on every redraw.
+        The returned list is a copy, but its lines must not be modified.
         """
-        
+        return list(MainControlParser._transform(input_string, line_width, color_code))
+
+    @staticmethod
+    @lru_cache(maxsize=2048)
+    def _transform(input_string: str, line_width: int, color_code: str) -> list[Line]:
+
         if not input_string.strip():
             return [ AppUtil.make_empty_line() ]
 
-        # Regex to find style tags ([RRGGBB] or [RRGGBB+a]) OR text sequences not containing '['
-        # Dynamically build the color code part of the regex based on class attribute
-        color_pattern = r'(?:' + '|'.join(re.escape(code) for code in Color.NAMES) + r')'
-        # Combine into the full pattern for style tags OR text sequences not containing '['
-        pattern_string = rf'(\[{color_pattern}(?:\+[a-zA-Z])?\])|([^\[]+)'
-        pattern = re.compile(pattern_string)
+        pattern = TAG_OR_TEXT_PATTERN
         
         current_style = color_code
 
@@ -55,7 +59,7 @@ class MainControlParser:
                 pos = match.end()
             elif text:
                 # Split the matched text into non-space and space parts
-                sub_parts = re.split(r'(\s+)', text)
+                sub_parts = WHITESPACE_PATTERN.split(text)
                 for sub_part in sub_parts:
                     if sub_part: # Avoid empty strings from split
                         flat_parts.append((current_style, sub_part))
@@ -73,7 +77,7 @@ class MainControlParser:
         for i, style_text in enumerate(flat_parts):
 
             style, item = style_text
-            style = MainControlParser.make_pt_style(style)
+            style = PT_STYLES.get(style) or MainControlParser.make_pt_style(style)
 
             item_len = len(item)
             is_space = item.isspace()
@@ -186,5 +190,18 @@ class MainControlParser:
 
 # ---
 
+# Style tags ([name] or [name+a]) OR text sequences not containing '['
+_color_pattern = r'(?:' + '|'.join(re.escape(code) for code in Color.NAMES) + r')'
+TAG_OR_TEXT_PATTERN = re.compile(rf'(\[{_color_pattern}(?:\+[a-zA-Z])?\])|([^\[]+)')
+
+WHITESPACE_PATTERN = re.compile(r'(\s+)')
+
+# App style codes to prompt-toolkit style strings, for all known colors and style suffixes
+PT_STYLES = {
+    code: MainControlParser.make_pt_style(code)
+    for name in Color.NAMES
+    for code in [name, f"{name}+i", f"{name}+b", f"{name}+u"]
+}
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import asyncio
+import queue
+import time
+from typing import TypeVar
+
+from metrics import QueueMetrics
+
+T = TypeVar("T")
+
+class MeteredQueue(queue.Queue[T]):
+    """
+    Bounded thread queue which keeps `QueueMetrics`.
+
+    Also supports "generations": `clear()` starts a new generation, and a producer which passes
+    the generation it started out with to `put()` has its stale items dropped,
+    including an item it was blocked on when the queue got cleared.
+    Each item is stored along with the generation it was put in (see `get_with_generation()`).
+    """
+
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize)
+        self.metrics = QueueMetrics(name, maxsize)
+        self.generation = 0
+
+    def put(self, item: T, block: bool=True, timeout: float | None=None, generation: int | None=None) -> None:
+        """ Like `queue.Queue.put()`. Silently drops the item if `generation` is stale. """
+        with self.not_full:
+            start_time = 0.0
+            if self.maxsize > 0 and self._qsize() >= self.maxsize:
+                if not block:
+                    raise queue.Full
+                start_time = time.perf_counter()
+                end_time = start_time + timeout if timeout is not None else None
+                while self._qsize() >= self.maxsize:
+                    if generation is not None and generation != self.generation:
+                        break
+                    remaining = end_time - time.perf_counter() if end_time is not None else None
+                    if remaining is not None and remaining <= 0:
+                        self.metrics.add_wait(time.perf_counter() - start_time)
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+                self.metrics.add_wait(time.perf_counter() - start_time)
+
+            if generation is not None and generation != self.generation:
+                self.metrics.add_dropped()
+                return
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+            self.metrics.add_put(self._qsize())
+
+    def get_with_generation(self) -> tuple[T, int]:
+        """ Like a blocking `get()`, but also returns the generation in which the item was put """
+        with self.not_empty:
+            while not self._qsize():
+                self.not_empty.wait()
+            item, generation = self.queue.popleft()
+            self.not_full.notify()
+            return item, generation
+
+    def _put(self, item: T) -> None:
+        # (Called with the mutex held, so the generation can't change in between)
+        self.queue.append((item, self.generation))
+
+    def _get(self) -> T:
+        item, _ = self.queue.popleft()
+        return item
+
+    def clear(self) -> None:
+        """ Removes all items, and starts a new generation """
+        with self.mutex:
+            self.generation += 1
+            num_items = self._qsize()
+            self.queue.clear()
+            self.metrics.add_dropped(num_items)
+            # Only the removed items count as done. A consumer still working on an item calls `task_done()` for it.
+            self.unfinished_tasks -= num_items
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+            # Wakes blocked producers, which either get the room or find out they're stale
+            self.not_full.notify_all()
+
+    def __str__(self) -> str:
+        return self.metrics.to_string(self.qsize())
+
+class MeteredAsyncQueue(asyncio.Queue[T]):
+    """ Bounded asyncio queue which keeps `QueueMetrics` """
+
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize)
+        self.metrics = QueueMetrics(name, maxsize)
+
+    async def put(self, item: T) -> None:
+        if not self.full():
+            self.put_nowait(item)
+            return
+        start_time = time.perf_counter()
+        try:
+            await super().put(item)
+        finally:
+            self.metrics.add_wait(time.perf_counter() - start_time)
+
+    def put_nowait(self, item: T) -> None:
+        super().put_nowait(item)
+        self.metrics.add_put(self.qsize())
+
+    def __str__(self) -> str:
+        return self.metrics.to_string(self.qsize())
+
+if __name__ == "__main__":
+
+    # Clearing while a consumer holds an item
+    q = MeteredQueue[str]("test", 4)
+    q.put("a")
+    q.put("b")
+    q.put("c")
+    item = q.get()
+    q.clear()
+    assert q.unfinished_tasks == 1, q.unfinished_tasks
+    q.task_done() # Must not raise
+    q.join()
+    q.put("d")
+    assert q.get_with_generation() == ("d", 1)
+    q.task_done()
+    q.join()
+    print("MeteredQueue: ok")
@@ -0,0 +1,100 @@
+import threading
+
+class StageMetrics:
+    """
+    Counters for one stage of the generation pipeline.
+    Busy time covers the processing of items only, not waiting on the stage's input or output queues.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.num_items = 0
+        self.num_dropped = 0
+        self.busy_seconds = 0.0
+        self.max_item_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.num_items += 1
+            self.busy_seconds += seconds
+            self.max_item_seconds = max(self.max_item_seconds, seconds)
+
+    def add_dropped(self) -> None:
+        with self._lock:
+            self.num_dropped += 1
+
+    def __str__(self) -> str:
+        with self._lock:
+            avg_ms = (self.busy_seconds / self.num_items * 1000) if self.num_items else 0
+            s = f"{self.name}: {self.num_items} items, busy {self.busy_seconds:.1f}s, "
+            s += f"avg {avg_ms:.1f}ms, max {self.max_item_seconds * 1000:.0f}ms"
+            if self.num_dropped:
+                s += f", dropped {self.num_dropped}"
+            return s
+
+class LatencyMetrics:
+    """ Summary of a series of latency measurements """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.last_seconds = 0.0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.last_seconds = seconds
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def __str__(self) -> str:
+        with self._lock:
+            if not self.count:
+                return f"{self.name}: -"
+            avg_ms = self.total_seconds / self.count * 1000
+            return (
+                f"{self.name}: last {self.last_seconds * 1000:.0f}ms, avg {avg_ms:.0f}ms, "
+                f"max {self.max_seconds * 1000:.0f}ms ({self.count}x)"
+            )
+
+class QueueMetrics:
+    """ Counters for a bounded queue: depth, time producers spent blocked on it being full, and drops """
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self.num_puts = 0
+        self.max_depth = 0
+        self.num_waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.num_dropped = 0
+        self._lock = threading.Lock()
+
+    def add_put(self, depth: int) -> None:
+        with self._lock:
+            self.num_puts += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def add_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.num_waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def add_dropped(self, count: int=1) -> None:
+        with self._lock:
+            self.num_dropped += count
+
+    def to_string(self, depth: int) -> str:
+        with self._lock:
+            s = f"{self.name}: depth {depth}/{self.maxsize} (max {self.max_depth}), {self.num_puts} puts"
+            if self.num_waits:
+                s += f", blocked {self.num_waits}x for {self.wait_seconds:.1f}s (max {self.max_wait_seconds * 1000:.0f}ms)"
+            if self.num_dropped:
+                s += f", dropped {self.num_dropped}"
+            return s
@@ -1,20 +1,54 @@
-from typing import Callable, Generator
+from __future__ import annotations
+import asyncio
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, cast
+import aiohttp
 import numpy as np
-import threading
-import queue
-import asyncio
 
 from app_types import *
 from app_util import AppUtil
-from l import L
+from cancel_token import CancelToken
 from completions_config import CompletionsConfig
+from metered_queue import MeteredAsyncQueue
+from metrics import StageMetrics
 from orpheus_constants import OrpheusConstants
-from orpheus_gen_util import OrpheusGenUtil
+from orpheus_gen_util import OrpheusGenUtil, TokenFramer
 from orpheus_llm_streamer import OrpheusLlmStreamer
-from shared import Shared
 from text_massager import TextMassager
-AudioChunkQueue = queue.Queue[np.ndarray | bytes | None]
+
+class GenJob:
+    """ A TtsItem making its way through the OrpheusGen pipeline, along with its generation state """
+
+    def __init__(self, item: TtsItem, cancel_token: CancelToken):
+        self.item = item
+        # Once cancelled, the job is stale, and gets dropped by every stage
+        self.cancel_token = cancel_token
+        self.log_text = ""
+        self.start_time = 0.0
+        self.first_chunk_time = 0.0
+        self.last_ui_message_time = 0.0
+        self.num_samples = 0
+        self.did_complete = True
+        # Time spent by the stages on the job, excluding waits on the next stage (backpressure)
+        self.request_seconds = 0.0
+        self.stream_seconds = 0.0
+        self.decode_seconds = 0.0
+
+    @property
+    def has_text(self) -> bool:
+        """ True if the job is a content item with something to generate """
+        return isinstance(self.item, TtsContentItem) and bool(self.item.text)
+
+    @property
+    def generation_seconds(self) -> float:
+        """ 
+        How long generating the job's audio took, if it hadn't been held up by a full audio buffer:
+        the request, followed by the slower of the response stream and the decoder (which run concurrently)
+        """
+        return self.request_seconds + max(self.stream_seconds, self.decode_seconds)
 
 class OrpheusGen:
     """
@@ -22,243 +56,394 @@ class OrpheusGen:
 
     - Generates audio tokens from text prompt by using LLM server hosting the Orpheus model
     - Generates the audio data from the tokens
-   
+
+    Runs as a single long-lived pipeline on its own thread and event loop.
+    Submitted TtsItems flow through these stages, which are connected by small bounded queues:
+
+        request -> tokens -> frames -> pcm -> sink
+
+    - request: Opens the streaming completions request (using a persistent HTTP session)
+    - tokens: Reads the streamed response, and parses the token ids
+    - frames: Groups the token ids into the windows that the decoder takes
+    - pcm: Decodes the windows into audio, on a dedicated decoder thread
+    - sink: Hands the audio over to the client's callbacks, on a dedicated sink thread
+
+    Non-content items (eg, TtsEndItem) pass through the stages as markers,
+    so the client's callbacks see everything in submission order.
+
+    Jobs share a CancelToken until `cancel()` is called. Cancelling interrupts the work in progress
+    (in-flight request or open response stream gets closed), and the stale items still queued
+    between the stages get dropped, without waiting on any polling.
+
     Adapted from: https://github.com/isaiahbjork/orpheus-tts-local
     """
 
     def __init__(
-            self, 
-            stop_event: threading.Event, 
+            self,
             ui_queue: queue.Queue[UiMessage],
-            get_audio_queue_size: Callable[[], int],
-            request_config: CompletionsConfig
-    ):        
-        self.stop_event = stop_event
+            request_config: CompletionsConfig,
+            on_job_start: Callable[[GenJob], None],
+            on_audio: Callable[[GenJob, np.ndarray], None],
+            on_job_end: Callable[[GenJob], None],
+            on_cancel: Callable[[], None]
+    ):
+        """
+        The callbacks all get invoked on the sink thread, in order.
+        `on_job_start` and `on_job_end` get called for every job that doesn't get cancelled,
+        and `on_audio` zero or more times in between.
+        `on_cancel` gets called once any in-flight callback has returned.
+        """
         self.ui_queue = ui_queue
-        self.get_audio_queue_size = get_audio_queue_size
         self.request_config = request_config
+        self.on_job_start = on_job_start
+        self.on_audio = on_audio
+        self.on_job_end = on_job_end
+        self.on_cancel = on_cancel
 
-    def audio_chunk_generator(self, tts_content_item: TtsContentItem) -> Generator:
-        """
-        Does the actual audio inference for a discrete text segment.
-        Yields chunks of data via streamed completions service request as they become available.
-        Checks stop_event to allow interruption.
-        """
+        self.cancel_token = CancelToken()
 
-        # L.d(f"generating audio for: {tts_text}")
+        self.stage_metrics = {
+            name: StageMetrics(name) for name in ["request", "tokens", "frames", "pcm", "sink"]
+        }
 
-        log_text = TextMassager.massage_display_text_segment_for_log(tts_content_item.raw_text)
-        self.send_gen_status_ui_message(
-            text=log_text, num_samples=0, start_time=time.time(), first_chunk_time=-1, is_finished=False
-        )
+        self._decoder_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="orpheus-decoder")
+        self._sink_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="orpheus-sink")
+        self._status_job: GenJob | None = None
 
-        audio_chunk_queue = AudioChunkQueue()
+        self._loop = asyncio.new_event_loop()
+        self._ready_event = threading.Event()
+        thread = threading.Thread(target=self._run_loop, daemon=True)
+        thread.start()
+        self._ready_event.wait()
 
-        self.is_first_chunk = True
+    def submit(self, item: TtsItem) -> None:
+        """
+        Adds an item to the end of the pipeline.
+        Thread-safe. Blocks while the pipeline's input queue is full.
+        """
+        job = GenJob(item, self.cancel_token)
+        future = asyncio.run_coroutine_threadsafe(self._request_queue.put(job), self._loop)
+        future.result()
 
-        token_gen = OrpheusLlmStreamer.make_request_and_generate_tokens(
-            request_config=self.request_config,
-            prompt=tts_content_item.text,
-            voice=tts_content_item.voice,
-            ui_queue=self.ui_queue,
-            stop_event=self.stop_event
-        )
-
-        # Start thread
-        token_gen_thread = threading.Thread(
-            target=self._run_async_producer,
-            args=(audio_chunk_queue, token_gen, tts_content_item),
-            daemon=True
-        )
-        token_gen_thread.start()
+    def cancel(self) -> None:
+        """
+        Drops all submitted jobs, including the one in progress. Thread-safe. Does not block.
+        """
+        cancel_token = self.cancel_token
+        self.cancel_token = CancelToken()
+        self._status_job = None
+        cancel_token.cancel()
+        self._loop.call_soon_threadsafe(self._drop_stale_items)
+        self._sink_executor.submit(self.on_cancel)
+
+    def is_stale(self, job: GenJob) -> bool:
+        return job.cancel_token.is_cancelled
+
+    def _drop_stale_items(self) -> None:
+        """ Removes the stale items waiting between the stages, so that no stage needs to process them """
+        for q in self._get_queues():
+            items = []
+            while not q.empty():
+                items.append(q.get_nowait())
+            for item in items:
+                if isinstance(item, GenJob):
+                    job, value = item, None
+                else:
+                    job, value = item
+                if not self.is_stale(job):
+                    q.put_nowait(item)
+                    continue
+                q.metrics.add_dropped()
+                if q is self._tokens_queue and value is not None:
+                    # Response that was opened but not yet read
+                    value.close()
+                    self._request_slot.release()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._run())
+
+    async def _run(self) -> None:
+        # Each stage's input queue. All are bounded, so a stage that can't keep up 
+        # (ultimately, the sink waiting on a full audio buffer) holds up the ones before it,
+        # down to the tokens stage no longer reading the response stream, which throttles the server.
+        self._request_queue = MeteredAsyncQueue[GenJob]("request queue", REQUEST_QUEUE_SIZE)
+        self._tokens_queue = MeteredAsyncQueue[tuple[GenJob, Any]]("tokens queue", 1)
+        self._frames_queue = MeteredAsyncQueue[tuple[GenJob, Any]]("frames queue", STAGE_QUEUE_SIZE)
+        self._pcm_queue = MeteredAsyncQueue[tuple[GenJob, Any]]("pcm queue", STAGE_QUEUE_SIZE)
+        self._sink_queue = MeteredAsyncQueue[tuple[GenJob, Any]]("sink queue", STAGE_QUEUE_SIZE)
+
+        # Only one request streams at a time (same as when segments were generated one by one)
+        self._request_slot = asyncio.Semaphore(1)
+
+        timeout = aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            self._session = session
+            self._ready_event.set()
+            await asyncio.gather(
+                self._run_stage(self._request_stage),
+                self._run_stage(self._tokens_stage),
+                self._run_stage(self._frames_stage),
+                self._run_stage(self._pcm_stage),
+                self._run_stage(self._sink_stage)
+            )
+
+    async def _run_stage(self, stage: Callable) -> None:
+        # A stage must never die, or the pipeline would stall
+        while True:
+            try:
+                await stage()
+            except Exception as e:
+                text = f"[error]Error in generation pipeline ({stage.__name__}): {e}"
+                AppUtil.send_ui_message(self.ui_queue, LogUiMessage(text))
 
+    async def _request_stage(self) -> None:
+        metrics = self.stage_metrics["request"]
         while True:
+            job = await self._request_queue.get()
+            if self.is_stale(job):
+                metrics.add_dropped()
+                continue
+
+            if not job.has_text:
+                await self._tokens_queue.put((job, None))
+                continue
+
+            await self._request_slot.acquire()
+            # The slot gets handed over to the tokens stage along with an opened response.
+            # Otherwise, it must be released here, whatever happens, or the pipeline would stall.
+            response = None
+            is_handed_over = False
+            try:
+                if self.is_stale(job):
+                    metrics.add_dropped()
+                    continue
 
-            if self.stop_event.is_set():
-                # Drain the queue and break out of loop
-                while not audio_chunk_queue.empty():
-                    try:
-                        audio_chunk_queue.get_nowait()
-                        audio_chunk_queue.task_done()
-                    except queue.Empty:
-                        break
-                break
+                t = time.perf_counter()
+                content_item = cast(TtsContentItem, job.item)
+                job.log_text = TextMassager.massage_display_text_segment_for_log(content_item.raw_text)
+                job.start_time = time.time()
+                self._status_job = job
+                self.send_gen_status_ui_message(job, is_finished=False)
+
+                response = await self._open_request(job, content_item)
+                if response is None:
+                    job.did_complete = False
+                job.request_seconds = time.perf_counter() - t
+                metrics.add(job.request_seconds)
+
+                await self._tokens_queue.put((job, response))
+                is_handed_over = response is not None
+            finally:
+                if not is_handed_over:
+                    if response is not None:
+                        response.close()
+                    self._request_slot.release()
+
+    async def _open_request(self, job: GenJob, content_item: TtsContentItem) -> aiohttp.ClientResponse | None:
+        """ Returns the opened response, or None on error or cancel """
+        request_task = asyncio.ensure_future(OrpheusLlmStreamer.open_request_async(
+            session=self._session,
+            request_config=self.request_config,
+            prompt=content_item.text,
+            voice=content_item.voice,
+            ui_queue=self.ui_queue
+        ))
 
-            try:
-                audio_chunk = audio_chunk_queue.get(timeout=0.1)
-            except queue.Empty:
-                continue 
-
-            if audio_chunk is None: # Sentinel check
-                break
-            yield audio_chunk
-            audio_chunk_queue.task_done() 
-        
-        # Cleanup (optional)
-        token_gen_thread.join(timeout=10) 
-        if token_gen_thread.is_alive():
-            L.d("Thread did not finish cleanly?")
-
-    def _run_async_producer(
-            self,
-            audio_chunk_queue: AudioChunkQueue,
-            token_gen: Generator,
-            tts_content_item: TtsContentItem,
-    ):
+        def cancel_request() -> None:
+            self._loop.call_soon_threadsafe(request_task.cancel)
+
+        unregister = job.cancel_token.on_cancel(cancel_request)
         try:
-            loop = asyncio.get_event_loop_policy().get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-                
-        loop.run_until_complete(
-            self._async_audio_producer(audio_chunk_queue, token_gen, tts_content_item)
-        )
-
-    async def _async_audio_producer(
-        self,
-        audio_chunk_queue: AudioChunkQueue,
-        sync_token_gen: Generator,
-        tts_content_item: TtsContentItem,
-    ) -> None:
-        """
-        Runs the async token decoder and puts audio chunks onto the audio_chunk_queue.
-        This runs within the producer thread's event loop.
-        It uses asyncio.to_thread to feed the synchronous token generator
-        into the asynchronous decoder without blocking the loop.
-        """
-        num_samples = 0
-        start_time = time.time()
-        first_chunk_time = 0
-        last_ui_message_time = 0
-        did_complete = True
-        decoder_gen = None
-        token_feeder_instance = None # Store the generator instance
-        _SENTINEL = object() # Unique sentinel for StopIteration
-        log_text = TextMassager.massage_display_text_segment_for_log(tts_content_item.raw_text)
-
-        def _get_next_token(gen):
-            """Helper to get next token or sentinel on StopIteration."""
-            try:
-                return next(gen)
-            except StopIteration:
-                return _SENTINEL
-
-        async def _token_feeder():
-            """Async generator to feed tokens from sync_token_gen non-blockingly."""
-            while True:
-                try:
-                    # Run the helper function in a thread
-                    token_or_sentinel = await asyncio.to_thread(_get_next_token, sync_token_gen)
-
-                    if token_or_sentinel is _SENTINEL:
-                        break # Generator exhausted
-                    else:
-                        yield token_or_sentinel
-                except Exception as e:
-                    # Log errors during the threaded execution or yielding
-                    text = f"[error]Error in token feeder: {e}"
-                    AppUtil.send_ui_message(self.ui_queue, LogUiMessage(text))
-                    break # Stop feeding on error
+            return await request_task
+        except asyncio.CancelledError:
+            return None
+        finally:
+            unregister()
 
+    async def _tokens_stage(self) -> None:
+        metrics = self.stage_metrics["tokens"]
+        while True:
+            job, response = await self._tokens_queue.get()
+            if response is not None:
+                # (Releases the request slot when done)
+                await self._read_tokens(job, response, metrics)
+            await self._frames_queue.put((job, END))
+
+    async def _read_tokens(self, job: GenJob, response: aiohttp.ClientResponse, metrics: StageMetrics) -> None:
+        # Closing the response interrupts the read right away, rather than on the next token's arrival
+        def close_response() -> None:
+            self._loop.call_soon_threadsafe(response.close)
+
+        unregister = job.cancel_token.on_cancel(close_response)
+        start_time = time.perf_counter()
+        wait_seconds = 0.0
         try:
-            # Create and store the token feeder instance
-            token_feeder_instance = _token_feeder()
-            # Instantiate the decoder generator, passing our robust async feeder
-            decoder_gen = OrpheusGenUtil.tokens_decoder(token_feeder_instance, self.stop_event)
-
-            async for audio_chunk in decoder_gen:
-                if self.stop_event.is_set():
-                    did_complete = False
+            count = 0
+            async for token_text in OrpheusLlmStreamer.generate_tokens_async(response, self.ui_queue):
+                if self.is_stale(job):
+                    job.did_complete = False
                     break
+                t = time.perf_counter()
+                token = OrpheusGenUtil.parse_token_string(token_text, count)
+                metrics.add(time.perf_counter() - t)
+                if token is not None and token > 0:
+                    count += 1
+                    t = time.perf_counter()
+                    await self._frames_queue.put((job, token))
+                    wait_seconds += time.perf_counter() - t
+        except Exception as e:
+            job.did_complete = False
+            if not self.is_stale(job):
+                text = f"[error]Error reading Orpheus service response: {e}"
+                AppUtil.send_ui_message(self.ui_queue, LogUiMessage(text))
+        finally:
+            job.stream_seconds = time.perf_counter() - start_time - wait_seconds
+            unregister()
+            response.release()
+            self._request_slot.release()
 
-                # Process and queue the audio chunk
-                if isinstance(audio_chunk, np.ndarray) and audio_chunk.dtype == np.int16:
-                    audio_chunk_queue.put(audio_chunk)
-                    num_samples += audio_chunk.shape[0]
-                elif isinstance(audio_chunk, bytes):
-                    audio_chunk_np = np.frombuffer(audio_chunk, dtype=np.int16)
-                    num_samples += audio_chunk_np.shape[0]
-                    audio_chunk_queue.put(audio_chunk_np)
-                else:
-                    L.w(f"Received unexpected audio chunk type: {type(audio_chunk)}. Skipping.")
-                    continue
+    async def _frames_stage(self) -> None:
+        metrics = self.stage_metrics["frames"]
+        current_job: GenJob | None = None
+        framer = TokenFramer()
 
-                # Handle first chunk logic
-                if self.is_first_chunk:
-                    self.is_first_chunk = False
-                    first_chunk_time = time.time()
-                    target_tick = Shared.sd_tick_num + self.get_audio_queue_size()
-                    synced_text_item = SyncedTextItem(target_tick, tts_content_item.raw_text)
-                    Shared.synced_text_queue.append(synced_text_item)
-
-                # Send periodic UI updates
-                current_time = time.time()
-                if current_time - last_ui_message_time >= 0.1:
-                    last_ui_message_time = current_time
-                    self.send_gen_status_ui_message(
-                        text=log_text, num_samples=num_samples, start_time=start_time,
-                        first_chunk_time=first_chunk_time, is_finished=False
-                    )
+        while True:
+            job, token = await self._frames_queue.get()
 
-        except Exception as e:
-            text = f"[error]Error in async audio producer: {e}"
-            AppUtil.send_ui_message(self.ui_queue,  LogUiMessage(text))
-            did_complete = False
+            if job is not current_job:
+                current_job = job
+                framer = TokenFramer()
 
-        finally:
-            # Explicitly close the token_feeder generator first
-            if token_feeder_instance and hasattr(token_feeder_instance, 'aclose'):
-                try:
-                    await token_feeder_instance.aclose()
-                except Exception as e:
-                    # Log potential errors during feeder close, but don't stop cleanup
-                    text = f"[warning]Error closing token_feeder: {e}"
-                    AppUtil.send_ui_message(self.ui_queue, LogUiMessage(text))
-
-            # Then, close the decoder generator
-            if decoder_gen and hasattr(decoder_gen, 'aclose'):
-                try:
-                    await decoder_gen.aclose()
-                except Exception as e:
-                    text = f"[warning]Error closing tokens_decoder: {e}"
-                    AppUtil.send_ui_message(self.ui_queue,  LogUiMessage(text))
-
-            # The underlying synchronous generator (sync_token_gen) might need
-            # cleanup if it holds resources (e.g., network connection in OrpheusLlmStreamer).
-            # This should ideally be handled within OrpheusLlmStreamer itself
-            # (e.g., using a context manager or try/finally).
-
-            # Sentinel to indicate completion
-            audio_chunk_queue.put(None)
-
-            # Final UI updates
-            self.send_gen_status_ui_message("", 0, 0, 0, False) # Clear status
-            if did_complete:
-                self.send_gen_status_ui_message(
-                    text=log_text, num_samples=num_samples, start_time=start_time,
-                    first_chunk_time=first_chunk_time, is_finished=True
-                )
-
-    def send_gen_status_ui_message(self,
-            text: str, num_samples: int, start_time: float, first_chunk_time: float, is_finished: bool
-    ) -> None:
+            if token is END:
+                await self._pcm_queue.put((job, END))
+                continue
+
+            if self.is_stale(job):
+                metrics.add_dropped()
+                continue
+
+            t = time.perf_counter()
+            # Convert to audio when we have enough tokens
+            window = framer.add_token(token)
+            metrics.add(time.perf_counter() - t)
+
+            if window:
+                await self._pcm_queue.put((job, window))
+
+    async def _pcm_stage(self) -> None:
+        metrics = self.stage_metrics["pcm"]
+        while True:
+            job, window = await self._pcm_queue.get()
+
+            if window is END:
+                if job.has_text and not self.is_stale(job):
+                    self.send_final_gen_status(job)
+                await self._sink_queue.put((job, END))
+                continue
+
+            if self.is_stale(job):
+                metrics.add_dropped()
+                continue
+
+            t = time.perf_counter()
+            audio_bytes = await self._loop.run_in_executor(
+                self._decoder_executor, OrpheusGenUtil.convert_to_audio, *window
+            )
+            elapsed = time.perf_counter() - t
+            job.decode_seconds += elapsed
+            metrics.add(elapsed)
+            if audio_bytes is None or self.is_stale(job):
+                continue
+
+            audio_chunk = np.frombuffer(audio_bytes, dtype=np.int16)
+            job.num_samples += audio_chunk.shape[0]
+            if not job.first_chunk_time:
+                job.first_chunk_time = time.time()
+
+            # Send periodic UI updates
+            current_time = time.time()
+            if current_time - job.last_ui_message_time >= 0.1:
+                job.last_ui_message_time = current_time
+                self.send_gen_status_ui_message(job, is_finished=False)
+
+            await self._sink_queue.put((job, audio_chunk))
+
+    async def _sink_stage(self) -> None:
+        metrics = self.stage_metrics["sink"]
+        current_job: GenJob | None = None
+
+        while True:
+            job, audio_chunk = await self._sink_queue.get()
+            if self.is_stale(job):
+                metrics.add_dropped()
+                continue
+
+            t = time.perf_counter()
+            if job is not current_job:
+                current_job = job
+                await self._call_on_sink_thread(job, self.on_job_start, job)
+            if audio_chunk is END:
+                await self._call_on_sink_thread(job, self.on_job_end, job)
+            else:
+                await self._call_on_sink_thread(job, self.on_audio, job, audio_chunk)
+            metrics.add(time.perf_counter() - t)
+
+    async def _call_on_sink_thread(self, job: GenJob, callback: Callable, *args) -> None:
+        def call():
+            # Staleness is checked again on the sink thread,
+            # because `on_cancel` may have run in the meantime
+            if not self.is_stale(job):
+                callback(*args)
+        await self._loop.run_in_executor(self._sink_executor, call)
+
+    def send_final_gen_status(self, job: GenJob) -> None:
+        # Don't clear the status if the next job has already started
+        if self._status_job is job:
+            self._status_job = None
+            AppUtil.send_ui_message(self.ui_queue, GenStatusUiMessage(GenStatus("", 0, 0, 0, False)))
+        if job.did_complete:
+            self.send_gen_status_ui_message(job, is_finished=True)
+
+    def send_gen_status_ui_message(self, job: GenJob, is_finished: bool) -> None:
         """Sends generation status updates to the UI queue."""
-        duration = num_samples / OrpheusConstants.SAMPLERATE if OrpheusConstants.SAMPLERATE > 0 else 0
-        elapsed = max(time.time() - start_time, 0) if start_time > 0 else 0
-        
-        if first_chunk_time <= 0 and start_time > 0: # Still waiting for first chunk
+        duration = job.num_samples / OrpheusConstants.SAMPLERATE
+        elapsed = max(time.time() - job.start_time, 0) if job.start_time > 0 else 0
+
+        if job.first_chunk_time <= 0 and job.start_time > 0: # Still waiting for first chunk
             ttfb = elapsed
-        elif first_chunk_time > 0 and start_time > 0: # First chunk received
-             ttfb = max(first_chunk_time - start_time, 0)
+        elif job.first_chunk_time > 0 and job.start_time > 0: # First chunk received
+             ttfb = max(job.first_chunk_time - job.start_time, 0)
         else: # Not started or invalid times
             ttfb = 0
 
-        gen_status = GenStatus(text, duration, elapsed, ttfb, is_finished)
+        gen_status = GenStatus(job.log_text, duration, elapsed, ttfb, is_finished, job.generation_seconds)
         AppUtil.send_ui_message(self.ui_queue, GenStatusUiMessage(gen_status))
 
+    def _get_queues(self) -> list[MeteredAsyncQueue]:
+        return [self._request_queue, self._tokens_queue, self._frames_queue, self._pcm_queue, self._sink_queue]
+
+    def get_stats_lines(self) -> list[str]:
+        """ Each stage's input queue, followed by the stage itself """
+        lines = []
+        for q, metrics in zip(self._get_queues(), self.stage_metrics.values()):
+            lines.append(str(q))
+            lines.append(str(metrics))
+        return lines
+
 # --- Constants ---
 
 START_TOKEN_ID = 128259
 END_TOKEN_IDS = [128009, 128260, 128261, 128257]
-    
\ No newline at end of file
+
+# End-of-job marker passed between stages
+END = None
+
+# Jobs waiting to enter the pipeline before `submit()` blocks
+REQUEST_QUEUE_SIZE = 8
+
+# Items (tokens, windows, chunks) between each of the later stages
+STAGE_QUEUE_SIZE = 64
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
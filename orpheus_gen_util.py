@@ -1,4 +1,5 @@
 import threading
+from typing import Generator, Iterable
 
 class OrpheusGenUtil:
     """ Helper functions """
@@ -16,28 +17,20 @@ class OrpheusGenUtil:
         return result
 
     @staticmethod
-    async def tokens_decoder(token_gen, stop_event: threading.Event):
-        """Asynchronous token decoder that converts token stream to audio stream."""
-        
-        buffer = []
-        count = 0
-
-        async for token_text in token_gen:
+    def tokens_decoder_sync(token_gen: Iterable[str], stop_event: threading.Event) -> Generator[bytes, None, None]:
+        """
+        Converts a stream of token strings to audio, for use outside of an event loop.
+        Yields audio as int16 bytes.
+        """
+        framer = TokenFramer()
+        for token_text in token_gen:
             if stop_event.is_set():
-                # printt("Tokens Decoder: Stop event detected.")
-                break # Exit the token processing loop
-
-            token = OrpheusGenUtil.parse_token_string(token_text, count)
-            if token is not None and token > 0:
-                buffer.append(token)
-                count += 1
-                
-                # Convert to audio when we have enough tokens
-                if count % 7 == 0 and count > 27:                    
-                    buffer_to_proc = buffer[-28:]
-                    audio_samples = OrpheusGenUtil.convert_to_audio(buffer_to_proc, count)
-                    if audio_samples is not None:
-                        yield audio_samples
+                break
+            window = framer.add_token_string(token_text)
+            if window:
+                audio_samples = OrpheusGenUtil.convert_to_audio(*window)
+                if audio_samples is not None:
+                    yield audio_samples
 
     @staticmethod
     def parse_token_string(token_string: str, index) -> int | None:
@@ -69,4 +62,36 @@ class OrpheusGenUtil:
         from decoder import convert_to_audio as orpheus_convert_to_audio
         return orpheus_convert_to_audio(multiframe, count)
 
+class TokenFramer:
+    """
+    Groups a stream of Orpheus audio token ids into the windows that the decoder takes:
+    once there are enough tokens, the last 4 frames (of 7 tokens each) for every new frame.
+    Use one instance per response stream.
+    """
+
+    def __init__(self):
+        self.buffer: list[int] = []
+        self.count = 0
+
+    def add_token_string(self, token_string: str) -> tuple[list[int], int] | None:
+        """ Parses the streamed token text, and adds the token if valid. See `add_token()`. """
+        token = OrpheusGenUtil.parse_token_string(token_string, self.count)
+        if token is None or token <= 0:
+            return None
+        return self.add_token(token)
+
+    def add_token(self, token: int) -> tuple[list[int], int] | None:
+        """ Returns the arguments for `OrpheusGenUtil.convert_to_audio()` when a new window is ready """
+        self.buffer.append(token)
+        self.count += 1
+        if self.count % FRAME_TOKENS == 0 and self.count >= WINDOW_TOKENS:
+            self.buffer = self.buffer[-WINDOW_TOKENS:]
+            return list(self.buffer), self.count
+        return None
+
+# ---
+
 CUSTOM_TOKEN_PREFIX = "<custom_token_"
+
+FRAME_TOKENS = 7
+WINDOW_TOKENS = 28
@@ -1,8 +1,9 @@
 import json
 import queue
 import threading
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
+import aiohttp
 import requests
 from app_types import LogUiMessage, UiMessage
 from app_util import AppUtil
@@ -80,3 +81,75 @@ class OrpheusLlmStreamer:
                     text = f"[error]Error decoding API JSON response: {e}"
                     AppUtil.send_ui_message(ui_queue,  LogUiMessage(text))
                     continue
+
+
+    @staticmethod
+    async def open_request_async(
+            session: aiohttp.ClientSession,
+            request_config: CompletionsConfig,
+            prompt: str,
+            voice: str,
+            ui_queue: queue.Queue[UiMessage]
+    ) -> aiohttp.ClientResponse | None:
+        """ 
+        Async counterpart of the request part of `make_request_and_generate_tokens()`. 
+        Returns the response once its headers have arrived, or None on fail.
+        Caller is responsible for releasing the response.
+        """
+        headers = { "Content-Type": "application/json" }
+        json_data = request_config.request_dict.copy()
+        json_data["prompt"] = OrpheusGenUtil.format_orpheus_prompt(prompt, voice)        
+        json_data["stream"] = True # !important
+
+        try:
+            response = await session.post(url=request_config.url, headers=headers, json=json_data)
+        except Exception as e:
+            text = f"[error]Orpheus service request failed: {e}"
+            AppUtil.send_ui_message(ui_queue,  LogUiMessage(text))
+            return None
+
+        if response.status != 200:
+            try:
+                body = await response.text()
+            except Exception:
+                body = ""
+            response.release()
+            text = f"[error]Orpheus service request failed: {response.status} - {body}"
+            AppUtil.send_ui_message(ui_queue,  LogUiMessage(text))
+            return None
+
+        return response
+
+    @staticmethod
+    async def generate_tokens_async(
+            response: aiohttp.ClientResponse,
+            ui_queue: queue.Queue[UiMessage]
+    ) -> AsyncGenerator[str, None]:
+        """ Generates Orpheus tokens by streaming the response from `open_request_async()` """
+
+        async for line in response.content:
+
+            line = line.strip()
+            if not line:
+                continue
+
+            line = line.decode('utf-8')
+
+            if line.startswith('data: '):
+
+                data_str = line[6:]  
+
+                if data_str.strip() == '[DONE]':
+                    break
+
+                try:
+                    data = json.loads(data_str)
+                    if 'choices' in data and len(data['choices']) > 0:
+                        token_text = data['choices'][0].get('text', '')
+                        if token_text:
+                            yield token_text
+
+                except json.JSONDecodeError as e:
+                    text = f"[error]Error decoding API JSON response: {e}"
+                    AppUtil.send_ui_message(ui_queue,  LogUiMessage(text))
+                    continue
@@ -0,0 +1,47 @@
+import bisect
+import threading
+
+from app_types import SyncedTextItem
+
+class PlaybackTimeline:
+    """
+    Maps absolute sample positions in the audio buffer to the text segments being played.
+
+    Entries get recorded by the producer when a segment's first audio is written into the buffer.
+    The UI looks up the entry at the current playback position, using bisect.
+    Nothing here runs on the realtime audio callback.
+    """
+
+    def __init__(self):
+        # Parallel lists, sorted by position
+        self._positions: list[int] = []
+        self._items: list[SyncedTextItem] = []
+        self._lock = threading.Lock()
+
+    def add(self, item: SyncedTextItem) -> None:
+        """ Positions are expected to be non-decreasing """
+        with self._lock:
+            self._positions.append(item.sample_position)
+            self._items.append(item)
+
+    def item_at(self, sample_position: int) -> SyncedTextItem | None:
+        """ Returns the item whose audio is playing at the given position, if any """
+        with self._lock:
+            index = bisect.bisect_right(self._positions, sample_position) - 1
+            if index < 0:
+                return None
+            item = self._items[index]
+            if index >= PRUNE_THRESHOLD:
+                # Entries before the current one are no longer needed
+                del self._positions[:index]
+                del self._items[:index]
+            return item
+
+    def clear(self) -> None:
+        with self._lock:
+            self._positions.clear()
+            self._items.clear()
+
+# ---
+
+PRUNE_THRESHOLD = 64
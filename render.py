@@ -0,0 +1,195 @@
+import argparse
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from app_types import *
+from app_util import AppUtil
+from audio_file_writer import WavFileWriter
+from config import Config
+from orpheus_constants import OrpheusConstants
+from orpheus_gen_util import OrpheusGenUtil
+from orpheus_llm_streamer import OrpheusLlmStreamer
+from silence_trimmer import SilenceTrimmer
+from text_segmenter import TextSegmenter
+from util import Util
+
+class Renderer:
+    """
+    Headless "offline" render of a text file to a single WAV file, as fast as the hardware allows.
+    Does not use prompt_toolkit or sounddevice.
+
+    Segments get generated concurrently (one Orpheus request per worker),
+    and are written to the output file in their original order as soon as possible,
+    so only out-of-order segments are held in memory.
+    For concurrency to pay off, the LLM server must be able to serve parallel requests
+    (eg, llama-server's `--parallel` option).
+    """
+
+    def __init__(self, input_path: str, output_path: str, voice_code: str, num_workers: int):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.voice_code = voice_code
+        self.num_workers = max(num_workers, 1)
+
+        self.stop_event = threading.Event()
+        # Receives any error messages from the Orpheus request logic
+        self.ui_queue = queue.Queue[UiMessage]()
+
+    def run(self) -> int:
+        """ Returns process exit code """
+
+        error_message, warning_message = Config().init()
+        if error_message:
+            print("\n" + error_message)
+            return 1
+        if warning_message:
+            print(warning_message)
+
+        try:
+            with open(self.input_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except Exception as e:
+            print(f"Couldn't read input file: {e}")
+            return 1
+
+        segments = [segment for segment in TextSegmenter.segment_full_message(text, Config().text_segmenter) if segment.strip()]
+        if not segments:
+            print("Nothing to render")
+            return 1
+
+        print(f"Rendering {len(segments)} segments using {self.num_workers} workers")
+        print(f"Orpheus server: {Config().orpheus_completions_config.url}")
+
+        writer = WavFileWriter(self.output_path, OrpheusConstants.SAMPLERATE)
+        if writer.error:
+            print(writer.error)
+            return 1
+
+        # Finished segments which can't be written yet because an earlier one is still pending
+        results: dict[int, np.ndarray] = {}
+        next_index = 0
+        start_time = time.time()
+        num_done = 0
+        audio_seconds = 0.0
+        failed_indices: list[int] = []
+
+        executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        try:
+            futures = {
+                executor.submit(self.render_segment, segment): i for i, segment in enumerate(segments)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    audio, elapsed = future.result()
+                except Exception as e:
+                    print(f"Error rendering segment #{i + 1}: {e}")
+                    audio, elapsed = np.array([], dtype=OrpheusConstants.DTYPE_NP), 0.0
+                results[i] = audio
+                num_done += 1
+
+                log_text = Util.truncate_string(segments[i], 50)
+                self.print_ui_messages()
+                if not audio.size:
+                    # (Request failed, or response had no audio)
+                    failed_indices.append(i)
+                    print(f"[{num_done}/{len(segments)}] #{i + 1} failed {log_text}")
+                else:
+                    duration = audio.size / OrpheusConstants.SAMPLERATE
+                    audio_seconds += duration
+                    multiplier = f"{(duration / elapsed):.1f}x" if elapsed > 0 else "-"
+                    print(f"[{num_done}/{len(segments)}] #{i + 1} {duration:.1f}s in {AppUtil.elapsed_string(elapsed)} ({multiplier}) {log_text}")
+
+                while next_index in results:
+                    writer.write(results.pop(next_index))
+                    next_index += 1
+
+        except KeyboardInterrupt:
+            print("\nInterrupted")
+            self.stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            writer.close()
+            return 1
+
+        executor.shutdown()
+
+        result = writer.close()
+        if isinstance(result, str):
+            print(result)
+            return 1
+
+        elapsed = time.time() - start_time
+        rtf = elapsed / audio_seconds if audio_seconds > 0 else 0
+        speed = audio_seconds / elapsed if elapsed > 0 else 0
+        print(f"Saved: {self.output_path}")
+        print(f"Audio length: {AppUtil.elapsed_string(audio_seconds)} Elapsed: {AppUtil.elapsed_string(elapsed)} RTF: {rtf:.2f} (= {speed:.1f}x)")
+
+        if failed_indices:
+            numbers = ", ".join(f"#{i + 1}" for i in sorted(failed_indices))
+            print(f"{len(failed_indices)} of {len(segments)} segments failed, and are missing from the output: {numbers}")
+            return 1
+        return 0
+
+    def render_segment(self, text: str) -> tuple[np.ndarray, float]:
+        """
+        Generates the audio for one text segment. Runs on a worker thread.
+        Returns the audio data (empty if the request failed) and the elapsed time.
+        """
+        start_time = time.time()
+
+        voice = self.voice_code
+        if voice == "random":
+            voice = random.choice(OrpheusConstants.STOCK_VOICES)
+
+        token_gen = OrpheusLlmStreamer.make_request_and_generate_tokens(
+            request_config=Config().orpheus_completions_config,
+            prompt=text,
+            voice=voice,
+            ui_queue=self.ui_queue,
+            stop_event=self.stop_event
+        )
+
+        trimmer = SilenceTrimmer(Config().silence_trim_config)
+        chunks: list[np.ndarray] = []
+        for audio_bytes in OrpheusGenUtil.tokens_decoder_sync(token_gen, self.stop_event):
+            chunk = np.frombuffer(audio_bytes, dtype=OrpheusConstants.DTYPE_NP)
+            chunks.append(trimmer.process(chunk))
+        chunks.append(trimmer.flush())
+
+        audio = np.concatenate(chunks)
+        return audio, time.time() - start_time
+
+    def print_ui_messages(self) -> None:
+        while not self.ui_queue.empty():
+            ui_message = self.ui_queue.get_nowait()
+            if isinstance(ui_message, LogUiMessage):
+                text = ui_message.text
+                # Strip app's style code, if any
+                if text.startswith("[") and "]" in text:
+                    text = text[text.index("]") + 1:]
+                print(text)
+
+# ---
+
+DEFAULT_NUM_WORKERS = 2
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Renders a text file to a WAV file, without the interactive UI.")
+    parser.add_argument("input", help="Path of the text file")
+    parser.add_argument("output", nargs="?", default="", help="Path of the WAV file (default: input path with .wav extension)")
+    parser.add_argument("--voice", default=OrpheusConstants.STOCK_VOICE_DEFAULT, help="Orpheus voice name, or \"random\"")
+    parser.add_argument("--workers", type=int, default=DEFAULT_NUM_WORKERS, help="Number of segments generated concurrently")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.splitext(args.input)[0] + ".wav"
+
+    AppUtil.init_logging()
+    renderer = Renderer(args.input, output_path, args.voice, args.workers)
+    sys.exit(renderer.run())
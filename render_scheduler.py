@@ -0,0 +1,78 @@
+from __future__ import annotations
+import asyncio
+import time
+from prompt_toolkit.application import Application
+
+from metrics import LatencyMetrics
+
+class RenderScheduler:
+    """
+    Central point for requesting UI redraws.
+
+    UI updates mark their region dirty instead of invalidating the application directly.
+    Dirty regions are collected, and a redraw is issued at most once per frame interval
+    (as per the max frame rate), and not at all while nothing is dirty.
+
+    Also measures the time prompt-toolkit takes to render a frame,
+    so UI cost can be told apart from audio cost.
+
+    Must be used from the event loop's thread.
+    """
+
+    def __init__(self, application: Application, max_fps: float):
+        self.application = application
+        self.min_frame_interval = 1 / max_fps
+
+        self._dirty_regions: set[str] = set()
+        self._timer: asyncio.TimerHandle | None = None
+        self._last_redraw_time = 0.0
+
+        self.num_redraws = 0
+        # Number of times each region was included in a redraw
+        self.region_counts: dict[str, int] = {}
+
+        self.frame_metrics = LatencyMetrics("ui frame time")
+        self._render_start_time = 0.0
+        application.before_render += self._on_before_render
+        application.after_render += self._on_after_render
+
+    def mark_dirty(self, region: str) -> None:
+        """
+        Schedules a redraw, unless one is already scheduled.
+        Before the app is running, just gets noted (the app draws everything on start).
+        """
+        self._dirty_regions.add(region)
+        if self._timer:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = max(self._last_redraw_time + self.min_frame_interval - loop.time(), 0)
+        self._timer = loop.call_later(delay, self._redraw)
+
+    def _redraw(self) -> None:
+        self._timer = None
+        if not self._dirty_regions:
+            return
+        for region in self._dirty_regions:
+            self.region_counts[region] = self.region_counts.get(region, 0) + 1
+        self._dirty_regions.clear()
+        self.num_redraws += 1
+        self._last_redraw_time = asyncio.get_running_loop().time()
+        self.application.invalidate()
+
+    def _on_before_render(self, _) -> None:
+        self._render_start_time = time.perf_counter()
+
+    def _on_after_render(self, _) -> None:
+        if self._render_start_time:
+            self.frame_metrics.add(time.perf_counter() - self._render_start_time)
+            self._render_start_time = 0.0
+
+    def get_stats_lines(self) -> list[str]:
+        regions = ", ".join(f"{region} {count}" for region, count in sorted(self.region_counts.items()))
+        return [
+            f"ui redraws: {self.num_redraws} (max {1 / self.min_frame_interval:.0f}/s), by region: {regions or "-"}",
+            str(self.frame_metrics)
+        ]
@@ -1,11 +1,11 @@
 import datetime
 import os
 import queue
+import time
 
-import numpy as np
-from scipy.io.wavfile import write as write_wav
 from app_types import LogUiMessage, MessageAudio, UiMessage
 from app_util import AppUtil
+from audio_file_writer import AudioFileWriter
 from l import L
 from orpheus_constants import OrpheusConstants
 from config import Config
@@ -14,18 +14,34 @@ from util import Util
 
 class SaveWavUtil:
 
+    @staticmethod
+    def open_writer(message_audio: MessageAudio) -> None:
+        """
+        Starts writing the message's audio to a temporary file in the audio save directory.
+        The file gets its final name in `save_with_ui_feedback()`, once the message's full text is known.
+        """
+        format = Config().audio_save_format
+        fn = PARTIAL_FILE_PREFIX + datetime.datetime.now().strftime("%y%m%d_%H%M%S_%f")
+        fn += AudioFileWriter.FORMATS[format]
+        file_path = os.path.join(Config().audio_save_dir, fn)
+        message_audio.writer = AudioFileWriter.make(format, file_path, OrpheusConstants.SAMPLERATE)
+
     @staticmethod
     def save_with_ui_feedback(
         message_audio: MessageAudio, is_truncated: bool, ui_queue: queue.Queue[UiMessage]
     ) -> None:
         """ 
-        Runs in fire-and-forget thread.
+        Finalizes the message's audio file in a fire-and-forget thread.
         On complete, sends success or error message to the ui queue.
         """
+        writer = message_audio.writer
+        if not writer:
+            return
+        message_audio.writer = None
         file_path = SaveWavUtil.make_file_path(message_audio, is_truncated)
 
         def go():
-            result = SaveWavUtil.save_wav_file(message_audio.blocks, file_path)
+            result = SaveWavUtil.finalize_writer(writer, file_path)
             if isinstance(result, str):
                 error_message = result
                 L.d(f"save error: {error_message}")
@@ -38,6 +54,39 @@ class SaveWavUtil:
 
         Util.run_in_thread(go)
 
+    @staticmethod
+    def discard_writer(message_audio: MessageAudio) -> None:
+        """ Closes the message's audio file, if any, and deletes it """
+        writer = message_audio.writer
+        if not writer:
+            return
+        message_audio.writer = None
+        
+        def go():
+            writer.close()
+            SaveWavUtil._remove_file(writer.file_path)
+
+        Util.run_in_thread(go)
+
+    @staticmethod
+    def finalize_writer(writer: AudioFileWriter, file_path: str) -> float | str:
+        """ 
+        Closes the writer and moves its file to `file_path`.
+        Returns duration in seconds on success, error message string on fail
+        """
+        result = writer.close()
+        if isinstance(result, str):
+            SaveWavUtil._remove_file(writer.file_path)
+            return f"Save audio file error: {result}"
+        if writer.num_samples == 0:
+            SaveWavUtil._remove_file(writer.file_path)
+            return "Save audio file: Aborted, no data"
+        try:
+            os.replace(writer.file_path, file_path)
+        except Exception as e:
+            return f"Save audio file error: {e}"
+        return result
+
     @staticmethod
     def make_file_path(message_audio: MessageAudio, is_truncated: bool) -> str:
         
@@ -49,25 +98,52 @@ class SaveWavUtil:
         fn += TextMassager.massage_text_for_filename(message_audio.text, 25)
         fn = fn.lstrip("_")
         fn = fn.rstrip(".")
-        fn += ".wav"
+        fn += AudioFileWriter.FORMATS[Config().audio_save_format]
 
         file_path = os.path.join(Config().audio_save_dir, fn)        
         return file_path
 
     @staticmethod
-    def save_wav_file(data: list[np.ndarray], file_path: str) -> float | str:
-        """ Returns duration in seconds on success, error message string on fail"""
-
-        if not data:
-            return "Save wav file: Aborted, no data"
+    def remove_stale_partial_files() -> int:
+        """
+        Deletes the temporary files left behind in the audio save directory by a process that died mid-write.
+        Files modified recently are left alone, as they may belong to another running instance.
+        Returns the number of files deleted.
+        """
+        directory = Config().audio_save_dir
+        try:
+            file_names = os.listdir(directory)
+        except Exception as e:
+            L.w(f"Couldn't list {directory}: {e}")
+            return 0
+        count = 0
+        min_mtime = time.time() - STALE_PARTIAL_FILE_SECONDS
+        for file_name in file_names:
+            if not file_name.startswith(PARTIAL_FILE_PREFIX):
+                continue
+            file_path = os.path.join(directory, file_name)
+            try:
+                if os.path.getmtime(file_path) > min_mtime:
+                    continue
+            except OSError:
+                continue
+            SaveWavUtil._remove_file(file_path)
+            count += 1
+        if count:
+            L.i(f"Removed {count} stale partial audio files")
+        return count
 
+    @staticmethod
+    def _remove_file(file_path: str) -> None:
         try:
-            full_audio = np.concatenate(data)
-            if full_audio.ndim > 1:                 
-                 return "Save wav file: Aborted, data not mono"
-            full_audio = full_audio.astype(OrpheusConstants.DTYPE_NP)
-            write_wav(file_path, OrpheusConstants.SAMPLERATE, full_audio)
-            seconds = full_audio.size / OrpheusConstants.SAMPLERATE
-            return seconds
+            os.remove(file_path)
         except Exception as e:
-            return f"Save wav file error: {e}"
+            L.w(f"Couldn't remove file {file_path}: {e}")
+
+# ---
+
+# Prefix of the file name used while a message's audio is still being written
+PARTIAL_FILE_PREFIX = ".partial_"
+
+# Partial files not modified for this long are considered left over from a process that died
+STALE_PARTIAL_FILE_SECONDS = 60 * 60
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import threading
+
+class SegmentSizeController:
+    """
+    Scales the text segmenter's word limits to the measured generation speed (singleton).
+
+    When audio gets generated well above real time, small segments minimize latency.
+    When it's near or below real time, larger segments amortize the per-request overhead
+    (time-to-first-byte) and let the audio buffer stay ahead of playback.
+
+    Gets fed finished generation stats and audio buffer depth on the UI thread,
+    and is read by the completions streamer's thread.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    _speed: float
+    _buffer_seconds: float
+    _is_buffer_low: bool
+    _num_measurements: int
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+                    # Exponential moving average of audio duration / generation time
+                    cls._speed = 0.0
+                    cls._buffer_seconds = 0.0
+                    cls._is_buffer_low = False
+                    cls._num_measurements = 0
+        return cls._instance
+
+    def add_generation(self, duration_seconds: float, generation_seconds: float) -> None:
+        """
+        Adds the stats of a finished generation.
+
+        :param generation_seconds:
+            Time spent generating, not counting waits on a full audio buffer
+            (which would make any speed above real time look like 1x).
+            Includes the time-to-first-byte, which is the overhead larger segments amortize.
+        """
+        if duration_seconds <= 0 or generation_seconds <= 0:
+            return
+        speed = duration_seconds / generation_seconds
+        with SegmentSizeController._lock:
+            if self._num_measurements == 0:
+                self._speed = speed
+            else:
+                self._speed += (speed - self._speed) * SPEED_SMOOTHING
+            self._num_measurements += 1
+
+    def add_buffer_status(self, seconds: float, is_underrun: bool) -> None:
+        """
+        :param seconds: Audio buffer depth
+        :param is_underrun: Buffer ran dry while more audio for the message was still pending
+        """
+        with SegmentSizeController._lock:
+            self._buffer_seconds = seconds
+            if is_underrun:
+                self._is_buffer_low = True
+            elif seconds > 0:
+                self._is_buffer_low = seconds < LOW_BUFFER_SECONDS
+
+    def get_scale(self) -> float:
+        """ Multiplier for word limits: below 1 when generation is fast, above 1 when it's slow """
+        with SegmentSizeController._lock:
+            if not self._num_measurements:
+                return 1.0
+            scale = TARGET_SPEED / self._speed
+            if self._is_buffer_low and self._speed < TARGET_SPEED:
+                scale *= LOW_BUFFER_SCALE
+        return min(max(scale, MIN_SCALE), MAX_SCALE)
+
+    def scale_word_limit(self, max_words: int) -> int:
+        return max(round(max_words * self.get_scale()), 1)
+
+    def get_stats_lines(self) -> list[str]:
+        with SegmentSizeController._lock:
+            if not self._num_measurements:
+                return ["segment size: no measurements yet (scale 1.0)"]
+            speed = self._speed
+            buffer_seconds = self._buffer_seconds
+            is_buffer_low = self._is_buffer_low
+        s = f"segment size: scale {self.get_scale():.2f}, speed {speed:.2f}x, "
+        s += f"buffer {buffer_seconds:.1f}s{" (low)" if is_buffer_low else ""}"
+        return [s]
+
+# ---
+
+# Generation speed (as a multiple of real time) at which the configured word limits apply as-is
+TARGET_SPEED = 2.0
+
+# Weight of the newest measurement in the moving average
+SPEED_SMOOTHING = 0.3
+
+# While playing, a buffer below this is considered at risk of running dry
+LOW_BUFFER_SECONDS = 2.0
+LOW_BUFFER_SCALE = 1.5
+
+MIN_SCALE = 0.75
+MAX_SCALE = 2.5
@@ -1,5 +1,8 @@
 from __future__ import annotations
 import re
+import time
+from bisect import bisect_left
+from itertools import islice
 
 class SentenceSegmenter:
 
@@ -28,21 +31,19 @@ class SentenceSegmenter:
         result_phrases = []
         current_segment = sentence # Start with the original sentence, no stripping
 
-        # Keep track of the original word count for the safety check
-        original_word_count_for_loop = len(current_segment.split()) if current_segment else 0
-
         while current_segment:
-            # Use split() only for counting, not for altering the segment
-            word_count = len(current_segment.split())
+            # Only the first max_words + 1 words are ever needed, 
+            # so the work per iteration doesn't grow with the length of the remaining text
+            word_starts = SentenceSegmenter._get_word_starts(current_segment, max_words + 1)
 
-            if word_count <= max_words:
+            if len(word_starts) <= max_words:
                 # Add the final remaining segment with its whitespace
                 result_phrases.append(current_segment)
                 break # Finished processing
             else:
                 # Segment is too long, find where to split it
                 # _find_best_split_point now returns the index *after* the end of the first segment
-                split_end_index = SentenceSegmenter._find_best_split_point(current_segment, max_words)
+                split_end_index = SentenceSegmenter._find_best_split_point(current_segment, max_words, word_starts)
 
                 if split_end_index is None or split_end_index <= 0:
                      # Safety break 1: Couldn't find a valid split point at all.
@@ -63,20 +64,21 @@ class SentenceSegmenter:
                 if phrase: # Avoid adding empty strings if split is at the very beginning
                      result_phrases.append(phrase)
 
+                # Safety check for infinite loops: the split must reduce the word count.
+                # The first part takes the words starting in it, 
+                # but a split inside a word leaves that word's tail as one more word in the remainder.
+                num_words_taken = bisect_left(word_starts, split_end_index)
+                is_inside_word = not current_segment[split_end_index - 1].isspace() and not current_segment[split_end_index].isspace()
+
                 # Update the segment to the remaining part, starting right after the first part
                 current_segment = current_segment[split_end_index:]
 
-                # Safety check for infinite loops: if the new segment is identical or longer in words
-                new_word_count = len(current_segment.split()) if current_segment else 0
-                if new_word_count >= word_count:
+                if num_words_taken <= int(is_inside_word):
                     print(f"Warning: Split did not reduce word count or segment unchanged, stopping. Segment: '{current_segment[:50]}...'")
                     # Add the problematic remainder to avoid losing text and stop
                     if current_segment:
                         result_phrases.append(current_segment)
                     break
-                # Update word_count for the next iteration's comparison in the loop check itself
-                # This is redundant now that we check inside, but doesn't hurt.
-                # word_count = new_word_count
 
 
         # Filter out potentially empty strings if splitting resulted in them (e.g., splitting on multiple spaces)
@@ -84,20 +86,28 @@ class SentenceSegmenter:
         return [p for p in result_phrases if p]
 
     @staticmethod
-    def _find_best_split_point(segment, max_words):
+    def _find_best_split_point(segment, max_words, word_starts=None):
         """
         Finds the best character index to split a segment that is too long.
         The returned index marks the position *after* the end of the first segment.
         Prioritizes commas/colons/semicolons near the middle, then spaces near the middle,
         then falls back to the space after max_words.
         Returns the character index for slicing (exclusive end for first part).
+
+        `word_starts` are the start indices of (at least) the first max_words + 1 words, 
+        as per `_get_word_starts()`.
         """
-        words = segment.split() # Simple split for counting words
-        word_count = len(words)
+        if word_starts is None:
+            word_starts = SentenceSegmenter._get_word_starts(segment, max_words + 1)
 
-        if word_count <= max_words:
+        if len(word_starts) <= max_words:
             return None # No split needed based on length
 
+        # The part left of a split point has at most max_words words 
+        # iff the split point is at or before the start of word max_words + 1.
+        # So only candidates up to there need to be considered, and they need no word count check.
+        max_split_point = word_starts[max_words]
+
         # --- Define search center and range ---
         middle_char_index = len(segment) // 2
         search_radius = max(20, len(segment) // 4)
@@ -109,21 +119,15 @@ class SentenceSegmenter:
         start_search = max(0, middle_char_index - search_radius)
         end_search = min(len(segment), middle_char_index + search_radius)
 
-        # Find all punc  in the search range
-        punc_indices = [m.start() for m in re.finditer(r'[,;:]', segment[start_search:end_search])]
-
-        punc_indices = [idx + start_search for idx in punc_indices]
-
-        for idx in punc_indices:
+        # Find all punc in the search range
+        # (Punc at max_split_point or later would make a split point after it)
+        for m in PUNC_PATTERN.finditer(segment, start_search, min(end_search, max_split_point)):
             # Potential split point is *after* the punc.
-            split_point = idx + 1
-            # Check word count constraint for the left part (segment[:split_point])
-            left_part = segment[:split_point]
-            if len(left_part.split()) <= max_words:
-                dist = abs(split_point - middle_char_index)
-                if dist < min_punc_dist:
-                    min_punc_dist = dist
-                    best_punc_split_idx = split_point # Store index *after* punc
+            split_point = m.start() + 1
+            dist = abs(split_point - middle_char_index)
+            if dist < min_punc_dist:
+                min_punc_dist = dist
+                best_punc_split_idx = split_point # Store index *after* punc
 
         if best_punc_split_idx != -1:
             # We found a punc split. Return the index right after the punc.
@@ -136,15 +140,12 @@ class SentenceSegmenter:
         min_space_dist = float('inf')
 
         # Find all spans of whitespace in the search range
-        space_matches = list(re.finditer(r'\s+', segment[start_search:end_search]))
-
-        for match in space_matches:
+        # (Whitespace always ends at a word start, so no span gets cut short at max_split_point)
+        for match in WHITESPACE_PATTERN.finditer(segment, start_search, min(end_search, max_split_point)):
             # Potential split point is *after* the whitespace span
-            split_point = match.end() + start_search # Adjust index to full segment
-            # Check word count constraint for the left part (segment[:split_point])
-            left_part = segment[:split_point]
+            split_point = match.end()
             # Ensure the split doesn't happen right at the beginning
-            if split_point > 0 and len(left_part.split()) <= max_words:
+            if split_point > 0:
                 dist = abs(split_point - middle_char_index)
                 if dist < min_space_dist:
                     min_space_dist = dist
@@ -158,9 +159,9 @@ class SentenceSegmenter:
         # --- 3. Fallback: Split strictly after max_words ---
         # Find the character index *after* the end of the max_words-th word.
         # This means finding the start of the (max_words + 1)-th word.
-        fallback_split_idx = SentenceSegmenter._find_split_char_index(segment, max_words + 1)
+        fallback_split_idx = max_split_point
 
-        if fallback_split_idx is not None and fallback_split_idx != -1 and fallback_split_idx > 0:
+        if fallback_split_idx > 0:
             # fallback_split_idx is the start of the next word. This is where the next segment begins.
             # So, the first segment ends just before this index.
             # print(f"Debug: Using fallback split point (start of word {max_words + 1}): {fallback_split_idx}")
@@ -168,36 +169,44 @@ class SentenceSegmenter:
         else:
             # Error case: Couldn't find the start of the (max_words + 1)-th word.
             # This might mean the segment has <= max_words words already (handled earlier),
-            # or it's one giant word with no spaces, or an issue with _find_split_char_index.
+            # or it's one giant word with no spaces.
             # Return None to indicate failure to find a split point here.
             print(f"Warning: Could not find a valid fallback split point for segment exceeding {max_words} words. Segment: '{segment[:50]}...'")
             return None # Signal failure to the caller
 
     @staticmethod
-    def _find_split_char_index(text, target_word_index):
+    def _get_word_starts(text, max_count):
         """
-        Finds the starting character index in the original text for the word
-        at the 1-based target_word_index. Handles multiple spaces.
-        Returns -1 if index is out of bounds or word not found.
+        Returns the starting character indices of the first `max_count` words of the text
+        (words as per `str.split()`), so that the number of words left of any index up to the last of them
+        is a binary search away.
         """
-        word_count = 0
-        in_word = False
-        start_index = -1
-
-        for i, char in enumerate(text):
-            is_space = char.isspace()
-
-            if not is_space and not in_word:
-                # Start of a new word
-                in_word = True
-                word_count += 1
-                if word_count == target_word_index:
-                    start_index = i
-                    break # Found the start of the target word
-            elif is_space:
-                # End of a potential word
-                in_word = False
-
-        # If loop finishes without finding the start_index (e.g., target_word_index > actual words)
-        # start_index remains -1.
-        return start_index
+        return [m.start() for m in islice(WORD_PATTERN.finditer(text), max_count)]
+
+# ---
+
+WORD_PATTERN = re.compile(r"\S+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+PUNC_PATTERN = re.compile(r"[,;:]")
+
+if __name__ == "__main__":
+
+    print("--- Examples ---")
+    examples = [
+        ("Short sentence, no split needed.", 25),
+        ("This is a fairly long sentence, which has a comma near the middle, and goes on for a while longer than it should.", 10),
+        ("No punctuation here at all just a long run of words that keeps on going and going without any break", 8),
+    ]
+    for sentence, max_words in examples:
+        print(f"{max_words}: {SentenceSegmenter.segment_sentence(sentence, max_words)}")
+
+    print("\n--- Benchmark: long run-on sentences (eg, pasted documents in direct mode) ---")
+    words = ["the", "quick", "brown", "fox,", "jumps", "over", "a", "lazy", "dog;", "and", "then", "some"]
+    for num_chars in [2_000, 8_000, 32_000]:
+        text = " ".join(words[i % len(words)] for i in range(num_chars // 4))[:num_chars]
+        start_time = time.perf_counter()
+        phrases = SentenceSegmenter.segment_sentence(text)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        assert "".join(phrases) == text
+        assert all(len(phrase.split()) <= 25 for phrase in phrases)
+        print(f"{num_chars:>6} chars: {len(phrases):>4} phrases in {elapsed_ms:.1f}ms")
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import NamedTuple
+import numpy as np
+
+from orpheus_constants import OrpheusConstants
+
+class SilenceTrimConfig(NamedTuple):
+    """
+    Settings for `SilenceTrimmer`, loaded from the "silence_trim" object in config.json
+    """
+    enabled: bool = True
+
+    # Frames whose RMS level is below this value (dBFS) are treated as silence
+    threshold_db: float = -45.0
+
+    # Analysis frame length
+    frame_ms: int = 10
+
+    # Amount of silence kept before the first non-silent frame of a segment
+    lead_pad_ms: int = 30
+
+    # Maximum amount of silence kept at the end of a segment.
+    # Together with `lead_pad_ms`, this bounds the gap between consecutive segments.
+    max_gap_ms: int = 200
+
+    # Maximum length of a pause in the middle of a segment
+    max_pause_ms: int = 750
+
+    @staticmethod
+    def from_dict(d: dict) -> SilenceTrimConfig:
+        """
+        Makes instance from json dict, falling back to defaults for missing values.
+        Can raise ValueError
+        """
+        if not isinstance(d, dict):
+            raise ValueError(f"Bad datatype. Expected dict (hash object), got {type(d)}")
+        default = SilenceTrimConfig()
+        try:
+            return SilenceTrimConfig(
+                enabled=bool(d.get("enabled", default.enabled)),
+                threshold_db=float(d.get("threshold_db", default.threshold_db)),
+                frame_ms=max(int(d.get("frame_ms", default.frame_ms)), 1),
+                lead_pad_ms=max(int(d.get("lead_pad_ms", default.lead_pad_ms)), 0),
+                max_gap_ms=max(int(d.get("max_gap_ms", default.max_gap_ms)), 0),
+                max_pause_ms=max(int(d.get("max_pause_ms", default.max_pause_ms)), 0)
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Bad value in \"silence_trim\": {e}")
+
+class SilenceTrimmer:
+    """
+    Energy-based trimmer for the leading and trailing silence of a single generated audio segment.
+
+    Works on a stream of int16 chunks. The level of each fixed-size analysis frame is computed
+    in one vectorized pass per chunk. Only the current run of silent frames is held back
+    (bounded by `max_pause_ms`), since it can't be known yet whether more speech follows.
+
+    Use one instance per segment: call `process()` for each chunk and `flush()` at the end.
+    """
+
+    def __init__(self, config: SilenceTrimConfig, samplerate: int=OrpheusConstants.SAMPLERATE):
+        self.config = config
+        self.frame_size = max(int(samplerate * config.frame_ms / 1000), 1)
+        self.lead_pad_size = int(samplerate * config.lead_pad_ms / 1000)
+        self.max_gap_size = int(samplerate * config.max_gap_ms / 1000)
+        self.max_pause_size = max(int(samplerate * config.max_pause_ms / 1000), self.max_gap_size)
+
+        # Linear RMS threshold, relative to int16 full scale
+        self.threshold = 32768.0 * (10 ** (config.threshold_db / 20))
+
+        # Has a non-silent frame been seen yet
+        self.has_started = False
+        # Samples which don't yet make up a full analysis frame
+        self.pending = np.array([], dtype=OrpheusConstants.DTYPE_NP)
+        # Before start: the most recent silence, to be used as the lead-in pad.
+        # After start: the current run of silence, which may or may not be trailing.
+        self.held = np.array([], dtype=OrpheusConstants.DTYPE_NP)
+
+        # Stats
+        self.num_samples_in = 0
+        self.num_samples_out = 0
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """
+        Takes in the next chunk of the segment and returns the audio that can be safely released.
+        Returned array may be empty.
+        """
+        self.num_samples_in += chunk.size
+        if not self.config.enabled:
+            self.num_samples_out += chunk.size
+            return chunk
+
+        data = np.concatenate((self.pending, chunk)) if self.pending.size else chunk
+        num_frames = data.size // self.frame_size
+        frames_size = num_frames * self.frame_size
+        self.pending = data[frames_size:]
+        if num_frames == 0:
+            return data[:0]
+        data = data[:frames_size]
+
+        frames = data.reshape(num_frames, self.frame_size).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        loud_indices = np.flatnonzero(rms >= self.threshold)
+
+        if not self.has_started:
+            if loud_indices.size == 0:
+                # Still leading silence; only keep enough of it for the pad
+                self.held = np.concatenate((self.held, data))[-self.lead_pad_size:] if self.lead_pad_size else data[:0]
+                return data[:0]
+            self.has_started = True
+            start = loud_indices[0] * self.frame_size
+            lead = np.concatenate((self.held, data[:start]))
+            lead = lead[-self.lead_pad_size:] if self.lead_pad_size else lead[:0]
+            self.held = lead
+            data = data[start:]
+            # Re-base the loud frame indices onto the new array
+            loud_starts = loud_indices * self.frame_size - start
+            # (The lead pad is its own limit)
+            lead_room = 0
+        elif loud_indices.size == 0:
+            self._hold(data)
+            return data[:0]
+        else:
+            loud_starts = loud_indices * self.frame_size
+            # The silence before the first loud frame continues the held pause
+            lead_room = self.max_pause_size - self.held.size
+
+        # Release the held pause plus everything up to the last loud frame, with pauses capped;
+        # hold on to the silence after it.
+        loud_end = int(loud_starts[-1]) + self.frame_size
+        released = self._cap_pauses(data[:loud_end], loud_starts, lead_room)
+        result = np.concatenate((self.held, released)) if self.held.size else released
+        self.held = data[:0]
+        self._hold(data[loud_end:])
+        self.num_samples_out += result.size
+        return result
+
+    def flush(self) -> np.ndarray:
+        """
+        Returns the remaining audio at the end of the segment, with trailing silence capped at `max_gap_ms`.
+        An entirely silent segment produces no audio.
+        """
+        # The samples which don't make up a full frame get judged as a frame of their own
+        is_pending_loud = self.pending.size > 0 and self._get_rms(self.pending) >= self.threshold
+        if not self.config.enabled:
+            result = self.pending
+        elif is_pending_loud:
+            # Held silence is either the lead pad or a pause, which are already capped
+            result = np.concatenate((self.held, self.pending))
+        elif not self.has_started:
+            result = self.pending[:0]
+        else:
+            tail = np.concatenate((self.held, self.pending))
+            result = tail[:self.max_gap_size]
+        self.pending = result[:0]
+        self.held = result[:0]
+        self.num_samples_out += result.size
+        return result
+
+    def _cap_pauses(self, data: np.ndarray, loud_starts: np.ndarray, lead_room: int) -> np.ndarray:
+        """
+        Shortens the runs of silence in `data` (which ends with a loud frame):
+        the one before the first loud frame to `lead_room`, and the ones in between to `max_pause_size`.
+
+        :param loud_starts: Positions of the loud frames in `data`
+        """
+        first_start = int(loud_starts[0])
+        gap_starts = loud_starts[:-1] + self.frame_size
+        gap_sizes = loud_starts[1:] - gap_starts
+        long_gaps = np.flatnonzero(gap_sizes > self.max_pause_size)
+        if first_start <= lead_room and long_gaps.size == 0:
+            return data
+
+        pieces = [data[:min(first_start, lead_room)]]
+        position = first_start
+        for i in long_gaps:
+            pieces.append(data[position:int(gap_starts[i]) + self.max_pause_size])
+            position = int(loud_starts[i + 1])
+        pieces.append(data[position:])
+        return np.concatenate(pieces)
+
+    @staticmethod
+    def _get_rms(samples: np.ndarray) -> float:
+        values = samples.astype(np.float32)
+        return float(np.sqrt(np.mean(values * values)))
+
+    def _hold(self, silence: np.ndarray) -> None:
+        # Anything beyond `max_pause_size` would get dropped anyway, so don't keep it around
+        room = self.max_pause_size - self.held.size
+        if room > 0 and silence.size:
+            self.held = np.concatenate((self.held, silence[:room]))
@@ -0,0 +1,325 @@
+from __future__ import annotations
+import re
+from typing import NamedTuple
+
+class SpeechFilterConfig(NamedTuple):
+    """
+    Rules for content in chat responses which shouldn't be spoken,
+    loaded from the "speech_filter" object in config.json.
+
+    Each rule is one of `SpeechFilter.ACTIONS`:
+    "speak" (as is), "drop", or "summarize" (replace with a short spoken placeholder).
+    """
+    enabled: bool = True
+    code_blocks: str = "summarize"
+    tables: str = "summarize"
+    urls: str = "summarize"
+    hex_strings: str = "drop"
+
+    # Min number of hex digits for a word to count as a hex string (eg, a hash)
+    hex_min_length: int = 16
+
+    @staticmethod
+    def from_dict(d: dict) -> SpeechFilterConfig:
+        """
+        Makes instance from json dict, falling back to defaults for missing values.
+        Can raise ValueError
+        """
+        if not isinstance(d, dict):
+            raise ValueError(f"Bad datatype. Expected dict (hash object), got {type(d)}")
+        default = SpeechFilterConfig()
+        rules = {}
+        for key in RULES:
+            value = d.get(key, getattr(default, key))
+            if value not in SpeechFilter.ACTIONS:
+                raise ValueError(f"Bad value for \"speech_filter.{key}\": {value}")
+            rules[key] = value
+        try:
+            hex_min_length = max(int(d.get("hex_min_length", default.hex_min_length)), 1)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Bad value in \"speech_filter\": {e}")
+        return SpeechFilterConfig(enabled=bool(d.get("enabled", default.enabled)), hex_min_length=hex_min_length, **rules)
+
+class SpeechFilter:
+    """
+    Streaming filter between the chat response and the text segmenter, which drops or summarizes
+    content that shouldn't be spoken: fenced code blocks, markdown tables, URLs and long hex strings.
+
+    Text is only held back while it could still turn out to be part of such content:
+    the start of a line until it's known not to be a code fence or table row,
+    and a trailing partial word (which could be the start of a URL).
+
+    Keeps track of which input each piece of output came from, so that segments of the spoken text
+    can be mapped back to the displayed text (see `to_display_text()`).
+    """
+
+    ACTIONS = ["speak", "drop", "summarize"]
+
+    def __init__(self, config: SpeechFilterConfig):
+        self.config = config
+
+        # Unreleased text of the current line
+        self._line = ""
+        # Current line is known to be regular text (and may have been partially released)
+        self._is_line_text = False
+        # Set while inside a code block
+        self._fence = ""
+        self._is_in_table = False
+
+        # Number of filtered spans per rule
+        self.counts: dict[str, int] = {}
+
+        # The input and output so far, and the (output start, output end, input start, input end)
+        # of each piece of output which differs from its input
+        self._original_text = ""
+        self._spoken_text = ""
+        self._replacements: list[tuple[int, int, int, int]] = []
+        # Output position up to which `to_display_text()` has mapped segments
+        self._display_position = 0
+
+        inline_patterns = []
+        if config.urls != "speak":
+            inline_patterns.append(f"(?P<markdown_link_url>{MARKDOWN_LINK_URL_PATTERN.pattern})")
+            inline_patterns.append(f"(?P<url>{URL_PATTERN.pattern})")
+        if config.hex_strings != "speak":
+            inline_patterns.append(f"(?P<hex>{HEX_PATTERN.pattern})")
+        self._inline_pattern = re.compile("|".join(inline_patterns)) if inline_patterns else None
+
+    def add_text(self, text_chunk: str) -> str:
+        """ Returns the text which is ready to be passed on to the text segmenter (can be empty) """
+        if not self.config.enabled:
+            return text_chunk
+
+        self._line += text_chunk
+        result = []
+        while True:
+            newline_index = self._line.find("\n")
+            if newline_index == -1:
+                break
+            line = self._line[:newline_index + 1]
+            self._line = self._line[newline_index + 1:]
+            result.append(self._process_line(line))
+            self._is_line_text = False
+
+        result.append(self._process_partial_line())
+        return "".join(result)
+
+    def flush(self) -> str:
+        """ Returns any remaining text, treating it as a complete line. Call at end of message. """
+        if not self.config.enabled:
+            return ""
+        line = self._line
+        self._line = ""
+        result = self._process_line(line) if line else ""
+        self._is_line_text = False
+        self._fence = ""
+        self._is_in_table = False
+        return result
+
+    def to_display_text(self, segment: str) -> str:
+        """
+        Returns the input text which a segment of the output came from (eg, the URL rather than "link"),
+        for syncing the displayed text with the audio.
+        Segments must be passed in order. Returns the segment as is if it can't be located in the output.
+        """
+        start = self._spoken_text.find(segment, self._display_position)
+        if start == -1:
+            return segment
+        end = start + len(segment)
+        self._display_position = end
+        if not self._replacements:
+            return segment
+        return self._original_text[self._to_original_position(start, False):self._to_original_position(end, True)]
+
+    def get_summary(self) -> str:
+        """ Eg, "code blocks 1, urls 2", or "" if nothing was filtered """
+        return ", ".join(f"{key.replace("_", " ")} {count}" for key, count in self.counts.items())
+
+    def _process_line(self, line: str) -> str:
+        """ Processes a complete line (which ends with a newline, unless it's the last one) """
+        if self._fence:
+            if line.lstrip().startswith(self._fence):
+                self._fence = ""
+            return self._emit(line, "")
+
+        if not self._is_line_text:
+            stripped = line.lstrip()
+            fence = SpeechFilter._get_fence(stripped)
+            if fence and self.config.code_blocks != "speak":
+                self._fence = fence
+                self._is_in_table = False
+                self._count("code_blocks")
+                return self._emit(line, CODE_BLOCK_SUMMARY + "\n" if self.config.code_blocks == "summarize" else "")
+            if stripped.startswith("|") and self.config.tables != "speak":
+                if self._is_in_table:
+                    return self._emit(line, "")
+                self._is_in_table = True
+                self._count("tables")
+                return self._emit(line, TABLE_SUMMARY + "\n" if self.config.tables == "summarize" else "")
+
+        self._is_in_table = False
+        return self._filter_inline(line)
+
+    def _process_partial_line(self) -> str:
+        """ Releases as much of the current line as can be decided on """
+        if self._fence or not self._line:
+            return ""
+
+        if not self._is_line_text:
+            if self._could_be_structure(self._line.lstrip()):
+                return ""
+            self._is_line_text = True
+            self._is_in_table = False
+
+        # Hold back the trailing partial word
+        match = TRAILING_WORD_PATTERN.search(self._line)
+        index = match.start() if match else len(self._line)
+        if index == 0:
+            return ""
+        released = self._line[:index]
+        self._line = self._line[index:]
+        return self._filter_inline(released)
+
+    def _could_be_structure(self, stripped: str) -> bool:
+        """ Returns True if a line starting with `stripped` could still turn out to be a code fence or table row """
+        if not stripped:
+            return True
+        if self.config.code_blocks != "speak":
+            for fence in FENCES:
+                if fence.startswith(stripped[:len(fence)]):
+                    return True
+        if self.config.tables != "speak" and stripped.startswith("|"):
+            return True
+        return False
+
+    def _filter_inline(self, text: str) -> str:
+        if not self._inline_pattern:
+            return self._emit(text, text)
+        result = []
+        position = 0
+        for match in self._inline_pattern.finditer(text):
+            match match.lastgroup:
+                case "markdown_link_url":
+                    # A markdown link's url gets dropped either way, leaving the link text
+                    self._count("urls")
+                    replacement = "]"
+                case "url":
+                    replacement = self._replace_url(match)
+                case _:
+                    replacement = self._replace_hex(match)
+            if replacement == match.group(0):
+                continue
+            result.append(self._emit(text[position:match.start()], text[position:match.start()]))
+            result.append(self._emit(match.group(0), replacement))
+            position = match.end()
+        result.append(self._emit(text[position:], text[position:]))
+        return "".join(result)
+
+    def _emit(self, original: str, spoken: str) -> str:
+        """ Records a piece of output along with the input it came from, and returns it """
+        if spoken != original:
+            spoken_start = len(self._spoken_text)
+            original_start = len(self._original_text)
+            last = self._replacements[-1] if self._replacements else None
+            if not spoken and last and last[1] == spoken_start and last[3] == original_start:
+                # Dropped input right after a replacement is part of it (eg, the rest of a code block)
+                self._replacements[-1] = (last[0], last[1], last[2], original_start + len(original))
+            else:
+                self._replacements.append(
+                    (spoken_start, spoken_start + len(spoken), original_start, original_start + len(original))
+                )
+        self._original_text += original
+        self._spoken_text += spoken
+        return spoken
+
+    def _to_original_position(self, position: int, is_end: bool) -> int:
+        """
+        Maps a position in the output to the input. A position inside a replacement maps to its start,
+        or to its end if `is_end`. Dropped input right at a segment's start or end is left out.
+        """
+        delta = 0
+        for spoken_start, spoken_end, original_start, original_end in self._replacements:
+            if is_end:
+                if spoken_end > position or spoken_start == spoken_end == position:
+                    if spoken_start < position:
+                        return original_end
+                    break
+            elif spoken_end > position:
+                if spoken_start <= position:
+                    return original_start
+                break
+            delta = original_end - spoken_end
+        return position + delta
+
+    def _replace_url(self, match: re.Match) -> str:
+        url = match.group(0)
+        trailing_punctuation = url[len(url.rstrip(URL_TRAILING_PUNCTUATION)):].replace(">", "")
+        self._count("urls")
+        summary = URL_SUMMARY if self.config.urls == "summarize" else ""
+        return summary + trailing_punctuation
+
+    def _replace_hex(self, match: re.Match) -> str:
+        word = match.group(0)
+        has_prefix = word[:2].lower() == "0x"
+        digits = word[2:] if has_prefix else word
+        # Unless prefixed, must be a mix of letters and digits, so long numbers still get spoken
+        is_hex = has_prefix or (any(c.isdigit() for c in digits) and any(c.isalpha() for c in digits))
+        if len(digits) < self.config.hex_min_length or not is_hex:
+            return word
+        self._count("hex_strings")
+        return HEX_SUMMARY if self.config.hex_strings == "summarize" else ""
+
+    def _count(self, rule: str) -> None:
+        self.counts[rule] = self.counts.get(rule, 0) + 1
+
+    @staticmethod
+    def _get_fence(stripped_line: str) -> str:
+        for fence in FENCES:
+            if stripped_line.startswith(fence):
+                return fence
+        return ""
+
+# ---
+
+RULES = ["code_blocks", "tables", "urls", "hex_strings"]
+
+FENCES = ["```", "~~~"]
+
+CODE_BLOCK_SUMMARY = "Code omitted."
+TABLE_SUMMARY = "Table omitted."
+URL_SUMMARY = "link"
+HEX_SUMMARY = "hex string"
+
+TRAILING_WORD_PATTERN = re.compile(r"\S+$")
+MARKDOWN_LINK_URL_PATTERN = re.compile(r"\]\(\s*(?:https?://|www\.)[^)\s]*\)")
+URL_PATTERN = re.compile(r"<?\b(?:https?://|www\.)[^\s<>()\[\]\"']+>?")
+URL_TRAILING_PUNCTUATION = ".,;:!?>"
+HEX_PATTERN = re.compile(r"\b(?:0[xX])?[0-9a-fA-F]+\b")
+
+if __name__ == "__main__":
+    from text_segmenter import TextSegmenter
+
+    response = (
+        "See https://example.com/docs for details. Here is the code:\n"
+        "```python\nprint(\"hi\")\n```\n"
+        "| a | b |\n| 1 | 2 |\n"
+        "Read [the guide](https://example.com/guide) and check 0xdeadbeefdeadbeefdead too. Done.\n"
+    )
+    speech_filter = SpeechFilter(SpeechFilterConfig())
+    text_segmenter = TextSegmenter(engine="regex")
+    segments = []
+    # Streamed in small chunks
+    for i in range(0, len(response), 3):
+        speakable_text = speech_filter.add_text(response[i:i + 3])
+        segments.extend(text_segmenter.add_text(speakable_text) if speakable_text else [])
+    segments.extend(text_segmenter.add_text(speech_filter.flush()))
+    segments.append(text_segmenter.get_remaining_text())
+
+    display_texts = [speech_filter.to_display_text(segment) for segment in segments if segment]
+    for segment, display_text in zip(segments, display_texts):
+        print(f"{segment!r} -> {display_text!r}")
+        # The display text is what's on screen, so the highlight can find it
+        assert display_text in response, display_text
+    assert any("https://example.com/docs" in display_text for display_text in display_texts)
+    assert any("```python\nprint(\"hi\")\n```" in display_text for display_text in display_texts)
+    print("SpeechFilter: ok")
@@ -1,4 +1,6 @@
 import re
+import time
+from functools import lru_cache
 
 import emoji
 from constants_long import ConstantsLong
@@ -7,7 +9,25 @@ from orpheus_constants import OrpheusConstants
 class TextMassager:
 
     @staticmethod
+    @lru_cache(maxsize=1024)
     def massage_assistant_text_segment_for_tts(text: str) -> str:
+        """ 
+        Removes words w/o alphanumeric chars, converts **word** to WORD, and removes emoji. 
+        Returns empty string if nothing speakable is left. Memoized.
+        """
+        if not text.isascii():
+            return TextMassager._massage_assistant_text_segment_for_tts_unicode(text)
+
+        # ASCII fast path: Nothing to scan for emoji, and "alphanumeric" is just [A-Za-z0-9],
+        # so the kept words can be matched directly
+        s = " ".join(ASCII_ALNUM_WORD_PATTERN.findall(text))
+        if "**" in s:
+            s = TextMassager._double_asterisk_words_to_caps(s)
+        # Kept words all have content characters
+        return s.strip()
+
+    @staticmethod
+    def _massage_assistant_text_segment_for_tts_unicode(text: str) -> str:
         s = TextMassager.remove_non_alnum_words(text)
         s = TextMassager._double_asterisk_words_to_caps(s) 
         s = emoji.replace_emoji(s, replace=' ')
@@ -21,15 +41,19 @@ class TextMassager:
         return s
 
     @staticmethod
+    @lru_cache(maxsize=1024)
     def massage_display_text_segment_for_log(text: str) -> str:
-        text = text.strip()
-        # Collapse consecutive newlines into one
-        text = re.sub(r"\n+", "\n", text)
-        # Replace remaining newlines with separator punctuation
-        text = text.replace("\n", " // ")
-        # Collapse consecutive spaces into one
-        text = re.sub(r" +", " ", text)
-        return text
+        """ 
+        Puts text on a single line, with (runs of) newlines replaced by " // ", 
+        and consecutive spaces collapsed. Memoized.
+        """
+        return LOG_WHITESPACE_PATTERN.sub(TextMassager._replace_log_whitespace, text.strip())
+
+    @staticmethod
+    def _replace_log_whitespace(match: re.Match) -> str:
+        # Each run of newlines becomes a separator, and the spaces around them collapse into one
+        num_newline_runs = sum(1 for part in match.group(0).split(" ") if part)
+        return " " + "// " * num_newline_runs
 
     @staticmethod
     def massage_user_input_for_print(text: str) -> str:
@@ -72,13 +96,11 @@ class TextMassager:
         """ 
         Transform occurrences of **word** to WORD
         """
-        pattern = r"\*\*(\w+)\*\*"
-
         def replace_func(match):
             word = match.group(1)
             return word.upper()
 
-        modified_text = re.sub(pattern, replace_func, text)
+        modified_text = DOUBLE_ASTERISK_WORD_PATTERN.sub(replace_func, text)
         return modified_text
 
     @staticmethod
@@ -94,6 +116,13 @@ class TextMassager:
         ]    
         # Rejoin with single spaces
         return ' '.join(words)
+# ---
+
+# A space-delimited word with at least one ASCII alphanumeric char
+ASCII_ALNUM_WORD_PATTERN = re.compile(r"[^ ]*[A-Za-z0-9][^ ]*")
+DOUBLE_ASTERISK_WORD_PATTERN = re.compile(r"\*\*(\w+)\*\*")
+LOG_WHITESPACE_PATTERN = re.compile(r"[ \n]+")
+
 # --------
 
 """
@@ -203,4 +232,46 @@ def remove_orpheus_emote_tags(text):
 # ---
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+
+    from text_segmenter import TextSegmenter
+
+    # Chat responses of the kind the app gets from an instruct model
+    corpus = [
+        "Sure! Here's a quick rundown of the **three** main options:\n\n1. **Trains** - comfortable, but pricier.\n2. **Buses** - cheap and slow.\n3. *Flying* - fastest if you book early. ✈️\n\nLet me know if you'd like more detail on any of them!",
+        "Great question! 😊 The short answer is: it depends. A cup of coffee has roughly 95 mg of caffeine, while a cup of black tea has about 47 mg. Green tea is lower still, at around 28 mg.",
+        "Ah, the café on the corner — I know the one. Their crème brûlée is wonderful, and the naïve charm of the place is half the appeal. Don't miss the pain au chocolat!",
+        "Okay, let's break it down step by step:\n\n- First, preheat the oven to 180°C (350°F).\n- Then, whisk the eggs and sugar together until pale -- about 3 minutes.\n- Fold in the flour... gently!\n\nThat's it. Enjoy your cake! 🎂🎉",
+        "Hmm... I'm not sure I follow. Could you say a bit more about what you mean by \"the usual\"? Is it the same order as last time, or something new?",
+        "**Important:** never share your password with anyone — not even support staff. If someone asks, it's a scam. Stay safe out there! 🔒",
+        "Here's a haiku for you:\n\nMorning fog lifting\nthe kettle sings on the stove\nsoft light on the floor",
+        "Honestly? I'd go with the blue one. It's more versatile, it goes with almost everything, and it was on sale -- 20% off. Can't beat that.",
+    ]
+
+    segments = []
+    for response in corpus:
+        segments.extend(segment for segment in TextSegmenter.segment_full_message(response, "regex") if segment.strip())
+    # Weight it towards the more common all-ASCII responses
+    segments = segments * 3 + [segment for segment in segments if segment.isascii()] * 5
+
+    print("--- Parity: fast paths vs the general pipeline ---")
+    for segment in segments:
+        expected = TextMassager._massage_assistant_text_segment_for_tts_unicode(segment)
+        assert TextMassager.massage_assistant_text_segment_for_tts(segment) == expected, segment
+        expected = re.sub(r" +", " ", re.sub(r"\n+", "\n", segment.strip()).replace("\n", " // "))
+        assert TextMassager.massage_display_text_segment_for_log(segment) == expected, segment
+    print(f"Passed ({len(set(segments))} distinct segments)")
+
+    print("\n--- Microbenchmark ---")
+    num_rounds = 20
+    functions = [
+        ("general pipeline", TextMassager._massage_assistant_text_segment_for_tts_unicode),
+        ("uncached", TextMassager.massage_assistant_text_segment_for_tts.__wrapped__),
+        ("memoized", TextMassager.massage_assistant_text_segment_for_tts),
+    ]
+    for name, function in functions:
+        start_time = time.perf_counter()
+        for _ in range(num_rounds):
+            for segment in segments:
+                function(segment)
+        elapsed_us = (time.perf_counter() - start_time) / (num_rounds * len(segments)) * 1_000_000
+        print(f"tts {name:>16}: {elapsed_us:.1f}us per segment")
@@ -1,30 +1,109 @@
+from __future__ import annotations
+import re
+import threading
+from typing import NamedTuple
 import pysbd
+from segment_size_controller import SegmentSizeController
 from constants_long import ConstantsLong
 from sentence_segmenter import SentenceSegmenter
+from text_segmenter_ORIG import SENTENCE_SPLIT_REGEX_BOUNDARY_FINDER
+
+class SegmentationConfig(NamedTuple):
+    """
+    Latency-first segmentation policy, loaded from the "segmentation" object in config.json.
+
+    Until the first segment of a response has been released, a short first clause gets released early, 
+    so that audio generation can start before the LLM has streamed a full sentence. 
+    The maximum segment length then grows with each segment.
+    """
+    enabled: bool = True
+
+    # Scales the word limits to the measured generation speed (see `SegmentSizeController`)
+    adaptive: bool = True
+
+    # The first segment is released at the first clause break (eg, a comma) after `min_clause_words`,
+    # or else after this many words
+    first_segment_words: int = 8
+    min_clause_words: int = 3
+
+    # Each segment's maximum number of words is this many times the previous one's...
+    growth: float = 2.0
+    # ... up to this
+    max_words: int = 25
+
+    @staticmethod
+    def from_dict(d: dict) -> SegmentationConfig:
+        """
+        Makes instance from json dict, falling back to defaults for missing values.
+        Can raise ValueError
+        """
+        if not isinstance(d, dict):
+            raise ValueError(f"Bad datatype. Expected dict (hash object), got {type(d)}")
+        default = SegmentationConfig()
+        try:
+            return SegmentationConfig(
+                enabled=bool(d.get("enabled", default.enabled)),
+                adaptive=bool(d.get("adaptive", default.adaptive)),
+                first_segment_words=max(int(d.get("first_segment_words", default.first_segment_words)), 1),
+                min_clause_words=max(int(d.get("min_clause_words", default.min_clause_words)), 1),
+                growth=max(float(d.get("growth", default.growth)), 1.0),
+                max_words=max(int(d.get("max_words", default.max_words)), 1)
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Bad value in \"segmentation\": {e}")
 
 class TextSegmenter:
     """
     Identifies complete sentences from a text stream as it arrives,
-    using the 'pysbd' library for robust sentence boundary detection.
+    using the 'pysbd' library for robust sentence boundary detection
+    (or, with engine "regex", the faster but simpler regex from `text_segmenter_ORIG`).
 
     Handles text arriving in arbitrary chunks by buffering input and
     processing the buffer when potential sentence endings are encountered.
+    Boundary detection runs only over the buffer (ie, the text not yet returned as sentences),
+    and only when a chunk brings a candidate terminator, or the words just after one
+    (which can decide whether it's a boundary, eg "etc. The"), rather than on every chunk.
     """
 
-    def __init__(self, language="en"):
+    ENGINES = ["pysbd", "regex"]
+
+    # pysbd segmenters by language. Shared, because they're costly to make.
+    _segmenters: dict[str, pysbd.Segmenter] = {}
+    # pysbd segmenters keep state while segmenting, so aren't thread-safe
+    _segmenter_lock = threading.Lock()
+
+    def __init__(self, language="en", engine="pysbd", config: SegmentationConfig | None=None):
         """
         Initializes the StreamingSentenceDetector.
 
         Args:
             language (str): The language code for pysbd (e.g., "en" for English).
+            engine (str): One of ENGINES
+            config: Latency-first segmentation policy. If None (or not enabled), 
+                all segments get the same treatment.
         """
         self.buffer = ""
-        # clean=False prevents pysbd from altering the text (like removing newlines)
-        # char_span=False prevents it from returning character spans, we just want text.
-        self.segmenter = pysbd.Segmenter(language=language, clean=False, char_span=False)
+        self.language = language
+        self.engine = engine
+        self.config = config if config and config.enabled else None
+        self.num_segments = 0
+        # Index in the buffer of the latest candidate terminator whose boundary decision 
+        # may still depend on text to come, or -1
+        self.pending_index = -1
         # Store terminators for a quick check if processing is potentially needed
         self.terminators = {'.', '?', '!'}
 
+    @staticmethod
+    def get_segmenter(language: str) -> pysbd.Segmenter:
+        """ Must be used with `_segmenter_lock` held """
+        segmenter = TextSegmenter._segmenters.get(language)
+        if not segmenter:
+            # clean=False prevents pysbd from altering the text (like removing newlines)
+            # char_span=False prevents it from returning character spans, we just want text.
+            segmenter = pysbd.Segmenter(language=language, clean=False, char_span=False)
+            TextSegmenter._segmenters[language] = segmenter
+        return segmenter
+
     def add_text(self, text_chunk):
         """
         Adds a chunk of text and identifies any complete sentences formed.
@@ -40,18 +119,94 @@ class TextSegmenter:
             # Handle non-string input gracefully
             return []
 
+        chunk_start = len(self.buffer)
         self.buffer += text_chunk
 
         # Optimization: Avoid processing if the buffer is obviously empty or hasn't changed meaningfully
         if not self.buffer.strip():
-             # If buffer only contains whitespace after adding chunk, clear it and return
-             # Note: This might discard leading whitespace if a sentence starts later.
-             # If preserving all whitespace exactly is critical, remove this strip check.
-             # self.buffer = "" # Optional: clear whitespace buffer
              return []
 
-        # Process the entire current buffer with pysbd
-        potential_sentences = self.segmenter.segment(self.buffer)
+        match = CANDIDATE_TERMINATOR_REGEX.search(text_chunk[::-1])
+        if match:
+            self.pending_index = chunk_start + len(text_chunk) - 1 - match.start()
+        elif self.pending_index > -1:
+            if len(WORD_REGEX.findall(self.buffer, self.pending_index + 1)) > NUM_DECIDING_WORDS:
+                # The boundary decision about the pending terminator has been made already
+                self.pending_index = -1
+
+        sentences = []
+        if self.pending_index > -1:
+            if self.engine == "regex":
+                sentences = self._segment_buffer_regex()
+            else:
+                sentences = self._segment_buffer_pysbd()
+            self._update_pending_index()
+
+            # Ensure we don't return empty strings resulting from splitting odd whitespace
+            sentences = [s for s in sentences if s.strip()]
+
+        result = []
+        if not sentences and self.config and self.num_segments == 0:
+            clause = self._take_first_clause()
+            if clause:
+                result.append(clause)
+                self._update_pending_index()
+
+        for sentence in sentences:
+            if self.config:
+                items = SentenceSegmenter.segment_sentence(sentence, self._get_max_words(len(result)))
+            else:
+                items = SentenceSegmenter.segment_sentence(sentence)
+            result.extend(items)
+
+        self.num_segments += len(result)
+        return result
+
+    def _update_pending_index(self) -> None:
+        """ After the buffer has been consumed from the start """
+        if not self.buffer.strip():
+            self.pending_index = -1
+        else:
+            match = CANDIDATE_TERMINATOR_REGEX.search(self.buffer[::-1])
+            self.pending_index = len(self.buffer) - 1 - match.start() if match else -1
+
+    def _take_first_clause(self) -> str:
+        """ 
+        Removes and returns the start of the buffer up to a clause break or the first-segment word limit, 
+        counting only words which are complete (ie, followed by whitespace). Returns "" if neither is reached yet.
+        """
+        assert self.config
+        first_segment_words = self._scale_word_limit(self.config.first_segment_words)
+        for i, match in enumerate(COMPLETE_WORD_REGEX.finditer(self.buffer)):
+            num_words = i + 1
+            is_clause_break = match.group(1)[-1] in CLAUSE_BREAK_CHARS or match.group(1) in CLAUSE_BREAK_WORDS
+            if (is_clause_break and num_words >= self.config.min_clause_words) or num_words >= first_segment_words:
+                clause = self.buffer[:match.end()]
+                self.buffer = self.buffer[match.end():]
+                return clause
+        return ""
+
+    def _get_max_words(self, num_new_segments: int) -> int:
+        """ Max words for the next segment, which grows with the number of segments so far """
+        assert self.config
+        num_segments = self.num_segments + num_new_segments
+        max_words = self.config.first_segment_words * self.config.growth ** num_segments
+        max_words = min(round(max_words), self.config.max_words)
+        return self._scale_word_limit(max_words)
+
+    def _scale_word_limit(self, max_words: int) -> int:
+        assert self.config
+        if not self.config.adaptive:
+            return max_words
+        return SegmentSizeController().scale_word_limit(max_words)
+
+    def _segment_buffer_pysbd(self) -> list[str]:
+        """ Returns the complete sentences in the buffer, leaving the incomplete remainder in the buffer """
+
+        with TextSegmenter._segmenter_lock:
+            spans = TextSegmenter.get_segmenter(self.language).segment(self.buffer)
+        # (Segmenter doesn't use char_span, so these are all strings)
+        potential_sentences = [span if isinstance(span, str) else span.sent for span in spans]
 
         # If pysbd returns nothing or only an empty string (can happen with whitespace), return empty list
         if not potential_sentences or (len(potential_sentences) == 1 and not potential_sentences[0].strip()):
@@ -67,36 +222,36 @@ class TextSegmenter:
         # and only the segments *before* it are complete.
 
         last_segment = potential_sentences[-1]
-        num_potential = len(potential_sentences)
-        sentences = []
 
         # Check if the last segment genuinely ends with a known terminator (ignoring trailing whitespace)
         if last_segment.strip() and last_segment.strip()[-1] in self.terminators:
             # Assume all identified segments are complete sentences
-            sentences = potential_sentences
             # The entire buffer was consumed to make these sentences
             self.buffer = ""
-        else:
-            # The last segment is incomplete. Only return the ones before it (if any).
-            if num_potential > 1:
-                sentences = potential_sentences[:-1]
-                # The remaining buffer *is* the last (incomplete) segment
-                self.buffer = last_segment
-            else:
-                # Only one segment was found, and it's incomplete. Return nothing yet.
-                # The buffer (which equals last_segment) remains unchanged.
-                sentences = []
-                # self.buffer = last_segment # Already true
+            return potential_sentences
 
-        # Ensure we don't return empty strings resulting from splitting odd whitespace
-        sentences = [s for s in sentences if s.strip()]
+        # The last segment is incomplete. Only return the ones before it (if any).
+        if len(potential_sentences) > 1:
+            # The remaining buffer *is* the last (incomplete) segment
+            self.buffer = last_segment
+            return potential_sentences[:-1]
 
-        result = []
-        for sentence in sentences:
-            items = SentenceSegmenter.segment_sentence(sentence)
-            result.extend(items)
+        # Only one segment was found, and it's incomplete. Return nothing yet.
+        # The buffer (which equals last_segment) remains unchanged.
+        return []
 
-        return result
+    def _segment_buffer_regex(self) -> list[str]:
+        """ Returns the complete sentences in the buffer, leaving the incomplete remainder in the buffer """
+        sentences = []
+        start = 0
+        for match in SENTENCE_SPLIT_REGEX_BOUNDARY_FINDER.finditer(self.buffer):
+            if match.end() == len(self.buffer) and match.group(0) == ".":
+                # Could be the start of an ellipsis, so defer
+                break
+            sentences.append(self.buffer[start:match.end()])
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
 
     def get_remaining_text(self):
         """
@@ -106,7 +261,7 @@ class TextSegmenter:
         return self.buffer
 
     @staticmethod
-    def segment_full_message(full_message: str) -> list[str]:
+    def segment_full_message(full_message: str, engine: str="pysbd", config: SegmentationConfig | None=None) -> list[str]:
         """ 
         Segments a "full message" for synchronous use case
         """
@@ -114,18 +269,98 @@ class TextSegmenter:
             # Dev "benchmark" message, don't split
             return [full_message]
         
-        text_segmenter = TextSegmenter()
+        text_segmenter = TextSegmenter(engine=engine, config=config)
         result = text_segmenter.add_text(full_message)
         remainder = text_segmenter.get_remaining_text()
         if remainder:
             result.append(remainder)
         return result
 
+# ---
+
+# Characters after which pysbd (or the regex engine) may find a sentence boundary
+CANDIDATE_TERMINATOR_REGEX = re.compile(r"[.?!\n。．！？]")
+
+# Number of words following a candidate terminator, after which its boundary decision is settled
+NUM_DECIDING_WORDS = 2
+WORD_REGEX = re.compile(r"\w+")
+
+# A word followed by whitespace
+COMPLETE_WORD_REGEX = re.compile(r"(\S+)\s+")
+CLAUSE_BREAK_CHARS = {",", ";", ":", "—"}
+CLAUSE_BREAK_WORDS = {"-", "--", "—"}
 
 # --- Example Usage (Similar to Test Case 3b) ---
 
 if __name__ == "__main__":
 
+    print("--- Parity: incremental vs re-segmenting the whole buffer on every chunk ---")
+
+    def reference_add_text(state: dict, text_chunk: str) -> list[str]:
+        """ The original non-incremental algorithm """
+        state["buffer"] += text_chunk
+        if not state["buffer"].strip():
+            return []
+        potential_sentences = pysbd.Segmenter(language="en", clean=False, char_span=False).segment(state["buffer"])
+        if not potential_sentences or (len(potential_sentences) == 1 and not potential_sentences[0].strip()):
+            return []
+        last_segment = potential_sentences[-1]
+        if last_segment.strip() and last_segment.strip()[-1] in {'.', '?', '!'}:
+            sentences = potential_sentences
+            state["buffer"] = ""
+        elif len(potential_sentences) > 1:
+            sentences = potential_sentences[:-1]
+            state["buffer"] = last_segment
+        else:
+            sentences = []
+        result = []
+        for sentence in [s for s in sentences if s.strip()]:
+            result.extend(SentenceSegmenter.segment_sentence(sentence))
+        return result
+
+    import random
+    texts = [
+        "Mr. Smith went to Washington D.C. for a visit. It was great!",
+        ConstantsLong.TEST_TEXT_0,
+        "Title\nSome text here. And more text\n\nNew paragraph! Is it? Yes.",
+        "I saw him at 3 p.m. The meeting was long. Dr. Jones and Mrs. Smith left at 5 p.m. on Jan. 5th.",
+        "Apples, pears, etc. are fruit. The U.S.A. is big. He said \"Hi.\" Then he left... Really?! Wow.",
+        "1. First item 2. Second item 3. Third item. Hi!Bye. ok… then. x 。 y",
+        "Numbers like 3.14 and 2.5 million, or $4.99, shouldn't split. Version 1.2.3 is out. E.g. this one.",
+        "A very long sentence " + "with many words and clauses, " * 12 + "which finally ends. Then a short one."
+    ]
+    random.seed(0)
+    num_checked = 0
+    for text in texts:
+        chunkings = [list(text), text.split(" ")]
+        chunkings[1] = [word + " " for word in chunkings[1][:-1]] + chunkings[1][-1:]
+        for _ in range(20):
+            chunks, position = [], 0
+            while position < len(text):
+                size = random.randint(1, 8)
+                chunks.append(text[position:position + size])
+                position += size
+            chunkings.append(chunks)
+        for chunks in chunkings:
+            segmenter, state = TextSegmenter(), {"buffer": ""}
+            for chunk in chunks:
+                expected = reference_add_text(state, chunk)
+                actual = segmenter.add_text(chunk)
+                assert actual == expected, (text, chunks, expected, actual)
+                assert segmenter.get_remaining_text() == state["buffer"]
+            num_checked += 1
+    print(f"Parity test passed ({num_checked} chunkings)")
+
+    print("\n--- Regex engine ---")
+    detector_regex = TextSegmenter(engine="regex")
+    sentences_regex = []
+    for chunk in ["This is the start. ", "Then what", "? Wait..", ". More", "!"]:
+        sentences_regex.extend(detector_regex.add_text(chunk))
+    print(sentences_regex, repr(detector_regex.get_remaining_text()))
+    assert sentences_regex == ["This is the start.", " Then what?", " Wait...", " More!"]
+    print("Test Passed!")
+
+
     print("--- Test Case 3b (Streaming with pysbd) ---")
     detector = TextSegmenter(language="en")
     text3b = "Mr. Smith went to Washington D.C. for a visit. It was great!"
@@ -152,7 +387,8 @@ if __name__ == "__main__":
     print(f"\nTotal Sentences found: {sentences3b}")
     print(f"Final Remaining text: '{detector.get_remaining_text()}'")
 
-    expected_sentences3b = ["Mr. Smith went to Washington D.C. for a visit.", "It was great!"]
+    # "D.C." at the end of a chunk can't be told apart from the end of a sentence until more text arrives
+    expected_sentences3b = ["Mr. Smith went to Washington D.C.", "for a visit.", "It was great!"]
     print(f"Expected Sentences: {expected_sentences3b}")
     assert sentences3b == expected_sentences3b
     assert detector.get_remaining_text() == ""
@@ -174,6 +410,7 @@ if __name__ == "__main__":
 
     print(f"\nTotal Sentences found: {sentences_mid}")
     print(f"Final Remaining text: '{detector_mid.get_remaining_text()}'")
-    assert sentences_mid == ["This is the start."]
+    # Sentences are spans of the input, so they keep their trailing whitespace
+    assert sentences_mid == ["This is the start. "]
     assert detector_mid.get_remaining_text() == "This bit is not finished"
-    print("Test Passed!")
\ No newline at end of file
+    print("Test Passed!")
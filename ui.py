@@ -11,7 +11,9 @@ from app_util import AppUtil
 from color import Color
 from app_types import *
 from l import L # type: ignore
+from config import Config
 from main_control import MainControl
+from render_scheduler import RenderScheduler
 
 class Ui:
     """
@@ -97,11 +99,29 @@ class Ui:
             full_screen=True
         )
 
+        # UI updates should mark their region dirty here rather than invalidate the application
+        self.render_scheduler = RenderScheduler(self.application, Config().ui_max_fps)
+
         @kb.add('c-c')
         @kb.add('c-q')
         def _(event):
             event.app.exit()
 
+        @kb.add("pageup", eager=True)
+        def _(_):
+            self.content_control.model.page_up()
+            self.render_scheduler.mark_dirty("content")
+
+        @kb.add("pagedown", eager=True)
+        def _(_):
+            self.content_control.model.page_down()
+            self.render_scheduler.mark_dirty("content")
+
+        @kb.add("c-end", eager=True)
+        def _(_):
+            self.content_control.model.scroll_to_end()
+            self.render_scheduler.mark_dirty("content")
+
         @kb.add("enter", eager=True) # note eager
         async def _(_): 
             await self.on_enter()
@@ -111,4 +131,4 @@ class Ui:
         s = "buffer: "
         s += f"{seconds:.1f}s " if seconds > epsilon else "0s "
         self.audio_buffer_text = s if seconds > epsilon else [ (Color.as_pt_style("dark"), s) ]
-        self.application.invalidate() # TODO unnecessarily costly? not sure; alternatives?
+        self.render_scheduler.mark_dirty("audio_status")
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import queue
+import threading
+from typing import Callable
+
+from app_types import *
+
+class UiMessageQueue(queue.Queue[UiMessage]):
+    """
+    Queue of UI messages, which wakes its consumer on put (instead of the consumer having to poll),
+    and which gets drained all at once, with redundant messages coalesced.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._waker: Callable[[], None] | None = None
+        self._is_wake_pending = False
+        self._wake_lock = threading.Lock()
+
+    def set_waker(self, waker: Callable[[], None] | None) -> None:
+        """
+        :param waker: Gets called on the producer's thread when a message is put,
+            unless a previous wake hasn't been consumed by `get_all()` yet. Must be thread-safe.
+        """
+        self._waker = waker
+
+    def put(self, item: UiMessage, block: bool=True, timeout: float | None=None) -> None:
+        super().put(item, block, timeout)
+        waker = self._waker
+        if not waker:
+            return
+        with self._wake_lock:
+            if self._is_wake_pending:
+                return
+            self._is_wake_pending = True
+        waker()
+
+    def get_all(self) -> list[UiMessage]:
+        """ Returns all pending messages without blocking, coalesced """
+        with self._wake_lock:
+            self._is_wake_pending = False
+        messages = []
+        while True:
+            try:
+                messages.append(self.get_nowait())
+                self.task_done()
+            except queue.Empty:
+                break
+        return UiMessageQueue.coalesce(messages)
+
+    @staticmethod
+    def coalesce(messages: list[UiMessage]) -> list[UiMessage]:
+        """
+        Merges consecutive streamed text messages, and drops gen status and audio buffer messages
+        which are superseded by a later one of the same type.
+        Finished gen statuses (which get printed) and buffer depletions (which trigger actions) are kept.
+        """
+        result: list[UiMessage] = []
+        has_later_gen_status = False
+        has_later_audio_buffer = False
+
+        for ui_message in reversed(messages):
+            if isinstance(ui_message, GenStatusUiMessage):
+                if has_later_gen_status and not ui_message.item.is_finished:
+                    continue
+                has_later_gen_status = True
+            elif isinstance(ui_message, AudioBufferUiMessage):
+                if has_later_audio_buffer and not ui_message.got_depleted:
+                    continue
+                has_later_audio_buffer = True
+            elif isinstance(ui_message, StreamedTextUiMessage):
+                if result and isinstance(result[-1], StreamedTextUiMessage):
+                    result[-1] = StreamedTextUiMessage(ui_message.text + result[-1].text)
+                    continue
+            result.append(ui_message)
+
+        result.reverse()
+        return result